@@ -15,6 +15,13 @@ from db import get_db
 from routers.analytics import router as analytics_router
 from routers.anime import router as anime_router
 from helpers.anime_helper import get_animepahe_cookies
+from helpers.http_clients import init_http_clients, close_http_clients
+from helpers.cookie_manager import cookie_manager
+from helpers.browser_pool import browser_pool
+from helpers.bulk_jobs import bulk_job_engine
+from helpers.download_jobs import stop_download_jobs
+from helpers.janitor import storage_janitor
+from helpers.media_pool import media_pool
 import asyncio
 
 db_lock = asyncio.Lock()
@@ -40,6 +47,9 @@ async def lifespan(app: FastAPI):
     async with aiosqlite.connect("cache.db") as db:
         print("📦 Setting up SQLite database...")
         
+        # WAL lets background jobs write while requests read
+        await db.execute("PRAGMA journal_mode=WAL")
+        
         await db.execute("""
             CREATE TABLE IF NOT EXISTS videos (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -77,6 +87,17 @@ async def lifespan(app: FastAPI):
                 external_id TEXT NOT NULL UNIQUE
             )
         """)
+        
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS anime_episode_session (
+                external_id TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                episode TEXT,
+                session TEXT NOT NULL,
+                page INTEGER,
+                PRIMARY KEY (external_id, position)
+            )
+        """)
         await db.execute(
 """ 
             CREATE TABLE IF NOT EXISTS zip_cache (
@@ -109,15 +130,77 @@ async def lifespan(app: FastAPI):
             )
         """)
 
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS media_cache (
+                cache_key TEXT PRIMARY KEY,
+                short_code TEXT NOT NULL,
+                info TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            )
+        """)
+
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS bulk_jobs (
+                job_id TEXT PRIMARY KEY,
+                anime_id TEXT NOT NULL,
+                anime_title TEXT NOT NULL,
+                external_id TEXT NOT NULL,
+                quality TEXT NOT NULL,
+                ep_from INTEGER NOT NULL,
+                ep_to INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                session_id TEXT,
+                error TEXT,
+                created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+                updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS bulk_job_episodes (
+                job_id TEXT NOT NULL,
+                episode INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                link TEXT,
+                attempts INTEGER DEFAULT 0,
+                PRIMARY KEY (job_id, episode)
+            )
+        """)
+
         await db.commit()
         print("✅ SQLite cache ready!")
     
+    # 3. Upstream HTTP connection pools
+    await init_http_clients()
+    
+    # 4. Headless browser for cookie harvesting (launched lazily on first refresh)
+    await browser_pool.start()
+    
+    # 5. Animepahe cookies (served from memory, refreshed in the background)
+    await cookie_manager.start()
+    
+    # 6. Bulk resolution workers (resumes unfinished jobs)
+    await bulk_job_engine.start()
+    
+    # 7. Storage janitor (TTL, orphans and disk quota for generated files)
+    await storage_janitor.start()
+    
+    # 8. Warm yt-dlp worker processes for /dl/*
+    await media_pool.start()
+    
     print("🚀 Application started!")
     
     yield
     
     # SHUTDOWN
     print("🛑 Shutting down services...")
+    await storage_janitor.stop()
+    await bulk_job_engine.stop()
+    await stop_download_jobs()
+    await cookie_manager.stop()
+    await browser_pool.close()
+    await close_http_clients()
+    await media_pool.stop()
 
 
 # ---------------- CREATE APP WITH LIFESPAN ----------------
@@ -184,6 +267,16 @@ async def root(db=Depends(get_db)):
         ]
     }
 
+# ---------------- STORAGE METRICS ----------------
+@app.get(
+    "/storage",
+    tags=["Root"],
+    summary="Storage usage",
+    description="Disk usage per artifact type and what the storage janitor has reclaimed.",
+)
+async def storage_metrics():
+    return storage_janitor.metrics()
+
 # ---------------- RUNNING DIRECTLY ----------------
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,10 @@
 import aiosqlite
 from typing import AsyncGenerator
 
+DB_PATH = "cache.db"
+
 async def get_db() -> AsyncGenerator[aiosqlite.Connection, None]:
-    db = await aiosqlite.connect("cache.db")
+    db = await aiosqlite.connect(DB_PATH)
     db.row_factory = aiosqlite.Row  # optional: so results behave like dicts
 
     try:
@@ -1,116 +1,35 @@
 import json
+import uuid
 import asyncio
 import time
 import os
 import re
+import traceback
+import aiosqlite
 from bs4 import BeautifulSoup
 import httpx
-from playwright.async_api import async_playwright,TimeoutError
-from utils.helper import deobfuscate,extract_info
+from utils.helper import deobfuscate,extract_info,env_float
+from helpers.scheduler import fetch
+from helpers.cookie_manager import cookie_manager
+from db import DB_PATH
 
-async def cookies_expired(db):
-    """Check if __ddg2 cookie is expired"""
-    now = time.time()
-    
-    cursor = await db.execute(
-        "SELECT value, expires FROM cookies WHERE name = ?", 
-        ("__ddg2",)
-    )
-    row = await cursor.fetchone()
-    
-    if not row:
-        print(f"❌ __ddg2 cookie missing from database")
-        return True
-    
-    exp = row["expires"]
-    if not exp:
-        print(f"❌ __ddg2 has no expiry field")
-        return True
-    
-    is_expired = exp < now
-    return is_expired
-
-
-async def get_animepahe_cookies(db):
-    """Get cookies from SQLite database, refresh if expired"""
-    
-    # 1️⃣ Check if cached cookies exist and are still valid
-    cursor = await db.execute("SELECT COUNT(*) as count FROM cookies")
-    row = await cursor.fetchone()
-    
-    if row["count"] > 0:
-        if not await cookies_expired(db):
-            
-            # Fetch all cookies
-            cursor = await db.execute("SELECT name, value FROM cookies")
-            rows = await cursor.fetchall()
-            return {row["name"]: row["value"] for row in rows}
-        else:
-            print("⚠️ Cookies expired, fetching new ones...")
-    
-    # 2️⃣ Cookies expired or don't exist - use Playwright
-    try:
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=True)
-            context = await browser.new_context()
-            page = await context.new_page()
-            
-            # Go to Animepahe
-            await page.goto("https://animepahe.si")
-            
-            # Wait for main content to load
-            try:
-                await page.wait_for_load_state("domcontentloaded", timeout=10000)
-            except TimeoutError:
-                print("⚠️ Timeout waiting for DOMContentLoaded, continuing anyway...")
-            
-            # Small sleep to ensure cookies are set
-            await asyncio.sleep(1)
-            
-            cookies = await context.cookies()
-            await browser.close()
-            
-            # Clear old cookies and insert new ones
-            await db.execute("DELETE FROM cookies")
-            
-            for cookie in cookies:
-                await db.execute(
-                    "INSERT INTO cookies (name, value, expires) VALUES (?, ?, ?)",
-                    (cookie['name'], cookie['value'], cookie.get('expires'))
-                )
-            
-            await db.commit()
-            
-            print("✅ Used fresh cookies from animepahe server")
-            
-            # Return cookies as dict
-            return {c['name']: c['value'] for c in cookies}
-            
-    except Exception as e:
-        print(f"❌ Failed to get new cookies: {e}")
-        
-        # Fallback: return cached cookies even if expired (better than nothing)
-        cursor = await db.execute("SELECT name, value FROM cookies")
-        rows = await cursor.fetchall()
-        
-        if rows:
-            print("⚠️ Using expired cached cookies as fallback")
-            return {row["name"]: row["value"] for row in rows}
-        
-        return None  # No cookies available at all
+async def get_animepahe_cookies(db=None):
+    """Get animepahe cookies from the process-wide cookie manager (db kept for compatibility)"""
+    return await cookie_manager.get()
 
-async def get_actual_episode(external_id,db):
+async def get_actual_episode(external_id,db,client=None):
     try:
         if not external_id:
             return None
         cookies = await get_animepahe_cookies(db)
         
-        async with httpx.AsyncClient() as client:
-            res = await client.get(
-                f"https://animepahe.si/api?m=release&id={external_id}",
-                cookies=cookies,
-                timeout=30
-            )
+        res = await fetch(
+            "animepahe", "GET",
+            f"https://animepahe.si/api?m=release&id={external_id}",
+            client=client,
+            cookies=cookies,
+            timeout=30
+        )
         if res.status_code != 200:
             return None
         data = res.json()
@@ -150,6 +69,7 @@ async def get_cached_anime_info(id, db):
         
         # Update if episode count changed
         if int(episodes) != int(row["episodes"]):
+            invalidate_episode_index(external_id)
             await db.execute(
                 "UPDATE anime_info SET episodes = ? WHERE internal_id = ?",
                 (episodes, id)
@@ -166,60 +86,166 @@ async def get_cached_anime_info(id, db):
         traceback.print_exc()
         return {"status": 500, "message": f"Internal error: {str(e)}"}
 
-async def get_episode_session(id, db):
-    if not id:
-        return None
-    
-    cookies = await get_animepahe_cookies(db)
-    
-async def get_episode_session(id,db):
-    if not id:
+# ---------------- EPISODE CATALOG ----------------
+async def sync_episode_catalog(external_id, db, client=None):
+    """
+    Store every episode's session and number in SQLite by walking the
+    m=release API pages (oldest first).
+    Incremental: anime_episode.page_count remembers the last page seen, so
+    later syncs only refetch that page and anything after it.
+    Returns the number of catalogued episodes, or None on failure.
+    """
+    if not external_id:
         return None
+
+    cursor = await db.execute(
+        "SELECT page_count FROM anime_episode WHERE external_id = ?", (external_id,)
+    )
+    row = await cursor.fetchone()
+    page = row[0] if row and row[0] else 1
+
     cookies = await get_animepahe_cookies(db)
-    async with httpx.AsyncClient(cookies=cookies) as client:
-        res = await client.get(f"https://animepahe.si/api?m=release&id={id}")
+    last_page = page
+    total = None
+
+    while page <= last_page:
+        res = await fetch(
+            "animepahe", "GET",
+            f"https://animepahe.si/api?m=release&id={external_id}&sort=episode_asc&page={page}",
+            client=client,
+            cookies=cookies
+        )
+        if res.status_code != 200:
+            print(f"❌ Catalog page {page} for {external_id} returned {res.status_code}")
+            return None
         data = res.json()
-        if not data:
-            return {
-                "status":404,
-                "message":"Anime episodes not found"
-            }
-        episode_id = data.get("data")[0].get("session")
-        url = f"https://animepahe.si/play/{id}/{episode_id}"
-        res = await client.get(url,cookies=cookies)
-    episode_session = await asyncio.to_thread(_parse_episode_html,res.text)
-    return episode_session
-
-def _parse_episode_html(content):
-    soup = BeautifulSoup(content,"html.parser")
-    div = soup.find("div",id="scrollArea")
-    if not div:
-        return {
-            "status":404,
-            "message":"No scroll Area found"
-        }
-    
-    a_tags = div.find_all("a",class_="dropdown-item")
-    episode_session = []
-    for a_tag in a_tags:
-        episode_dict= {
-            "session":a_tag["href"].split("/")[3],
-            "episode":int(a_tag.text.split(" ")[1])
-        }
-        episode_session.append(episode_dict)
-    return episode_session
+        items = data.get("data") or []
+        last_page = data.get("last_page") or page
+        per_page = data.get("per_page") or len(items)
+        total = data.get("total", total)
+
+        # Position only orders the rows; lookups go by the real episode number,
+        # which doesn't always start at 1 or stay whole (12.5 recaps)
+        await db.executemany(
+            """INSERT OR REPLACE INTO anime_episode_session
+               (external_id, position, episode, session, page) VALUES (?, ?, ?, ?, ?)""",
+            [
+                (external_id, (page - 1) * per_page + idx, str(ep.get("episode")), ep.get("session"), page)
+                for idx, ep in enumerate(items, 1)
+            ]
+        )
+        page += 1
 
-async def get_pahewin_link(external_id, episode_id,db,quality):
+    await db.execute(
+        """INSERT INTO anime_episode (external_id, page_count, episode) VALUES (?, ?, ?)
+           ON CONFLICT(external_id) DO UPDATE SET
+               page_count = excluded.page_count,
+               episode = excluded.episode""",
+        (external_id, last_page, str(total) if total is not None else None)
+    )
+    await db.commit()
+
+    cursor = await db.execute(
+        "SELECT COUNT(*) FROM anime_episode_session WHERE external_id = ?", (external_id,)
+    )
+    row = await cursor.fetchone()
+    return row[0]
+
+
+# ---------------- EPISODE INDEX CACHE ----------------
+# external_id -> {"sessions": {episode_number: session}, "count": catalogued rows, "expires": timestamp}
+_episode_index_cache = {}
+# external_id -> in-flight build task (so concurrent callers share one scrape)
+_episode_index_builds = {}
+
+
+async def get_episode_index(external_id, db, total=None):
+    """
+    Map episode number (as numbered upstream) -> episode session.
+    Whole numbers are int keys; specials like 12.5 are float keys, so they
+    never shadow a regular episode. Built once per anime from the SQLite
+    catalog and shared by /download and /bulk-download. Rebuilt when the TTL
+    runs out or when `total` (the current episode count) no longer matches
+    the catalog.
+    """
+    if not external_id:
+        return None
+
+    entry = _episode_index_cache.get(external_id)
+    if entry and entry["expires"] > time.time():
+        if total is None or int(total) == entry["count"]:
+            return entry["sessions"]
+
+    task = _episode_index_builds.get(external_id)
+    if task is None:
+        task = asyncio.create_task(_build_episode_index(external_id, total))
+        _episode_index_builds[external_id] = task
+        task.add_done_callback(lambda _: _episode_index_builds.pop(external_id, None))
+    return await asyncio.shield(task)
+
+
+async def _build_episode_index(external_id, total=None):
+    # Own connection: the build is shared, so it must outlive any single request
+    async with aiosqlite.connect(DB_PATH) as db:
+        cursor = await db.execute(
+            "SELECT episode, session FROM anime_episode_session WHERE external_id = ? ORDER BY position",
+            (external_id,)
+        )
+        rows = await cursor.fetchall()
+
+        # Only touch upstream when the catalog is empty or behind the known count
+        if not rows or (total is not None and int(total) > len(rows)):
+            count = await sync_episode_catalog(external_id, db)
+            if count is None and not rows:
+                return None
+            cursor = await db.execute(
+                "SELECT episode, session FROM anime_episode_session WHERE external_id = ? ORDER BY position",
+                (external_id,)
+            )
+            rows = await cursor.fetchall()
+
+    sessions = {}
+    for episode, session in rows:
+        number = _episode_number(episode)
+        if number is not None:
+            sessions[number] = session
+    if not sessions:
+        return None
+    ttl = env_float("EPISODE_INDEX_TTL", 1800.0)
+    _episode_index_cache[external_id] = {"sessions": sessions, "count": len(rows), "expires": time.time() + ttl}
+    return sessions
+
+
+def _episode_number(value):
+    """'13' -> 13, '12.5' -> 12.5, anything else -> None"""
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None
+    return int(number) if number.is_integer() else number
+
+
+def episode_range(index):
+    """(first, last) whole episode numbers in an episode index"""
+    numbers = [number for number in index if isinstance(number, int)]
+    if not numbers:
+        return None, None
+    return min(numbers), max(numbers)
+
+
+def invalidate_episode_index(external_id):
+    _episode_index_cache.pop(external_id, None)
+
+
+async def get_pahewin_link(external_id, episode_id,db,quality,client=None):
     if not episode_id or not external_id:
         return None
     
     url = f"https://animepahe.si/play/{external_id}/{episode_id}"
     cookies = await get_animepahe_cookies(db)
     
-    # Use httpx for async HTTP request
-    async with httpx.AsyncClient() as client:
-        res = await client.get(url, cookies=cookies, timeout=10)
-        html = res.text
+    res = await fetch("animepahe", "GET", url, client=client, cookies=cookies, timeout=10)
+    html = res.text
     
     # Offload BeautifulSoup parsing to thread pool
     link = await asyncio.to_thread(_parse_pahewin_html, html, url,quality)
@@ -258,7 +284,7 @@ def _parse_pahewin_html(html, url, quality="720p"):
     
     return closest["link"]
 
-async def get_kiwi_url(pahe_url):
+async def get_kiwi_url(pahe_url,client=None):
     if not pahe_url:
         print("No pahe.win link")
         return None
@@ -269,10 +295,8 @@ async def get_kiwi_url(pahe_url):
         "Accept": "*/*"
     }
 
-    # Async HTTP request with httpx
-    async with httpx.AsyncClient() as client:
-        res = await client.get(pahe_url, timeout=30, headers=headers)
-        html = res.text
+    res = await fetch("pahe", "GET", pahe_url, client=client, timeout=30, headers=headers)
+    html = res.text
     
     # Offload BeautifulSoup parsing to thread pool
     return await asyncio.to_thread(_parse_kiwi_url, html)
@@ -287,7 +311,7 @@ def _parse_kiwi_url(html):
     m = re.search(r"https?://(?:www\.)?kwik\.cx[^\s\"');]+", info.text)
     return m.group(0) if m else None
 
-async def get_kiwi_info(kiwi_url):
+async def get_kiwi_info(kiwi_url,client=None):
     try:
         if not kiwi_url:
             return None
@@ -297,7 +321,6 @@ async def get_kiwi_info(kiwi_url):
             'Accept-Language': 'en-US,en;q=0.9',
             'Accept-Encoding': 'gzip, deflate',
             'DNT': '1',
-            'Connection': 'keep-alive',
             'Upgrade-Insecure-Requests': '1',
             'Sec-Fetch-Dest': 'document',
             'Sec-Fetch-Mode': 'navigate',
@@ -307,11 +330,9 @@ async def get_kiwi_info(kiwi_url):
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) Chrome/131 Safari/537.36',
         }
 
-        # Async HTTP request with httpx
-        async with httpx.AsyncClient() as client:
-            res = await client.get(kiwi_url, timeout=10, headers=headers)
-            html = res.text
-            cookies = res.cookies
+        res = await fetch("kwik", "GET", kiwi_url, client=client, timeout=10, headers=headers)
+        html = res.text
+        cookies = res.cookies
         
         # Offload CPU-bound parsing/deobfuscation to thread pool
         result = await asyncio.to_thread(_parse_and_deobfuscate_kiwi, html, cookies)
@@ -338,7 +359,7 @@ def _parse_and_deobfuscate_kiwi(html, cookies):
         "kwik_session": cookies.get("kwik_session")
     }
 
-async def get_redirect_link(url, id, episode, db,snapshot,quality):
+async def get_redirect_link(url, id, episode, db,snapshot,quality,client=None):
     if not url or not id or not episode:
         print("No url,episode or id detected ending now")
         return None
@@ -358,14 +379,14 @@ async def get_redirect_link(url, id, episode, db,snapshot,quality):
         "kwik_session": info.get("kwik_session")
     }
     
-    # Async HTTP POST with httpx
-    async with httpx.AsyncClient() as client:
-        res = await client.post(
-            base_url,
-            content=json.dumps(payload),
-            timeout=10,
-            headers={"Content-Type": "application/json"}
-        )
+    res = await fetch(
+        "kwik_api", "POST",
+        base_url,
+        client=client,
+        content=json.dumps(payload),
+        timeout=10,
+        headers={"Content-Type": "application/json"}
+    )
     
     if res.status_code != 200:
         print(res.text)
@@ -391,4 +412,75 @@ async def get_redirect_link(url, id, episode, db,snapshot,quality):
         "quality":quality,
         "status": 200,
         "size": size
-    }
\ No newline at end of file
+    }
+
+
+async def fetch_episode_link(id: str, episode: int, external_id: str, db,quality):
+    """Resolve one episode to its direct link (cache first, then the full scraping chain)"""
+    try:
+        # Check cache first
+        cursor = await db.execute(
+            "SELECT * FROM cached_video_url WHERE internal_id = ? and episode = ? and quality = ?", 
+            (id, episode,quality)
+        )
+        row = await cursor.fetchone()
+        
+        if row and row["video_url"]:
+            try:
+                return {
+                        "episode": row["episode"],
+                        "direct_link": row["video_url"],
+                        "size": row["size"],
+                        "snapshot": row["snapshot"],
+                        "quality":quality,
+                        "status": 200
+                    }
+            except Exception as e:
+                print(f"⚠️ Episode {episode}: Cached link check failed ({e}), fetching fresh...")
+        
+        # Fetch fresh link (upstream pacing is handled by helpers.scheduler)
+        episode_index = await get_episode_index(external_id, db)
+        episode_session = episode_index.get(episode) if episode_index else None
+        if not episode_session:
+            print(f"❌ Episode {episode}: No episode session found")
+            return None
+        cursor2 = await db.execute("SELECT poster FROM anime_info WHERE internal_id = ?",(id,))
+        row2 = await cursor2.fetchone()
+        if not row2:
+            return None
+        episode_snapshot = row2["poster"]
+        
+        pahe_link = await get_pahewin_link(external_id, episode_session,db,quality)
+        if not pahe_link:
+            print(f"❌ Episode {episode}: No pahe link found")
+            return None
+        
+        kiwi_url = await get_kiwi_url(pahe_link)
+        if not kiwi_url:
+            print(f"❌ Episode {episode}: No kiwi URL found")
+            return None
+        
+        results = await get_redirect_link(kiwi_url, id, episode, db, episode_snapshot,quality)
+        
+        if results and results.get("status") == 200:
+            return results
+        else:
+            print(f"❌ Episode {episode}: Failed to get redirect link")
+            return None
+            
+    except Exception as e:
+        print(f"❌ Episode {episode}: Error - {e}")
+        traceback.print_exc()
+        return None
+
+
+async def create_download_session(db, id, anime_title, links):
+    """Store resolved links so the WebSocket/ZIP routes can pick them up"""
+    session_id = str(uuid.uuid4())
+    
+    await db.execute(
+        "INSERT INTO download_sessions (session_id, anime_id, anime_title, links, created_at) VALUES (?, ?, ?, ?, datetime('now'))",
+        (session_id, id, anime_title, json.dumps(links))
+    )
+    await db.commit()
+    return session_id
@@ -0,0 +1,180 @@
+import os
+import time
+import asyncio
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+from utils.helper import env_int
+
+CDN_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
+    'Referer': 'https://kwik.cx/',
+}
+
+# Prefix of the temp dirs bulk ZIPs are built in, so the storage janitor can find strays
+ZIP_TEMP_PREFIX = "animezip_"
+
+
+# Already-compressed formats: deflating them burns CPU for ~0% gain
+STORED_EXTENSIONS = {
+    ".mp4", ".m4v", ".mkv", ".webm", ".mov", ".avi", ".ts",
+    ".mp3", ".m4a", ".aac", ".ogg", ".opus",
+    ".jpg", ".jpeg", ".png", ".gif", ".webp",
+    ".zip", ".gz", ".7z", ".rar",
+}
+
+# Dedicated threads for ZIP assembly so multi-GB archives never run on the event loop
+_zip_executor = None
+
+
+def compression_for(arcname, size=None):
+    """
+    Per-entry compression policy: store media and anything large,
+    deflate only small (text-like) entries.
+    """
+    ext = os.path.splitext(arcname)[1].lower()
+    if ext in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED
+    if size is None or size > env_int("ZIP_DEFLATE_MAX_BYTES", 1024 * 1024):
+        return zipfile.ZIP_STORED
+    return zipfile.ZIP_DEFLATED
+
+
+def _get_zip_executor():
+    global _zip_executor
+    if _zip_executor is None:
+        _zip_executor = ThreadPoolExecutor(
+            max_workers=env_int("ZIP_WORKERS", 2),
+            thread_name_prefix="zip"
+        )
+    return _zip_executor
+
+
+def _build_zip_sync(zip_path, files, report, remove_sources):
+    """Runs on the ZIP executor. files: list of (source path, arcname)"""
+    with zipfile.ZipFile(zip_path, "w", allowZip64=True) as zipf:
+        for idx, (path, arcname) in enumerate(files, 1):
+            compress_type = compression_for(arcname, os.path.getsize(path))
+            zipf.write(path, arcname, compress_type=compress_type)
+            if remove_sources:
+                os.remove(path)
+            report((idx, arcname))
+
+
+async def build_zip(zip_path, files, on_progress=None, remove_sources=False):
+    """
+    Assemble a ZIP off the event loop.
+    on_progress(done, total, arcname) is awaited on the loop after each entry.
+    """
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue()
+
+    def report(item):
+        loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run():
+        try:
+            _build_zip_sync(zip_path, files, report, remove_sources)
+        finally:
+            report(None)
+
+    future = loop.run_in_executor(_get_zip_executor(), run)
+    while (item := await queue.get()) is not None:
+        if on_progress:
+            done, arcname = item
+            await on_progress(done, len(files), arcname)
+    # Re-raise anything the worker thread hit
+    await future
+
+
+class _StreamSink:
+    """
+    Write-only file object for zipfile.
+    It has no tell()/seek(), so zipfile switches to streaming mode (data
+    descriptors after each entry) and we drain the bytes as they are produced.
+    """
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def stream_zip(entries):
+    """
+    Build a ZIP64 archive on the fly.
+    `entries` is an iterable of (arcname, chunks) where chunks is an async
+    iterator of bytes. Nothing touches the disk and, sizes being unknown,
+    every entry is stored unless compression_for says otherwise.
+    """
+    sink = _StreamSink()
+    zf = zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED, allowZip64=True)
+
+    for arcname, chunks in entries:
+        dest = None
+        try:
+            async for chunk in chunks:
+                if dest is None:
+                    # Only open the entry once data arrives, so an episode that
+                    # fails up front is skipped instead of leaving an empty file
+                    zinfo = zipfile.ZipInfo(arcname, date_time=time.localtime()[:6])
+                    zinfo.compress_type = compression_for(arcname)
+                    dest = zf.open(zinfo, "w", force_zip64=True)
+                dest.write(chunk)
+                data = sink.drain()
+                if data:
+                    yield data
+        finally:
+            if dest is not None:
+                dest.close()
+        data = sink.drain()
+        if data:
+            yield data
+
+    zf.close()
+    yield sink.drain()
+
+
+async def stream_episode(client, url, episode, max_retries=3):
+    """
+    Yield one episode's bytes from the CDN.
+    A dropped connection is resumed with a Range request from the last byte
+    sent, so a retry never duplicates data already written into the ZIP.
+    """
+    sent = 0
+    for attempt in range(max_retries):
+        headers = dict(CDN_HEADERS)
+        if sent:
+            headers['Range'] = f'bytes={sent}-'
+        try:
+            async with client.stream('GET', url, headers=headers, timeout=httpx.Timeout(120.0, connect=30.0)) as response:
+                if sent and response.status_code != 206:
+                    # Can't resume without duplicating bytes
+                    raise RuntimeError(f"Episode {episode}: server ignored Range on resume")
+                response.raise_for_status()
+                async for chunk in response.aiter_bytes(chunk_size=1024*1024):
+                    sent += len(chunk)
+                    yield chunk
+                return
+        except (httpx.RemoteProtocolError, httpx.ReadTimeout, httpx.ConnectError) as e:
+            if attempt == max_retries - 1:
+                if sent:
+                    raise
+                print(f"❌ Episode {episode}: skipped in streaming ZIP ({e})")
+                return
+            await asyncio.sleep((attempt + 1) * 2)
+        except httpx.HTTPStatusError as e:
+            if sent:
+                raise
+            print(f"❌ Episode {episode}: skipped in streaming ZIP ({e})")
+            return
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from playwright.async_api import async_playwright
+from utils.helper import env_float
+
+
+class BrowserPool:
+    """
+    Long-lived headless Chromium used for DDoS-Guard cookie harvesting.
+
+    The browser is launched lazily on first use and kept warm so a cookie
+    refresh costs one page load instead of a full browser boot. It is
+    restarted when it stops responding and shut down after sitting idle.
+    """
+
+    def __init__(self):
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._lock = asyncio.Lock()
+        self._last_used = 0.0
+        self._idle_task = None
+
+    # ---------------- LIFECYCLE ----------------
+    async def start(self):
+        """Start the idle watcher; the browser itself launches on first use"""
+        if self._idle_task is None:
+            self._idle_task = asyncio.create_task(self._idle_watcher())
+
+    async def close(self):
+        """Stop the watcher and shut the browser down (app shutdown)"""
+        if self._idle_task:
+            self._idle_task.cancel()
+            try:
+                await self._idle_task
+            except asyncio.CancelledError:
+                pass
+            self._idle_task = None
+        async with self._lock:
+            await self._shutdown()
+
+    async def _launch(self):
+        print("🌐 Launching headless Chromium...")
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch(headless=True)
+        self._context = await self._browser.new_context()
+
+    async def _shutdown(self):
+        """Tear down whatever is running, ignoring errors from a dead browser"""
+        for closer in (
+            self._context and self._context.close,
+            self._browser and self._browser.close,
+            self._playwright and self._playwright.stop,
+        ):
+            if closer:
+                try:
+                    await closer()
+                except Exception:
+                    pass
+        if self._browser:
+            print("🌐 Chromium shut down")
+        self._playwright = None
+        self._browser = None
+        self._context = None
+
+    def _healthy(self):
+        return self._browser is not None and self._browser.is_connected()
+
+    # ---------------- USAGE ----------------
+    @asynccontextmanager
+    async def page(self):
+        """
+        Yield a fresh page in the shared context.
+        Cookies are cleared first so each harvest gets a new DDoS-Guard session;
+        the context itself (and its HTTP cache) is reused.
+        """
+        async with self._lock:
+            if not self._healthy():
+                await self._shutdown()
+                await self._launch()
+
+            try:
+                await self._context.clear_cookies()
+                page = await self._context.new_page()
+            except Exception as e:
+                # Context or browser went bad, restart once
+                print(f"⚠️ Browser unhealthy ({e}), restarting...")
+                await self._shutdown()
+                await self._launch()
+                page = await self._context.new_page()
+
+            try:
+                yield page
+            finally:
+                self._last_used = time.time()
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+
+    async def cookies(self):
+        """Cookies currently held by the shared context"""
+        return await self._context.cookies()
+
+    async def _idle_watcher(self):
+        while True:
+            idle_timeout = env_float("BROWSER_IDLE_TIMEOUT", 600.0)
+            await asyncio.sleep(min(idle_timeout, 60.0))
+            if self._browser and time.time() - self._last_used > idle_timeout:
+                async with self._lock:
+                    # Re-check under the lock in case a harvest just ran
+                    if self._browser and time.time() - self._last_used > idle_timeout:
+                        print("💤 Chromium idle, shutting down")
+                        await self._shutdown()
+
+
+# Global browser pool (owned by the app lifespan)
+browser_pool = BrowserPool()
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import uuid
+import aiosqlite
+from db import DB_PATH
+from helpers.anime_helper import fetch_episode_link, create_download_session
+from helpers.anime_helper import get_actual_episode, get_episode_index
+from utils.helper import env_int
+
+
+class BulkJobEngine:
+    """
+    Durable background resolution of episode ranges.
+
+    Jobs and per-episode status live in SQLite (bulk_jobs / bulk_job_episodes),
+    so a client disconnect loses nothing and unfinished jobs are picked up
+    again after a restart. A small worker pool resolves each job in chunks.
+    """
+
+    def __init__(self):
+        self._queue = asyncio.Queue()
+        self._workers = []
+
+    # ---------------- LIFECYCLE ----------------
+    async def start(self):
+        """Start the workers and requeue jobs that were unfinished at shutdown"""
+        worker_count = env_int("BULK_JOB_WORKERS", 2)
+        self._workers = [asyncio.create_task(self._worker(i)) for i in range(worker_count)]
+
+        async with aiosqlite.connect(DB_PATH) as db:
+            cursor = await db.execute(
+                "SELECT job_id FROM bulk_jobs WHERE status IN ('queued', 'running') ORDER BY created_at"
+            )
+            rows = await cursor.fetchall()
+        for (job_id,) in rows:
+            self._queue.put_nowait(job_id)
+        if rows:
+            print(f"♻️ Resuming {len(rows)} unfinished bulk jobs")
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    # ---------------- PUBLIC API ----------------
+    async def submit(self, db, anime_id, anime_title, external_id, quality, episodes):
+        """Persist a new job with one pending row per episode and queue it"""
+        job_id = str(uuid.uuid4())
+        await db.execute(
+            """INSERT INTO bulk_jobs
+               (job_id, anime_id, anime_title, external_id, quality, ep_from, ep_to, status)
+               VALUES (?, ?, ?, ?, ?, ?, ?, 'queued')""",
+            (job_id, anime_id, anime_title, external_id, quality, min(episodes), max(episodes))
+        )
+        await db.executemany(
+            "INSERT INTO bulk_job_episodes (job_id, episode, status) VALUES (?, ?, 'pending')",
+            [(job_id, episode) for episode in episodes]
+        )
+        await db.commit()
+        self._queue.put_nowait(job_id)
+        return job_id
+
+    async def status(self, db, job_id):
+        cursor = await db.execute("SELECT * FROM bulk_jobs WHERE job_id = ?", (job_id,))
+        job = await cursor.fetchone()
+        if not job:
+            return None
+        cursor = await db.execute(
+            "SELECT status, COUNT(*) AS count FROM bulk_job_episodes WHERE job_id = ? GROUP BY status",
+            (job_id,)
+        )
+        counts = {row["status"]: row["count"] for row in await cursor.fetchall()}
+        return {
+            "job_id": job_id,
+            "status": job["status"],
+            "anime_title": job["anime_title"],
+            "from": job["ep_from"],
+            "to": job["ep_to"],
+            "quality": job["quality"],
+            "session_id": job["session_id"],
+            "error": job["error"],
+            "total": sum(counts.values()),
+            "done": counts.get("done", 0),
+            "failed": counts.get("failed", 0),
+            "pending": counts.get("pending", 0),
+        }
+
+    async def links(self, db, job_id):
+        cursor = await db.execute(
+            "SELECT link FROM bulk_job_episodes WHERE job_id = ? AND status = 'done' ORDER BY episode",
+            (job_id,)
+        )
+        return [json.loads(row["link"]) for row in await cursor.fetchall()]
+
+    # ---------------- WORKERS ----------------
+    async def _worker(self, index):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Bulk job {job_id} crashed on worker {index}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id):
+        async with aiosqlite.connect(DB_PATH) as db:
+            db.row_factory = aiosqlite.Row
+            cursor = await db.execute("SELECT * FROM bulk_jobs WHERE job_id = ?", (job_id,))
+            job = await cursor.fetchone()
+            if not job or job["status"] in ("done", "failed"):
+                return
+
+            try:
+                await self._resolve(db, job)
+            except asyncio.CancelledError:
+                # Shutdown: stays 'running' and is requeued on the next start
+                raise
+            except Exception as e:
+                print(f"❌ Bulk job {job_id} failed: {e}")
+                await self._set_status(db, job_id, "failed", error=str(e) or type(e).__name__)
+
+    async def _resolve(self, db, job):
+        job_id = job["job_id"]
+        chunk_size = env_int("BULK_JOB_CHUNK", 10)
+        max_attempts = env_int("BULK_JOB_MAX_ATTEMPTS", 2)
+
+        await self._set_status(db, job_id, "running")
+        print(f"⚙️ Bulk job {job_id}: {job['anime_title']} {job['ep_from']}-{job['ep_to']}")
+
+        # First-time catalog sync for long shows happens here, not in POST /anime/jobs
+        total = await get_actual_episode(job["external_id"], db)
+        episode_index = await get_episode_index(job["external_id"], db, total)
+        if not episode_index:
+            await self._set_status(db, job_id, "failed", error="Episode list not available")
+            return
+        cursor = await db.execute(
+            "SELECT episode FROM bulk_job_episodes WHERE job_id = ? AND status = 'pending'", (job_id,)
+        )
+        missing = [(job_id, row["episode"]) for row in await cursor.fetchall() if row["episode"] not in episode_index]
+        if missing:
+            # Not in the catalog: no point retrying these
+            await db.executemany(
+                "UPDATE bulk_job_episodes SET status = 'failed' WHERE job_id = ? AND episode = ?", missing
+            )
+            await db.commit()
+
+        while True:
+            cursor = await db.execute(
+                """SELECT episode, attempts FROM bulk_job_episodes
+                   WHERE job_id = ? AND status = 'pending' ORDER BY episode LIMIT ?""",
+                (job_id, chunk_size)
+            )
+            chunk = await cursor.fetchall()
+            if not chunk:
+                break
+
+            results = await asyncio.gather(*[
+                fetch_episode_link(job["anime_id"], row["episode"], job["external_id"], db, job["quality"])
+                for row in chunk
+            ])
+
+            for row, link in zip(chunk, results):
+                if link is not None:
+                    await db.execute(
+                        """UPDATE bulk_job_episodes SET status = 'done', link = ?, attempts = attempts + 1
+                           WHERE job_id = ? AND episode = ?""",
+                        (json.dumps(link), job_id, row["episode"])
+                    )
+                else:
+                    # Leave it pending for another pass until attempts run out
+                    status = "failed" if row["attempts"] + 1 >= max_attempts else "pending"
+                    await db.execute(
+                        """UPDATE bulk_job_episodes SET status = ?, attempts = attempts + 1
+                           WHERE job_id = ? AND episode = ?""",
+                        (status, job_id, row["episode"])
+                    )
+            await db.execute(
+                "UPDATE bulk_jobs SET updated_at = datetime('now') WHERE job_id = ?", (job_id,)
+            )
+            await db.commit()
+
+        links = await self.links(db, job_id)
+        if not links:
+            await self._set_status(db, job_id, "failed", error="No episodes resolved")
+            print(f"❌ Bulk job {job_id}: no episodes resolved")
+            return
+
+        session_id = await create_download_session(db, job["anime_id"], job["anime_title"], links)
+        await db.execute(
+            "UPDATE bulk_jobs SET session_id = ? WHERE job_id = ?", (session_id, job_id)
+        )
+        await self._set_status(db, job_id, "done")
+        print(f"✅ Bulk job {job_id}: {len(links)} episodes resolved")
+
+    async def _set_status(self, db, job_id, status, error=None):
+        await db.execute(
+            "UPDATE bulk_jobs SET status = ?, error = ?, updated_at = datetime('now') WHERE job_id = ?",
+            (status, error, job_id)
+        )
+        await db.commit()
+
+
+# Global job engine (started from the app lifespan)
+bulk_job_engine = BulkJobEngine()
@@ -0,0 +1,178 @@
+import asyncio
+import time
+import aiosqlite
+from playwright.async_api import TimeoutError
+from helpers.browser_pool import browser_pool
+from utils.helper import env_float
+from db import DB_PATH
+
+EXPIRY_COOKIE = "__ddg2"
+
+
+class CookieManager:
+    """
+    Process-wide owner of the animepahe DDoS-Guard cookies.
+
+    Cookies are served from memory. Only one refresh (headless Chromium) runs
+    at a time; concurrent callers wait on it instead of launching their own.
+    A background task refreshes shortly before __ddg2 expires so requests
+    never have to wait for the browser.
+    """
+
+    def __init__(self):
+        self._cookies = None
+        self._expires = None
+        self._loaded = False
+        self._load_lock = asyncio.Lock()
+        self._refresh_task = None
+        self._background_task = None
+        self._last_failure = 0.0
+
+    # ---------------- STATE ----------------
+    def _expired(self):
+        return not self._expires or self._expires < time.time()
+
+    def _needs_refresh(self):
+        margin = env_float("COOKIE_REFRESH_MARGIN", 300.0)
+        return not self._expires or self._expires - margin < time.time()
+
+    def _set(self, cookies, expires):
+        self._cookies = cookies
+        self._expires = expires if expires and expires > 0 else None
+
+    async def _load_from_db(self):
+        """Seed memory from SQLite once per process"""
+        async with self._load_lock:
+            if self._loaded:
+                return
+            try:
+                async with aiosqlite.connect(DB_PATH) as db:
+                    cursor = await db.execute("SELECT name, value, expires FROM cookies")
+                    rows = await cursor.fetchall()
+                if rows:
+                    expires = next((r[2] for r in rows if r[0] == EXPIRY_COOKIE), None)
+                    self._set({r[0]: r[1] for r in rows}, expires)
+                    print(f"🍪 Loaded {len(rows)} cookies from database")
+            except Exception as e:
+                print(f"⚠️ Could not load cached cookies: {e}")
+            self._loaded = True
+
+    # ---------------- PUBLIC API ----------------
+    async def get(self):
+        """Return cookies as a dict, refreshing only when they are missing or expired"""
+        if not self._loaded:
+            await self._load_from_db()
+
+        if self._cookies and not self._expired():
+            return dict(self._cookies)
+
+        # Don't hammer Chromium while animepahe is failing; serve stale cookies instead
+        backing_off = time.time() - self._last_failure < env_float("COOKIE_RETRY_DELAY", 60.0)
+        if not (backing_off and self._cookies):
+            print("⚠️ Cookies expired, fetching new ones...")
+            await self.refresh()
+
+        if self._cookies:
+            return dict(self._cookies)
+        return None  # No cookies available at all
+
+    async def refresh(self):
+        """
+        Single-flight refresh: the first caller starts it, everyone else
+        awaits the same task.
+        """
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._refresh())
+        # Shield so a cancelled request doesn't abort the shared refresh
+        return await asyncio.shield(self._refresh_task)
+
+    async def start(self):
+        """Load cached cookies and start the proactive refresh loop"""
+        await self._load_from_db()
+        if self._background_task is None:
+            self._background_task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self):
+        if self._background_task:
+            self._background_task.cancel()
+            try:
+                await self._background_task
+            except asyncio.CancelledError:
+                pass
+            self._background_task = None
+
+    # ---------------- INTERNALS ----------------
+    async def _refresh(self):
+        try:
+            cookies = await self._harvest()
+        except Exception as e:
+            print(f"❌ Failed to get new cookies: {e}")
+            self._last_failure = time.time()
+            if self._cookies:
+                print("⚠️ Using expired cached cookies as fallback")
+            return False
+
+        expires = next((c.get("expires") for c in cookies if c["name"] == EXPIRY_COOKIE), None)
+        if not expires or expires <= 0:
+            # Session cookie: keep it for a bounded time instead of refreshing on every call
+            expires = time.time() + env_float("COOKIE_FALLBACK_TTL", 1800.0)
+        self._set({c["name"]: c["value"] for c in cookies}, expires)
+        await self._persist(cookies)
+        print("✅ Used fresh cookies from animepahe server")
+        return True
+
+    async def _harvest(self):
+        """Open animepahe in the warm headless browser and collect the DDoS-Guard cookies"""
+        async with browser_pool.page() as page:
+            # Go to Animepahe
+            await page.goto("https://animepahe.si")
+
+            # Wait for main content to load
+            try:
+                await page.wait_for_load_state("domcontentloaded", timeout=10000)
+            except TimeoutError:
+                print("⚠️ Timeout waiting for DOMContentLoaded, continuing anyway...")
+
+            # Small sleep to ensure cookies are set
+            await asyncio.sleep(1)
+
+            return await browser_pool.cookies()
+
+    async def _persist(self, cookies):
+        """Replace the stored cookies in one transaction"""
+        try:
+            async with aiosqlite.connect(DB_PATH) as db:
+                await db.execute("DELETE FROM cookies")
+                await db.executemany(
+                    "INSERT INTO cookies (name, value, expires) VALUES (?, ?, ?)",
+                    [(c["name"], c["value"], c.get("expires")) for c in cookies]
+                )
+                await db.commit()
+        except Exception as e:
+            print(f"⚠️ Could not persist cookies: {e}")
+
+    async def _refresh_loop(self):
+        """Refresh ahead of expiry so no request ever waits on Chromium"""
+        retry_delay = env_float("COOKIE_RETRY_DELAY", 60.0)
+        while True:
+            try:
+                if self._needs_refresh():
+                    ok = await self.refresh()
+                    if not ok:
+                        await asyncio.sleep(retry_delay)
+                        continue
+                margin = env_float("COOKIE_REFRESH_MARGIN", 300.0)
+                if self._expires:
+                    wait = self._expires - margin - time.time()
+                else:
+                    wait = retry_delay
+                await asyncio.sleep(max(wait, 1.0))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"⚠️ Cookie refresh loop error: {e}")
+                await asyncio.sleep(retry_delay)
+
+
+# Global cookie manager (started from the app lifespan)
+cookie_manager = CookieManager()
@@ -2,63 +2,178 @@ import json
 import os
 import re
 import secrets
+import time
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
 import asyncio
 import yt_dlp
 from yt_dlp.utils import DownloadError
+import aiosqlite
+from db import DB_PATH
+from helpers.media_cache import media_key, info_key, lookup_media, store_media
+from helpers.media_pool import media_pool, MediaQueueFull
 # from db import get_db
 
-def raw_video_downloader(url):
-    try:
-        os.makedirs("downloads", exist_ok=True)
+# yt-dlp options shared by every platform
+BASE_OPTIONS = {
+    # Force H.264 codec
+    "format": "bestvideo[vcodec^=avc1]+bestaudio/best",
+    "quiet": False,
+    "nocheckcertificate": True,
+    "retries": 10,
+    "fragment_retries": 10,
+    "noprogress": True
+}
 
-        # Get video info first
-        with yt_dlp.YoutubeDL({"quiet": True}) as yt:
-            info = yt.extract_info(url, download=False)
+# Per-platform additions on top of BASE_OPTIONS
+PLATFORM_OPTIONS = {
+    "instagram": {
+        "cookiesfrombrowser": ("brave",),
+        "cookiefile": "./insta_cookies.txt",
+    },
+}
 
-        PROJECT_URL = os.getenv('PROJECT_URL')
-        title = info.get("title", "video")
 
-        # Clean title
-        title = re.sub(r"[^\w\s-]", "", title)
-        title = title.strip().replace(" ", "_")
-        title = title[:40]  # shorten to 40 chars
+# Single-file formats a client can play straight from the platform's CDN:
+# audio and video together over plain HTTP(S) (no HLS/DASH, no merge)
+DIRECT_FORMAT = (
+    "best[vcodec^=avc1][acodec!=none][protocol^=http][protocol!*=dash]"
+    "/best[vcodec!=none][acodec!=none][protocol^=http][protocol!*=dash]"
+)
+
+# Formats for live remuxing: prefer AAC audio so it copies straight into MP4
+STREAM_FORMAT = "bestvideo[vcodec^=avc1]+bestaudio[ext=m4a]/bestvideo[vcodec^=avc1]+bestaudio/best"
+
+# Query parameters CDNs use for signed-URL expiry (unix seconds; "oe" is hex)
+EXPIRY_PARAMS = ("expire", "expires", "x-expires", "oe")
+
+
+def _media_info(info):
+    return {
+        "channel_info": {
+            "channel_name": info.get("channel"),
+            "channel_url": info.get("channel_url")
+        },
+        "video_info": {
+            "title": info.get("title"),
+            "comment_count": info.get("comment_count"),
+            "description": info.get("description"),
+            "like_count": info.get("like_count")
+        },
+    }
+
+
+def url_expiry(url):
+    """Unix time a signed media URL stops working, when the URL says so"""
+    query = parse_qs(urlsplit(url).query)
+    for name in EXPIRY_PARAMS:
+        value = query.get(name, [None])[0]
+        if not value:
+            continue
+        try:
+            return int(value, 16) if name == "oe" else int(value)
+        except ValueError:
+            continue
+    return None
+
+
+def clean_title(title):
+    title = re.sub(r"[^\w\s-]", "", title or "video")
+    title = title.strip().replace(" ", "_")
+    return title[:40]  # shorten to 40 chars
+
+
+def downloaded_path(info):
+    """Final file yt-dlp wrote (after merging), from a download=True extraction"""
+    for download in info.get("requested_downloads") or []:
+        if download.get("filepath"):
+            return download["filepath"]
+    return info.get("filepath") or info.get("_filename")
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        final_path = os.path.join("downloads", f"{title}_{timestamp}.mp4")
 
-        # Download directly - force H.264 codec
+def _progress_hooks(progress):
+    """
+    yt-dlp progress/postprocessor hooks that report through a
+    media_pool.progress_sink() (queue, token) pair, at most every 0.5s.
+    """
+    queue, token = progress
+    last_report = [0.0]
+
+    def report(message, throttle=False):
+        now = time.monotonic()
+        if throttle and now - last_report[0] < 0.5:
+            return
+        last_report[0] = now
+        queue.put((token, message))
+
+    def on_download(d):
+        if d.get("status") != "downloading":
+            return
+        downloaded = d.get("downloaded_bytes") or 0
+        total = d.get("total_bytes") or d.get("total_bytes_estimate")
+        speed = d.get("speed") or 0
+        report({
+            "status": "downloading",
+            "progress": int(downloaded / total * 100) if total else None,
+            "downloaded_mb": round(downloaded / 1024 / 1024, 2),
+            "total_mb": round(total / 1024 / 1024, 2) if total else None,
+            "speed_mbps": round(speed / 1024 / 1024, 2),
+            "eta": d.get("eta"),
+        }, throttle=True)
+
+    def on_postprocess(d):
+        if d.get("status") == "started":
+            report({"status": "processing", "message": f"{d.get('postprocessor', 'Post-processing')}..."})
+
+    return [on_download], [on_postprocess]
+
+
+def raw_video_downloader(url, platform=None, progress=None):
+    """
+    Extract and download in a single yt-dlp pass, so the page, API and
+    format list are resolved once. The file lands under a temporary name
+    (the title isn't known before extraction) and is renamed afterwards.
+    `progress` is an optional media_pool.progress_sink() pair.
+    """
+    try:
+        os.makedirs("downloads", exist_ok=True)
+
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
         options = {
-            "format": "bestvideo[vcodec^=avc1]+bestaudio/best",
-            "outtmpl": final_path,
-            "quiet": False,
-            "nocheckcertificate": True,
-            "retries": 10,
-            "fragment_retries": 10,
-            "noprogress": True
+            **BASE_OPTIONS,
+            **PLATFORM_OPTIONS.get(platform, {}),
+            "outtmpl": os.path.join("downloads", f"%(id)s_{timestamp}.%(ext)s"),
         }
-        
+        if progress:
+            options["progress_hooks"], options["postprocessor_hooks"] = _progress_hooks(progress)
+
         with yt_dlp.YoutubeDL(options) as yt:
-            yt.download([url])
+            info = yt.extract_info(url, download=True)
+
+        # Playlists / carousels: the first entry is the video we serve
+        if info.get("entries"):
+            info = next(entry for entry in info["entries"] if entry)
+
+        temp_path = downloaded_path(info)
+        if not temp_path or not os.path.exists(temp_path):
+            raise RuntimeError("yt-dlp reported no output file")
+
+        ext = os.path.splitext(temp_path)[1] or ".mp4"
+        final_path = os.path.join("downloads", f"{clean_title(info.get('title'))}_{timestamp}{ext}")
+        os.replace(temp_path, final_path)
+
+        PROJECT_URL = os.getenv('PROJECT_URL')
 
         # Generate short code + DB insert
         short_code = secrets.token_urlsafe(6)
         dlurl = PROJECT_URL if PROJECT_URL else "http://localhost:8000"
         return {
             "status":200,
-            "channel_info": {
-                "channel_name": info.get("channel"),
-                "channel_url": info.get("channel_url")
-            },
-            "video_info": {
-                "title": info.get("title"),
-                "comment_count": info.get("comment_count"),
-                "description": info.get("description"),
-                "like_count": info.get("like_count")
-            },
+            **_media_info(info),
             "download_url": dlurl+f"/file/{short_code}",
             "short":short_code,
-            "path":final_path
+            "path":final_path,
+            "media_key":info_key(info)
         }
     except DownloadError as e:
         print("An error occured while downloading",e)
@@ -78,100 +193,259 @@ def raw_video_downloader(url):
             "status":500,
             "message":"Internal Server error"
         }
-def raw_video_downloader_for_insta(url):
-    try:
-        os.makedirs("downloads", exist_ok=True)
 
-        # Get video info first
-        with yt_dlp.YoutubeDL({"quiet": True}) as yt:
+def raw_direct_link(url, platform=None):
+    """
+    Extraction only: pick a single progressive format and return its CDN URL
+    (with the headers it needs and its expiry) instead of downloading.
+    Returns None when the video has no such format, i.e. it needs a merge.
+    """
+    options = {
+        **BASE_OPTIONS,
+        **PLATFORM_OPTIONS.get(platform, {}),
+        "format": DIRECT_FORMAT,
+        "quiet": True,
+    }
+    try:
+        with yt_dlp.YoutubeDL(options) as yt:
             info = yt.extract_info(url, download=False)
+    except DownloadError as e:
+        if "Requested format is not available" in str(e):
+            return None
+        print("An error occured while extracting",e)
+        if "Unsupported URL" in str(e):
+            return{
+                "status":422,
+                "message":"Unsupported Url"
+            }
+        return {
+            "status":500,
+            "message":"Internal Server error"
+        }
+    except Exception as e:
+        print("Error extracting:", e)
+        return {
+            "status":500,
+            "message":"Internal Server error"
+        }
 
-        PROJECT_URL = os.getenv('PROJECT_URL')
-        title = info.get("title", "video")
+    if info.get("entries"):
+        info = next(entry for entry in info["entries"] if entry)
+    if info.get("requested_formats") or not info.get("url"):
+        return None
 
-        # Clean title
-        title = re.sub(r"[^\w\s-]", "", title)
-        title = title.strip().replace(" ", "_")
-        title = title[:40]  # shorten to 40 chars
+    expires_at = url_expiry(info["url"])
+    try:
+        expires_at = datetime.fromtimestamp(expires_at).isoformat() if expires_at else None
+    except (OverflowError, OSError, ValueError):
+        # The parameter wasn't a usable Unix time after all
+        expires_at = None
+    return {
+        "status":200,
+        "mode":"direct",
+        **_media_info(info),
+        "direct_url": info["url"],
+        # Cookies are never passed on; signed CDN URLs don't need them
+        "http_headers": {k: v for k, v in (info.get("http_headers") or {}).items() if k.lower() != "cookie"},
+        "expires_at": expires_at,
+        "format": {
+            "format_id": info.get("format_id"),
+            "ext": info.get("ext"),
+            "width": info.get("width"),
+            "height": info.get("height"),
+            "filesize": info.get("filesize") or info.get("filesize_approx"),
+        },
+    }
 
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        final_path = os.path.join("downloads", f"{title}_{timestamp}.mp4")
 
-        # Download directly - force H.264 codec
-        options = {
-            "format": "bestvideo[vcodec^=avc1]+bestaudio/best",
-            "outtmpl": final_path,
-            "quiet": False,
-            "nocheckcertificate": True,
-            "retries": 10,
-            "cookiesfrombrowser": ("brave",),
-            'cookiefile': './insta_cookies.txt',
-            "fragment_retries": 10,
-            "noprogress": True
+async def direct_link(url, platform=None):
+    """Direct CDN link for a video, or None when it has to be downloaded locally"""
+    try:
+        return await media_pool.run(raw_direct_link, url, platform)
+    except MediaQueueFull:
+        return {
+            "status":503,
+            "message":"Too many downloads in progress, try again shortly"
         }
-        
-        with yt_dlp.YoutubeDL(options) as yt:
-            yt.download([url])
-
-        # Generate short code + DB insert
-        short_code = secrets.token_urlsafe(6)
-        dlurl = PROJECT_URL if PROJECT_URL else "http://localhost:8000"
+    except Exception as e:
+        print("Media worker failed:", e)
         return {
-            "status":200,
-            "channel_info": {
-                "channel_name": info.get("channel"),
-                "channel_url": info.get("channel_url")
-            },
-            "video_info": {
-                "title": info.get("title"),
-                "comment_count": info.get("comment_count"),
-                "description": info.get("description"),
-                "like_count": info.get("like_count")
-            },
-            "download_url": dlurl+f"/file/{short_code}",
-            "short":short_code,
-            "path":final_path
+            "status":500,
+            "message":"Internal Server error"
         }
+
+
+def raw_stream_sources(url, platform=None):
+    """
+    Extraction only, for live remuxing: the input URL(s) ffmpeg needs
+    (video + audio when a merge is required) with their request headers.
+    """
+    options = {
+        **BASE_OPTIONS,
+        **PLATFORM_OPTIONS.get(platform, {}),
+        "format": STREAM_FORMAT,
+        "quiet": True,
+    }
+    try:
+        with yt_dlp.YoutubeDL(options) as yt:
+            info = yt.extract_info(url, download=False)
     except DownloadError as e:
-        print("An error occured while downloading",e)
+        print("An error occured while extracting",e)
         if "Unsupported URL" in str(e):
             return{
                 "status":422,
                 "message":"Unsupported Url"
             }
-        else:
-            return {
+        return {
             "status":500,
             "message":"Internal Server error"
         }
     except Exception as e:
-        print("Error downloading:", e)
+        print("Error extracting:", e)
         return {
             "status":500,
             "message":"Internal Server error"
         }
 
-async def videoDL(url,db):
-    info = await asyncio.to_thread(raw_video_downloader,url)
-    if not info or info.get("status") == 500:
-        return info
-    if not info or info.get("status") == 400:
+    if info.get("entries"):
+        info = next(entry for entry in info["entries"] if entry)
+    formats = info.get("requested_formats") or [info]
+    return {
+        "status":200,
+        **_media_info(info),
+        "sources": [
+            {"url": fmt["url"], "http_headers": fmt.get("http_headers") or {}}
+            for fmt in formats
+        ],
+        "media_key": info_key(info),
+    }
+
+
+async def stream_sources(url, platform=None):
+    try:
+        return await media_pool.run(raw_stream_sources, url, platform)
+    except MediaQueueFull:
+        return {
+            "status":503,
+            "message":"Too many downloads in progress, try again shortly"
+        }
+    except Exception as e:
+        print("Media worker failed:", e)
+        return {
+            "status":500,
+            "message":"Internal Server error"
+        }
+
+
+class MediaDownload:
+    """
+    One in-flight yt-dlp download, shared by every request for the same video.
+    Progress from the worker process is forwarded to the attached listeners
+    (async jobs following it).
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.task = None
+        self.ticket = media_pool.ticket()
+        self.listeners = set()
+
+    def publish(self, message):
+        for listener in list(self.listeners):
+            listener.publish(message)
+
+
+# In-flight downloads by media key; concurrent requests for one video share it
+_media_downloads = {}
+
+
+async def _report_queue_position(download):
+    """Tell listeners where the download stands in the worker queue until it starts"""
+    last = None
+    while not download.ticket.started:
+        position = download.ticket.position
+        if position and position != last:
+            download.publish({
+                "status": "queued",
+                "position": position,
+                "message": f"Waiting for a download slot (position {position})"
+            })
+            last = position
+        await asyncio.sleep(1)
+
+
+async def _download_and_store(url, key, platform, download):
+    reporter = asyncio.create_task(_report_queue_position(download))
+    sink = media_pool.progress_sink(download.publish)
+    try:
+        # yt-dlp + ffmpeg run in the media worker processes, not the default thread pool
+        info = await media_pool.run(raw_video_downloader, url, platform, sink, ticket=download.ticket)
+    except MediaQueueFull:
+        return {
+            "status":503,
+            "message":"Too many downloads in progress, try again shortly"
+        }
+    except Exception as e:
+        print("Media worker failed:", e)
+        return {
+            "status":500,
+            "message":"Internal Server error"
+        }
+    finally:
+        reporter.cancel()
+        media_pool.release_sink(sink[1])
+    if not info or info.get("status") != 200:
         return info
-    await db.execute(
-        "INSERT INTO videos (title, filepath, short_code) VALUES (?, ?, ?)",
-        (info["video_info"]["title"], info["path"], info["short"])
-    )
-    await db.commit()
+    # Own connection: the shared download outlives the request that started it
+    async with aiosqlite.connect(DB_PATH) as db:
+        await db.execute(
+            "INSERT INTO videos (title, filepath, short_code) VALUES (?, ?, ?)",
+            (info["video_info"]["title"], info["path"], info["short"])
+        )
+        await store_media(db, [key, info.pop("media_key", None)], info)
     return info
-async def videoDL_for_insta(url,db):
-    info = await asyncio.to_thread(raw_video_downloader_for_insta,url)
-    if not info or info.get("status") == 500:
-        return info
-    if not info or info.get("status") == 400:
-        return info
-    await db.execute(
-        "INSERT INTO videos (title, filepath, short_code) VALUES (?, ?, ?)",
-        (info["video_info"]["title"], info["path"], info["short"])
-    )
-    await db.commit()
-    return info
\ No newline at end of file
+
+
+async def cached_video_download(url, db, platform=None, listener=None):
+    """
+    Serve a /dl/* request from the media cache when the same video (by
+    extractor:id) was downloaded recently; otherwise download it once, however
+    many requests for it arrive meanwhile. `listener.publish(message)` gets
+    queue / download progress while waiting.
+    """
+    key = await media_key(url)
+    cached = await lookup_media(db, key)
+    if cached:
+        print(f"📦 Media cache hit: {key}")
+        return cached
+
+    download = _media_downloads.get(key)
+    if download is None:
+        download = MediaDownload(key)
+        download.task = asyncio.create_task(_download_and_store(url, key, platform, download))
+        _media_downloads[key] = download
+        download.task.add_done_callback(lambda _: _media_downloads.pop(key, None))
+    else:
+        print(f"🔁 Joining in-flight download: {key}")
+
+    if listener:
+        download.listeners.add(listener)
+    try:
+        # Shield so one client leaving doesn't cancel the others' download
+        info = await asyncio.shield(download.task)
+    finally:
+        download.listeners.discard(listener)
+    return dict(info) if info else info
+
+
+def public_info(info):
+    """Response body for a finished download (local path and raw short code stripped)"""
+    info = dict(info)
+    info.pop("path",None)
+    info.pop("short",None)
+    info.pop("media_key",None)
+    return info
+
+
+async def videoDL(url,db,platform=None):
+    return await cached_video_download(url, db, platform)
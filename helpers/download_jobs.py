@@ -0,0 +1,419 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+from contextlib import AsyncExitStack
+from datetime import datetime, timedelta
+import aiosqlite
+import httpx
+from db import DB_PATH
+from helpers.archive import build_zip, CDN_HEADERS, ZIP_TEMP_PREFIX
+from helpers.episode_cache import episode_cache
+from helpers.segmented_download import probe_ranges, segmented_download
+from helpers.file_writer import ChunkWriter
+from helpers.progress import ProgressChannel
+from utils.helper import env_int, env_float
+
+
+def session_zip_names(row, links):
+    """(anime_title slug, zip filename) for a download session"""
+    anime_title = row["anime_title"].replace(" ", "_").lower()
+
+    # Get episode range
+    episodes = [int(link_info.get("episode")) for link_info in links if link_info.get("episode")]
+    from_ep = min(episodes) if episodes else 1
+    to_ep = max(episodes) if episodes else 1
+
+    return anime_title, f"{anime_title}_{from_ep}-{to_ep}_episodes.zip"
+
+
+class DownloadJob(ProgressChannel):
+    """
+    Server-side bulk download + ZIP for one session.
+
+    The job runs independently of any WebSocket. Sockets subscribe to its
+    progress channel; a reconnecting client gets the current state replayed
+    and then follows the live messages. Publishing never waits on a
+    subscriber, so a slow socket can't slow the download.
+    """
+
+    def __init__(self, session_id):
+        super().__init__()
+        self.session_id = session_id
+        self.task = None
+        self.temp_dir = None
+
+
+# Running and recently finished jobs, keyed by session_id
+download_jobs: dict[str, DownloadJob] = {}
+
+
+def get_download_job(session_id):
+    return download_jobs.get(session_id)
+
+
+def start_download_job(session_id, row):
+    """
+    Start the bulk download for a session (row from download_sessions).
+    If one is already running for the session, that job is returned instead,
+    so two sockets racing on the same session never start it twice.
+    """
+    existing = download_jobs.get(session_id)
+    if existing and existing.task and not existing.task.done():
+        return existing
+    job = DownloadJob(session_id)
+    download_jobs[session_id] = job
+    job.task = asyncio.create_task(_run_download_job(job, dict(row)))
+
+    def forget(_):
+        # Keep the finished job around briefly so late reconnects see the result
+        retention = env_float("DOWNLOAD_JOB_RETENTION", 600.0)
+        asyncio.get_running_loop().call_later(retention, _forget_job, job)
+
+    job.task.add_done_callback(forget)
+    return job
+
+
+def _forget_job(job):
+    if download_jobs.get(job.session_id) is job:
+        download_jobs.pop(job.session_id, None)
+
+
+async def stop_download_jobs():
+    """Cancel running jobs on shutdown (partial files stay in the episode cache)"""
+    tasks = [job.task for job in download_jobs.values() if job.task and not job.task.done()]
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def _run_download_job(job, row):
+    session_id = job.session_id
+    links = json.loads(row["links"])
+    anime_title, zip_filename = session_zip_names(row, links)
+
+    # Send initial status
+    job.publish({
+        "status": "started",
+        "message": f"Preparing to download {len(links)} episodes...",
+        "total_episodes": len(links)
+    })
+
+    # Cache pins held for the lifetime of this session's download + ZIP
+    pins = AsyncExitStack()
+
+    try:
+        # Create temp directory
+        temp_dir = tempfile.mkdtemp(prefix=ZIP_TEMP_PREFIX)
+        job.temp_dir = temp_dir
+        zip_path = os.path.join(temp_dir, zip_filename)
+
+        print(f"📁 Created temp dir: {temp_dir}")
+        print(f"📦 ZIP will be saved at: {zip_path}")
+
+        successful_episodes = []
+        anime_id = row["anime_id"]
+
+        concurrency = max(1, env_int("BULK_DOWNLOAD_CONCURRENCY", 3))
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def download_episode(idx, link_info, client):
+            episode = link_info.get("episode")
+            url = link_info.get("direct_link")
+
+            if not url:
+                return
+
+            cache_key = episode_cache.key(anime_id, episode, link_info.get("quality") or "720p")
+            # Pinned until the ZIP is built so eviction can't pull it from under us
+            await pins.enter_async_context(episode_cache.pin(cache_key))
+
+            async with semaphore:
+                # Send episode start status
+                job.publish({
+                    "status": "downloading",
+                    "episode": episode,
+                    "current": idx,
+                    "total": len(links),
+                    "message": f"Downloading Episode {episode}...",
+                    "progress": 0
+                })
+
+                # Download with retry (or reuse the cached file)
+                episode_file = await download_with_retry(
+                    client, url, cache_key, episode, job, idx, len(links)
+                )
+
+            if episode_file:
+                successful_episodes.append({
+                    'episode': episode,
+                    'temp_file': episode_file,
+                    'filename': f"{anime_title}_Episode_{str(episode).zfill(3)}.mp4"
+                })
+
+                # Send episode complete status
+                job.publish({
+                    "status": "episode_complete",
+                    "episode": episode,
+                    "current": idx,
+                    "total": len(links),
+                    "message": f"✅ Episode {episode} downloaded!",
+                    "successful_count": len(successful_episodes)
+                })
+            else:
+                # Send episode failed status
+                job.publish({
+                    "status": "episode_failed",
+                    "episode": episode,
+                    "message": f"❌ Episode {episode} failed after retries"
+                })
+
+        # Download episodes with progress updates, `concurrency` at a time
+        async with httpx.AsyncClient(
+            timeout=httpx.Timeout(120.0, connect=30.0),
+            limits=httpx.Limits(
+                max_keepalive_connections=max(5, concurrency),
+                # Each episode may open DOWNLOAD_SEGMENTS range connections
+                max_connections=max(10, concurrency * (env_int("DOWNLOAD_SEGMENTS", 4) + 1))
+            )
+        ) as client:
+            tasks = [
+                asyncio.create_task(download_episode(idx, link_info, client))
+                for idx, link_info in enumerate(links, 1)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            finally:
+                for task in tasks:
+                    task.cancel()
+
+        # Keep the ZIP in episode order regardless of finish order
+        successful_episodes.sort(key=lambda ep: int(ep['episode']))
+
+        if not successful_episodes:
+            job.publish({
+                "status": "error",
+                "message": "No episodes downloaded successfully!"
+            })
+            return
+
+        # Send zipping status
+        job.publish({
+            "status": "zipping",
+            "message": f"Creating ZIP file with {len(successful_episodes)} episodes...",
+            "successful_count": len(successful_episodes),
+            "total": len(links)
+        })
+
+        # Create ZIP on the ZIP executor; progress comes back to the loop
+        async def report_zip_progress(done, total, arcname):
+            ep_info = successful_episodes[done - 1]
+            job.publish({
+                "status": "zipping",
+                "message": f"Adding Episode {ep_info['episode']} to ZIP...",
+                "zip_progress": int((done / total) * 100)
+            })
+
+        await build_zip(
+            zip_path,
+            [(ep_info['temp_file'], ep_info['filename']) for ep_info in successful_episodes],
+            on_progress=report_zip_progress
+        )
+        # Episode files stay in the shared cache for the next session
+        await pins.aclose()
+
+        zip_size = os.path.getsize(zip_path)
+        print(f"✅ ZIP created successfully: {zip_size / 1024 / 1024:.2f} MB")
+
+        # Store ZIP path in database (expires in 1 hour)
+        expires_at = datetime.now() + timedelta(hours=1)
+        async with aiosqlite.connect(DB_PATH) as db:
+            await db.execute(
+                """INSERT OR REPLACE INTO zip_cache (session_id, zip_path, expires_at)
+                   VALUES (?, ?, ?)""",
+                (session_id, zip_path, expires_at)
+            )
+            await db.commit()
+        print(f"💾 Saved ZIP path to database for session: {session_id}")
+
+        # Send completion status with download link
+        job.publish(complete_message(session_id, zip_path, len(successful_episodes), len(links)))
+
+    except asyncio.CancelledError:
+        job.publish({
+            "status": "error",
+            "message": "Download cancelled (server shutting down)"
+        })
+        raise
+    except Exception as e:
+        print(f"❌ Error during download: {e}")
+        job.publish({
+            "status": "error",
+            "message": f"Error: {str(e)}"
+        })
+    finally:
+        await pins.aclose()
+
+
+def complete_message(session_id, zip_path, successful_count=None, total=None):
+    """The 'complete' message, also used when a client attaches after the job is gone"""
+    zip_size = os.path.getsize(zip_path)
+    return {
+        "status": "complete",
+        "message": "ZIP file ready for download!",
+        "download_url": f"/anime/download-zip/{session_id}",
+        "filename": os.path.basename(zip_path),
+        "size": zip_size,
+        "size_mb": round(zip_size / 1024 / 1024, 2),
+        "successful_count": successful_count,
+        "total": total
+    }
+
+
+async def download_with_retry(client, url, cache_key, episode, job, current, total, max_retries=3):
+    """
+    Return the local path of an episode, consulting the shared episode cache
+    before going to the CDN. Partial files stay in the cache so the next
+    attempt (or another session) resumes them with a Range request.
+    Returns None on failure.
+    """
+    cached = episode_cache.lookup(cache_key)
+    if cached:
+        print(f"📦 Episode {episode}: served from episode cache")
+        return cached
+
+    async with episode_cache.writer(cache_key) as part_file:
+        # Another session may have finished it while we waited for the writer lock
+        cached = episode_cache.lookup(cache_key)
+        if cached:
+            return cached
+
+        success = None
+        segments = env_int("DOWNLOAD_SEGMENTS", 4)
+        # A plain .part without a segment map came from a single stream; keep resuming that way
+        fresh_or_segmented = not os.path.exists(part_file) or os.path.exists(part_file + ".segments")
+        if segments > 1 and fresh_or_segmented:
+            try:
+                size, ranges = await probe_ranges(client, url)
+            except httpx.HTTPError as e:
+                print(f"⚠️ Episode {episode}: range probe failed ({e}), using a single stream")
+                size, ranges = None, False
+            if ranges and size and size >= env_int("SEGMENTED_MIN_BYTES", 16 * 1024 * 1024):
+                start_time = time.time()
+
+                async def report(downloaded, size_total):
+                    _publish_download_progress(
+                        job, episode, current, total, downloaded, size_total, start_time
+                    )
+
+                success = await segmented_download(
+                    client, url, part_file, size, segments=segments, on_progress=report, max_retries=max_retries
+                )
+
+        if success is None:
+            if os.path.exists(part_file + ".segments"):
+                # A preallocated segmented .part is already full size; a single
+                # stream would resume past its end (416) until it expires
+                for leftover in (part_file, part_file + ".segments"):
+                    try:
+                        os.remove(leftover)
+                    except FileNotFoundError:
+                        pass
+            success = await _download_file(
+                client, url, part_file, episode, job, current, total, max_retries
+            )
+        if not success:
+            return None
+        path = episode_cache.commit(cache_key)
+
+    await episode_cache.evict()
+    return path
+
+
+def _publish_download_progress(job, episode, current, total, downloaded, total_size, start_time):
+    """Progress message shared by the single-stream and segmented downloaders"""
+    progress = 0
+    if total_size:
+        progress = int((downloaded / total_size) * 100)
+
+    elapsed = time.time() - start_time
+    speed = downloaded / elapsed if elapsed > 0 else 0
+
+    job.publish({
+        "status": "downloading",
+        "episode": episode,
+        "current": current,
+        "total": total,
+        "progress": progress,
+        "downloaded_mb": round(downloaded / 1024 / 1024, 2),
+        "total_mb": round(total_size / 1024 / 1024, 2) if total_size else None,
+        "speed_mbps": round(speed / 1024 / 1024, 2),
+        "message": f"Downloading Episode {episode}... {progress}%"
+    })
+
+
+async def _download_file(client, url, temp_file, episode, job, current, total, max_retries=3):
+    """Download with retry and progress updates"""
+
+    for attempt in range(max_retries):
+        try:
+            start_byte = 0
+            if os.path.exists(temp_file):
+                start_byte = os.path.getsize(temp_file)
+
+            download_headers = dict(CDN_HEADERS)
+
+            if start_byte > 0:
+                download_headers['Range'] = f'bytes={start_byte}-'
+
+            start_time = time.time()
+
+            async with client.stream('GET', url, headers=download_headers, timeout=120.0) as response:
+                if start_byte > 0 and response.status_code != 206:
+                    # Range ignored: the body is the whole file, start over
+                    start_byte = 0
+
+                response.raise_for_status()
+
+                content_length = response.headers.get('content-length')
+                total_size = start_byte + int(content_length) if content_length else None
+
+                mode = 'ab' if start_byte > 0 else 'wb'
+                # Disk writes run on the writer's own thread; the bounded queue throttles the read
+                async with ChunkWriter(temp_file, mode) as writer:
+                    downloaded = start_byte
+                    last_update = time.time()
+
+                    async for chunk in response.aiter_bytes(chunk_size=1024*1024):
+                        await writer.write(chunk)
+                        downloaded += len(chunk)
+
+                        # Send progress update every 0.5 seconds
+                        if time.time() - last_update >= 0.5:
+                            _publish_download_progress(
+                                job, episode, current, total, downloaded, total_size, start_time
+                            )
+                            last_update = time.time()
+
+                return True
+
+        except (httpx.RemoteProtocolError, httpx.ReadTimeout, httpx.ConnectError) as e:
+            print(f"⚠️ Episode {episode}: attempt {attempt + 1} failed: {e!r}")
+            if attempt < max_retries - 1:
+                wait_time = (attempt + 1) * 2
+                job.publish({
+                    "status": "retrying",
+                    "episode": episode,
+                    "attempt": attempt + 1,
+                    "max_retries": max_retries,
+                    "message": f"Retry {attempt + 1}/{max_retries} in {wait_time}s..."
+                })
+                await asyncio.sleep(wait_time)
+            else:
+                return False
+        except Exception as e:
+            print(f"❌ Episode {episode}: download failed: {e!r}")
+            return False
+
+    return False
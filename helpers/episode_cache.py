@@ -0,0 +1,141 @@
+import os
+import asyncio
+import hashlib
+from contextlib import asynccontextmanager
+from utils.helper import env_int
+
+
+class EpisodeCache:
+    """
+    On-disk cache of downloaded episode files shared by every bulk session.
+
+    Files are named by a hash of (internal_id, episode, quality):
+      <key>.mp4       complete episode
+      <key>.mp4.part  partial download, resumed with Range by the next writer
+    The cache is capped at EPISODE_CACHE_MAX_BYTES and evicts least recently
+    used files first (mtime is bumped on every hit). Files pinned by a running
+    session are never evicted.
+    """
+
+    def __init__(self):
+        self._pins = {}
+        self._locks = {}
+        self._lock_users = {}
+
+    @property
+    def directory(self):
+        path = os.getenv("EPISODE_CACHE_DIR", "episode_cache")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    # ---------------- KEYS / PATHS ----------------
+    @staticmethod
+    def key(internal_id, episode, quality):
+        raw = f"{internal_id}:{int(episode)}:{quality}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _final_path(self, key):
+        return os.path.join(self.directory, f"{key}.mp4")
+
+    def _part_path(self, key):
+        return self._final_path(key) + ".part"
+
+    # ---------------- LOOKUP ----------------
+    def lookup(self, key):
+        """Path of the complete file, or None. A hit refreshes its LRU position."""
+        path = self._final_path(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    # ---------------- PINNING ----------------
+    @asynccontextmanager
+    async def pin(self, key):
+        """Keep an entry (complete or partial) safe from eviction while in use"""
+        self._pins[key] = self._pins.get(key, 0) + 1
+        try:
+            yield key
+        finally:
+            self._pins[key] -= 1
+            if self._pins[key] <= 0:
+                self._pins.pop(key, None)
+
+    def pinned(self, key):
+        return key in self._pins
+
+    @asynccontextmanager
+    async def writer(self, key):
+        """
+        Exclusive access to an entry's .part file.
+        Two sessions fetching the same episode queue up here; the second one
+        normally finds the complete file on its re-check and skips the CDN.
+        """
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        # Counts holders and waiters, so the lock is only dropped once nobody can still use it
+        self._lock_users[key] = self._lock_users.get(key, 0) + 1
+        try:
+            async with self.pin(key):
+                async with lock:
+                    yield self._part_path(key)
+        finally:
+            self._lock_users[key] -= 1
+            if self._lock_users[key] <= 0:
+                self._lock_users.pop(key, None)
+                self._locks.pop(key, None)
+
+    def commit(self, key):
+        """Promote a finished .part file to a cache hit"""
+        final = self._final_path(key)
+        os.replace(self._part_path(key), final)
+        return final
+
+    # ---------------- EVICTION ----------------
+    def _evict_sync(self, max_bytes):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            total += st.st_size
+            entries.append((st.st_mtime, st.st_size, name.split(".")[0], path))
+
+        freed = 0
+        for _, size, key, path in sorted(entries):
+            if total - freed <= max_bytes:
+                break
+            if self.pinned(key):
+                continue
+            try:
+                os.remove(path)
+                freed += size
+            except FileNotFoundError:
+                pass
+        if freed:
+            print(f"🧹 Episode cache evicted {freed / 1024 / 1024:.2f} MB")
+        return freed
+
+    async def evict(self):
+        """Trim the cache back under its size cap (runs in a thread)"""
+        max_bytes = env_int("EPISODE_CACHE_MAX_BYTES", 20 * 1024 ** 3)
+        return await asyncio.to_thread(self._evict_sync, max_bytes)
+
+    def usage(self):
+        """(bytes used, file count) for metrics"""
+        total = 0
+        count = 0
+        for name in os.listdir(self.directory):
+            try:
+                total += os.path.getsize(os.path.join(self.directory, name))
+                count += 1
+            except FileNotFoundError:
+                pass
+        return total, count
+
+
+# Global episode cache
+episode_cache = EpisodeCache()
@@ -0,0 +1,161 @@
+import os
+import asyncio
+import tempfile
+from email.utils import formatdate, parsedate_to_datetime
+from urllib.parse import quote
+from fastapi.responses import Response, FileResponse, StreamingResponse
+
+DOWNLOADS_DIR = "downloads"
+CHUNK_SIZE = 1024 * 1024
+
+
+def _serve_mode():
+    """direct (Python streams the file), x-accel (nginx) or x-sendfile (apache/caddy/lighttpd)"""
+    return os.getenv("FILE_SERVE_MODE", "direct").lower()
+
+
+def _internal_roots():
+    """Directories the proxy can serve, by the name used in the internal URI"""
+    return {
+        "downloads": os.path.abspath(DOWNLOADS_DIR),
+        "zips": os.path.abspath(tempfile.gettempdir()),
+    }
+
+
+def internal_uri(path):
+    """
+    Map a local file to the proxy's internal location, e.g.
+    downloads/x.mp4 -> /protected/downloads/x.mp4. None if not servable.
+    """
+    prefix = os.getenv("X_ACCEL_PREFIX", "/protected").rstrip("/")
+    path = os.path.abspath(path)
+    for name, root in _internal_roots().items():
+        if os.path.commonpath([path, root]) == root:
+            relative = os.path.relpath(path, root).replace(os.sep, "/")
+            return f"{prefix}/{name}/{quote(relative)}"
+    return None
+
+
+def content_disposition(filename, disposition="attachment"):
+    # Headers are latin-1: plain filename as an ASCII fallback, the real one in filename*
+    fallback = filename.encode("ascii", "replace").decode("ascii").replace('"', "")
+    return f"{disposition}; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename)}"
+
+
+def _etag(st):
+    return f'"{int(st.st_mtime_ns):x}-{st.st_size:x}"'
+
+
+def _not_modified(headers, etag, mtime):
+    if_none_match = headers.get("if-none-match")
+    if if_none_match:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or etag in tags or f"W/{etag}" in tags
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _parse_range(value, size):
+    """
+    Single `bytes=` range -> (start, end) inclusive.
+    None when the header should be ignored (malformed / multi-range),
+    False when it can't be satisfied.
+    """
+    if not value or not value.startswith("bytes=") or "," in value:
+        return None
+    start, _, end = value[6:].strip().partition("-")
+    try:
+        if not start:
+            # Suffix range: last N bytes
+            length = int(end)
+            if length <= 0 or size == 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else None
+    except ValueError:
+        return None
+    # Checked first: bytes=<size>- (resuming a finished file) must be a 416, not the whole body
+    if start >= size:
+        return False
+    if end is None:
+        return start, size - 1
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+async def _read_range(path, start, end):
+    with open(path, "rb") as f:
+        await asyncio.to_thread(f.seek, start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = await asyncio.to_thread(f.read, min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+def serve_file(request, path, filename, media_type="application/octet-stream"):
+    """
+    Send a local file to the client.
+
+    With FILE_SERVE_MODE=x-accel or x-sendfile only headers are returned and
+    the fronting proxy streams the bytes, so no worker is tied up for the
+    length of the download. Direct mode handles ETag / Last-Modified
+    (304 on a match) and single byte ranges itself.
+    """
+    st = os.stat(path)
+    headers = {
+        "Content-Disposition": content_disposition(filename),
+        "Accept-Ranges": "bytes",
+        "ETag": _etag(st),
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+    }
+
+    mode = _serve_mode()
+    if mode == "x-accel":
+        uri = internal_uri(path)
+        if uri:
+            # nginx answers conditionals and ranges for the internal file itself
+            return Response(
+                headers={"X-Accel-Redirect": uri, "Content-Disposition": headers["Content-Disposition"]},
+                media_type=media_type,
+            )
+        print(f"⚠️ {path} is outside the X-Accel roots, serving directly")
+    elif mode == "x-sendfile":
+        return Response(
+            headers={"X-Sendfile": os.path.abspath(path), "Content-Disposition": headers["Content-Disposition"]},
+            media_type=media_type,
+        )
+
+    if _not_modified(request.headers, headers["ETag"], st.st_mtime):
+        return Response(status_code=304, headers={k: headers[k] for k in ("ETag", "Last-Modified")})
+
+    byte_range = _parse_range(request.headers.get("range"), st.st_size)
+    if_range = request.headers.get("if-range")
+    if byte_range is not None and if_range and if_range not in (headers["ETag"], headers["Last-Modified"]):
+        # The client's partial copy is stale: send the whole file
+        byte_range = None
+
+    if byte_range is False:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{st.st_size}"})
+
+    if byte_range:
+        start, end = byte_range
+        headers["Content-Range"] = f"bytes {start}-{end}/{st.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(
+            _read_range(path, start, end),
+            status_code=206,
+            media_type=media_type,
+            headers=headers,
+        )
+
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=st)
@@ -0,0 +1,79 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from utils.helper import env_int
+
+
+class ChunkWriter:
+    """
+    Writes downloaded chunks on a dedicated thread so network reads and disk
+    writes overlap instead of every f.write() blocking the event loop.
+
+    Chunks go through a bounded queue: when the disk falls behind, write()
+    waits, which in turn slows the network read (backpressure).
+
+        async with ChunkWriter(path, "ab") as writer:
+            async for chunk in response.aiter_bytes():
+                await writer.write(chunk)
+    """
+
+    def __init__(self, path, mode="wb", max_pending=None):
+        self._path = path
+        self._mode = mode
+        self._queue = asyncio.Queue(maxsize=max_pending or env_int("WRITE_QUEUE_CHUNKS", 8))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="writer")
+        self._file = None
+        self._task = None
+
+    async def __aenter__(self):
+        loop = asyncio.get_running_loop()
+        self._file = await loop.run_in_executor(self._executor, open, self._path, self._mode)
+        self._task = asyncio.create_task(self._drain())
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        loop = asyncio.get_running_loop()
+        try:
+            # Flush whatever is queued, even on failure, so resume offsets
+            # computed from the file size stay truthful
+            await self._put(None)
+            await self._task
+        finally:
+            await loop.run_in_executor(self._executor, self._file.close)
+            self._executor.shutdown(wait=False)
+
+    async def write(self, chunk, offset=None, on_written=None):
+        """
+        Queue a chunk. With `offset` the chunk is written at that position
+        (segmented downloads); on_written(len) runs on the loop once it is on disk.
+        """
+        await self._put((chunk, offset, on_written))
+
+    async def _put(self, item):
+        """Queue an item, or raise the writer's error if it died while we waited"""
+        if self._task.done():
+            self._task.result()
+            if item is None:
+                return
+            raise RuntimeError("Writer already closed")
+        put = asyncio.ensure_future(self._queue.put(item))
+        await asyncio.wait({put, self._task}, return_when=asyncio.FIRST_COMPLETED)
+        if not put.done():
+            put.cancel()
+            # Writer thread failed; surface its error to the downloader
+            self._task.result()
+
+    def _write_sync(self, chunk, offset):
+        if offset is not None:
+            self._file.seek(offset)
+        self._file.write(chunk)
+
+    async def _drain(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            chunk, offset, on_written = item
+            await loop.run_in_executor(self._executor, self._write_sync, chunk, offset)
+            if on_written:
+                on_written(len(chunk))
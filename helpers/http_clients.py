@@ -0,0 +1,100 @@
+import importlib.util
+import httpx
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from utils.helper import env_int, env_float, env_bool
+
+# One long-lived pool per upstream host. Every hop of the
+# animepahe -> pahe.win -> kwik chain reuses warm keep-alive connections
+# instead of paying a fresh TCP+TLS handshake per call.
+UPSTREAMS = ("animepahe", "animepahe_img", "pahe", "kwik", "kwik_api", "cdn")
+
+# Global client registry (filled in by init_http_clients on startup)
+clients: dict[str, httpx.AsyncClient] = {}
+
+
+def _http2_available():
+    return importlib.util.find_spec("h2") is not None
+
+
+def _no_store_cookies():
+    """
+    Cookie jar that never keeps Set-Cookie headers from responses.
+    The pools are shared by every request, so cookies (animepahe's DDoS-Guard
+    cookies, kwik_session) are always passed per request instead of leaking
+    from one user's request into the next.
+    Returned as a raw CookieJar: the client wraps it as-is, while wrapping an
+    httpx.Cookies would copy it into a fresh jar and drop the policy.
+    """
+    return CookieJar(policy=DefaultCookiePolicy(allowed_domains=[]))
+
+
+def with_cookies(cookies, headers=None):
+    """
+    Request headers carrying `cookies` as a Cookie header.
+    httpx deprecates per-request cookies= on a client; a header goes out with
+    this request only and never touches the shared client's jar.
+    """
+    headers = dict(headers or {})
+    if cookies:
+        headers["Cookie"] = "; ".join(f"{name}={value}" for name, value in cookies.items())
+    return headers
+
+
+def _build_client(name: str) -> httpx.AsyncClient:
+    """
+    Build the pooled client for one upstream.
+    Limits can be tuned globally (HTTP_MAX_CONNECTIONS) or per upstream
+    (HTTP_KWIK_MAX_CONNECTIONS, ...).
+    """
+    prefix = f"HTTP_{name.upper()}_"
+    max_connections = env_int(prefix + "MAX_CONNECTIONS", env_int("HTTP_MAX_CONNECTIONS", 20))
+    max_keepalive = env_int(prefix + "MAX_KEEPALIVE", env_int("HTTP_MAX_KEEPALIVE", 10))
+    keepalive_expiry = env_float("HTTP_KEEPALIVE_EXPIRY", 30.0)
+    http2 = env_bool("HTTP2_ENABLED", True) and _http2_available()
+
+    return httpx.AsyncClient(
+        http2=http2,
+        limits=httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry,
+        ),
+        timeout=httpx.Timeout(env_float("HTTP_TIMEOUT", 30.0), connect=10.0),
+        cookies=_no_store_cookies(),
+    )
+
+
+async def init_http_clients():
+    """
+    Create the upstream connection pools.
+    Called on FastAPI startup.
+    """
+    if not _http2_available():
+        print("⚠️ h2 not installed, upstream pools will use HTTP/1.1")
+    for name in UPSTREAMS:
+        if name not in clients:
+            clients[name] = _build_client(name)
+    print(f"✅ HTTP pools ready: {', '.join(UPSTREAMS)}")
+
+
+async def close_http_clients():
+    """Close every upstream pool on shutdown."""
+    for name, client in list(clients.items()):
+        await client.aclose()
+        clients.pop(name, None)
+    print("🔌 HTTP pools closed")
+
+
+def get_client(name: str) -> httpx.AsyncClient:
+    """
+    Return the pooled client for an upstream.
+    Falls back to creating the pool lazily when used outside the app lifespan
+    (scripts, experiments).
+    """
+    if name not in UPSTREAMS:
+        raise KeyError(f"Unknown upstream: {name}")
+    client = clients.get(name)
+    if client is None or client.is_closed:
+        client = _build_client(name)
+        clients[name] = client
+    return client
@@ -0,0 +1,246 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+from collections import OrderedDict
+from urllib.parse import urlparse
+from helpers.anime_helper import get_animepahe_cookies
+from helpers.http_clients import get_client, with_cookies
+from helpers.scheduler import get_scheduler
+from utils.helper import env_int, env_float
+
+IMAGE_CHUNK = 64 * 1024
+
+
+class ImageTooLarge(Exception):
+    """The upstream image is bigger than IMAGE_MAX_BYTES"""
+
+
+def allowed_image_url(url):
+    """Only http(s) URLs on an IMAGE_PROXY_HOSTS host (or a subdomain of one) are proxied"""
+    try:
+        parsed = urlparse(url)
+    except ValueError:
+        return False
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme not in ("http", "https") or not host:
+        return False
+    allowed = [h.strip().lower() for h in os.getenv("IMAGE_PROXY_HOSTS", "animepahe.si").split(",") if h.strip()]
+    return any(host == h or host.endswith("." + h) for h in allowed)
+
+
+class ImageFetch:
+    """
+    One upstream image fetch shared by every request that missed the cache.
+    Chunks are kept as they arrive so each reader streams from the start
+    while the fetch continues, even if the request that started it is gone.
+    """
+
+    def __init__(self):
+        self.status = None
+        self.content_type = None
+        self.etag = None
+        self.error = None
+        self.ready = asyncio.Event()
+        self._chunks = []
+        self._done = False
+        self._changed = asyncio.Condition()
+
+    async def _append(self, chunk):
+        async with self._changed:
+            self._chunks.append(chunk)
+            self._changed.notify_all()
+
+    async def _finish(self, error=None):
+        self.error = error
+        self.ready.set()
+        async with self._changed:
+            self._done = True
+            self._changed.notify_all()
+
+    async def stream(self):
+        index = 0
+        while True:
+            async with self._changed:
+                await self._changed.wait_for(lambda: index < len(self._chunks) or self._done)
+            while index < len(self._chunks):
+                yield self._chunks[index]
+                index += 1
+            if self._done and index >= len(self._chunks):
+                if self.error:
+                    raise self.error
+                return
+
+
+class ImageCache:
+    """
+    Cache for /anime/proxy-image.
+
+    Hot images live in an in-memory LRU (IMAGE_CACHE_MEMORY_BYTES); every
+    image is also kept on disk in IMAGE_CACHE_DIR, trimmed least recently
+    used first to IMAGE_CACHE_MAX_BYTES. Entries older than IMAGE_CACHE_TTL
+    are fetched again. Concurrent misses for one URL share a single fetch.
+    Images over IMAGE_MAX_BYTES are refused and never cached.
+    """
+
+    def __init__(self):
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._fetches = {}
+        self._last_evict = 0.0
+
+    @property
+    def directory(self):
+        path = os.getenv("IMAGE_CACHE_DIR", "image_cache")
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    @staticmethod
+    def key(url):
+        return hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+
+    def _paths(self, key):
+        base = os.path.join(self.directory, key)
+        return base + ".img", base + ".json"
+
+    # ---------------- LOOKUP ----------------
+    def _remember(self, key, entry):
+        """Add to the memory LRU, dropping the coldest entries past the budget"""
+        if key in self._memory:
+            self._memory_bytes -= len(self._memory.pop(key)["body"])
+        self._memory[key] = entry
+        self._memory_bytes += len(entry["body"])
+        budget = env_int("IMAGE_CACHE_MEMORY_BYTES", 32 * 1024 * 1024)
+        while self._memory_bytes > budget and self._memory:
+            _, old = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old["body"])
+
+    def _read_disk(self, key):
+        body_path, meta_path = self._paths(key)
+        try:
+            with open(meta_path) as f:
+                meta = json.load(f)
+            with open(body_path, "rb") as f:
+                body = f.read()
+            os.utime(body_path)
+        except (FileNotFoundError, ValueError):
+            return None
+        return {**meta, "body": body}
+
+    async def get(self, url):
+        """Cached entry {body, content_type, etag, fetched_at} or None"""
+        key = self.key(url)
+        ttl = env_float("IMAGE_CACHE_TTL", 7 * 24 * 3600.0)
+        entry = self._memory.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._read_disk, key)
+        if entry is None or time.time() - entry["fetched_at"] > ttl:
+            return None
+        self._remember(key, entry)
+        return entry
+
+    # ---------------- FETCH ----------------
+    def fetch(self, url):
+        """Start (or join) the upstream fetch for a cache miss"""
+        key = self.key(url)
+        fetch = self._fetches.get(key)
+        if fetch is None:
+            fetch = ImageFetch()
+            self._fetches[key] = fetch
+            task = asyncio.create_task(self._fetch(url, key, fetch))
+            task.add_done_callback(lambda _: self._fetches.pop(key, None))
+        return fetch
+
+    async def _fetch(self, url, key, fetch):
+        scheduler = get_scheduler("animepahe_img")
+        max_bytes = env_int("IMAGE_MAX_BYTES", 5 * 1024 * 1024)
+        fetched_at = time.time()
+        size = 0
+        try:
+            cookies = await get_animepahe_cookies()
+            async with scheduler.slot():
+                async with get_client("animepahe_img").stream("GET", url, headers=with_cookies(cookies), timeout=10) as response:
+                    scheduler.record_response(response.status_code)
+                    length = response.headers.get("content-length")
+                    if response.status_code == 200 and length and length.isdigit() and int(length) > max_bytes:
+                        fetch.status = 413
+                    else:
+                        fetch.status = response.status_code
+                    fetch.content_type = response.headers.get("content-type", "image/jpeg")
+                    # Known before the body, so the first (streamed) response can carry it too
+                    fetch.etag = f'"{key[:16]}-{int(fetched_at * 1000):x}"'
+                    fetch.ready.set()
+                    if fetch.status != 200:
+                        await fetch._finish()
+                        return
+                    async for chunk in response.aiter_bytes(IMAGE_CHUNK):
+                        size += len(chunk)
+                        if size > max_bytes:
+                            raise ImageTooLarge(f"{url} is over {max_bytes} bytes")
+                        await fetch._append(chunk)
+        except Exception as e:
+            print(f"Error proxying image: {e}")
+            await fetch._finish(e)
+            return
+
+        entry = {
+            "body": b"".join(fetch._chunks),
+            "content_type": fetch.content_type,
+            "etag": fetch.etag,
+            "fetched_at": fetched_at,
+        }
+        # In memory before readers are released, so the next request is a hit
+        self._remember(key, entry)
+        await fetch._finish()
+        try:
+            await asyncio.to_thread(self._write_disk, key, entry)
+            await self._maybe_evict()
+        except OSError as e:
+            print(f"⚠️ Could not cache image on disk: {e}")
+
+    # ---------------- DISK ----------------
+    def _write_disk(self, key, entry):
+        body_path, meta_path = self._paths(key)
+        with open(body_path + ".tmp", "wb") as f:
+            f.write(entry["body"])
+        os.replace(body_path + ".tmp", body_path)
+        meta = {name: entry[name] for name in ("content_type", "etag", "fetched_at")}
+        with open(meta_path + ".tmp", "w") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
+
+    def _evict_sync(self, max_bytes):
+        entries = []
+        total = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".img"):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            total += st.st_size
+            entries.append((st.st_mtime, st.st_size, path))
+
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            for victim in (path, path[:-len(".img")] + ".json"):
+                try:
+                    os.remove(victim)
+                except FileNotFoundError:
+                    pass
+            total -= size
+
+    async def _maybe_evict(self):
+        # Listing the directory after every poster would be wasteful; trim periodically
+        if time.time() - self._last_evict < 30:
+            return
+        self._last_evict = time.time()
+        await asyncio.to_thread(self._evict_sync, env_int("IMAGE_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+
+
+# Global proxy-image cache
+image_cache = ImageCache()
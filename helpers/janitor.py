@@ -0,0 +1,306 @@
+import os
+import time
+import shutil
+import asyncio
+import tempfile
+from datetime import datetime
+import aiosqlite
+from db import DB_PATH
+from helpers.archive import ZIP_TEMP_PREFIX
+from helpers.episode_cache import episode_cache
+from helpers.download_jobs import download_jobs
+from utils.helper import env_int, env_float
+
+DOWNLOADS_DIR = "downloads"
+
+
+def _dir_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
+    return total
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    else:
+        os.remove(path)
+
+
+class StorageJanitor:
+    """
+    Background reclaimer for everything the service writes to disk:
+      downloads/        /dl/* videos (videos table)
+      episode cache     shared bulk-download episodes
+      animezip_* dirs   bulk ZIPs in the temp dir (zip_cache table)
+
+    Each pass removes expired artifacts (TTL), orphans nothing references
+    any more, and rows pointing at missing files, then evicts the least
+    recently used artifacts until total usage is under STORAGE_QUOTA_BYTES.
+    Anything a running job is using is never touched. Old download_sessions
+    rows are pruned as well. Filesystem work runs in a thread.
+    """
+
+    def __init__(self):
+        self._task = None
+        self._lock = asyncio.Lock()
+        self._last_run = None
+        self._totals = {
+            "runs": 0,
+            "expired": 0,
+            "orphaned": 0,
+            "evicted": 0,
+            "bytes_freed": 0,
+            "rows_removed": 0,
+            "sessions_pruned": 0,
+        }
+
+    # ---------------- LIFECYCLE ----------------
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Storage janitor pass failed: {e}")
+            await asyncio.sleep(env_float("JANITOR_INTERVAL", 300.0))
+
+    # ---------------- PASS ----------------
+    async def run_once(self):
+        """One cleanup pass; returns its report"""
+        async with self._lock:
+            started = time.time()
+            config = {
+                "quota": env_int("STORAGE_QUOTA_BYTES", 50 * 1024 ** 3),
+                "downloads_ttl": env_float("DOWNLOADS_TTL", 24 * 3600.0),
+                "part_ttl": env_float("EPISODE_PART_TTL", 24 * 3600.0),
+                "orphan_grace": env_float("JANITOR_ORPHAN_GRACE", 3600.0),
+            }
+
+            async with aiosqlite.connect(DB_PATH) as db:
+                db.row_factory = aiosqlite.Row
+                cursor = await db.execute("SELECT filepath, short_code FROM videos")
+                videos = {os.path.abspath(row["filepath"]): row["short_code"] for row in await cursor.fetchall()}
+                cursor = await db.execute("SELECT session_id, zip_path, expires_at FROM zip_cache")
+                zips = {
+                    os.path.abspath(row["zip_path"]): (row["session_id"], datetime.fromisoformat(str(row["expires_at"])))
+                    for row in await cursor.fetchall()
+                }
+
+            # Directories of jobs still downloading / zipping
+            active = [job for job in download_jobs.values() if not job.finished]
+            active_dirs = {os.path.abspath(job.temp_dir) for job in active if job.temp_dir}
+
+            report = await asyncio.to_thread(self._sweep_sync, videos, zips, active_dirs, config)
+
+            session_ttl = env_float("DOWNLOAD_SESSION_TTL", 24 * 3600.0)
+            active_sessions = [job.session_id for job in active]
+            async with aiosqlite.connect(DB_PATH) as db:
+                await db.executemany(
+                    "DELETE FROM videos WHERE short_code = ?",
+                    [(code,) for code in report.pop("videos_removed")]
+                )
+                await db.executemany(
+                    "DELETE FROM zip_cache WHERE session_id = ?",
+                    [(session_id,) for session_id in report.pop("zips_removed")]
+                )
+                # Sessions outlive their ZIP only so late clients can reattach
+                placeholders = ",".join("?" * len(active_sessions)) or "''"
+                cursor = await db.execute(
+                    f"""DELETE FROM download_sessions
+                        WHERE created_at < datetime('now', ?)
+                        AND session_id NOT IN (SELECT session_id FROM zip_cache)
+                        AND session_id NOT IN ({placeholders})""",
+                    (f"-{int(session_ttl)} seconds", *active_sessions)
+                )
+                report["sessions_pruned"] = cursor.rowcount
+                # Media cache entries past their TTL (or whose video is gone)
+                await db.execute(
+                    """DELETE FROM media_cache
+                       WHERE expires_at < ? OR short_code NOT IN (SELECT short_code FROM videos)""",
+                    (time.time(),)
+                )
+                await db.commit()
+
+            report["duration"] = round(time.time() - started, 3)
+            report["finished_at"] = datetime.now().isoformat()
+            self._last_run = report
+
+            self._totals["runs"] += 1
+            for name in ("expired", "orphaned", "evicted", "bytes_freed", "rows_removed", "sessions_pruned"):
+                self._totals[name] += report[name]
+
+            if report["bytes_freed"] or report["rows_removed"] or report["sessions_pruned"]:
+                print(
+                    f"🧹 Janitor freed {report['bytes_freed'] / 1024 / 1024:.2f} MB "
+                    f"({report['expired']} expired, {report['orphaned']} orphaned, {report['evicted']} evicted), "
+                    f"{report['rows_removed']} dangling rows, {report['sessions_pruned']} old sessions"
+                )
+            return report
+
+    def _sweep_sync(self, videos, zips, active_dirs, config):
+        now = time.time()
+        report = {
+            "expired": 0,
+            "orphaned": 0,
+            "evicted": 0,
+            "bytes_freed": 0,
+            "rows_removed": 0,
+            "videos_removed": [],
+            "zips_removed": [],
+            "usage": {},
+        }
+        # Evictable artifacts: [last_used, size, kind, path, ref]
+        candidates = []
+
+        def account(kind, size):
+            usage = report["usage"].setdefault(kind, {"bytes": 0, "files": 0})
+            usage["bytes"] += size
+            usage["files"] += 1
+
+        def reclaim(reason, kind, path, size, ref=None):
+            try:
+                _remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"⚠️ Janitor could not remove {path}: {e}")
+                return False
+            report[reason] += 1
+            report["bytes_freed"] += size
+            usage = report["usage"][kind]
+            usage["bytes"] -= size
+            usage["files"] -= 1
+            if ref and kind == "downloads":
+                report["videos_removed"].append(ref)
+            if ref and kind == "zips":
+                report["zips_removed"].append(ref)
+            return True
+
+        # ---- downloads/ ----
+        if os.path.isdir(DOWNLOADS_DIR):
+            for name in os.listdir(DOWNLOADS_DIR):
+                path = os.path.abspath(os.path.join(DOWNLOADS_DIR, name))
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                account("downloads", st.st_size)
+                age = now - st.st_mtime
+                code = videos.get(path)
+                if code is None:
+                    # No row: leftover of a failed download (or one still running, hence the grace)
+                    if age > config["orphan_grace"]:
+                        reclaim("orphaned", "downloads", path, st.st_size)
+                elif age > config["downloads_ttl"]:
+                    reclaim("expired", "downloads", path, st.st_size, code)
+                else:
+                    candidates.append([max(st.st_atime, st.st_mtime), st.st_size, "downloads", path, code])
+
+        for path, code in videos.items():
+            # Files reclaimed above are already queued for row removal
+            if not os.path.exists(path) and code not in report["videos_removed"]:
+                report["videos_removed"].append(code)
+                report["rows_removed"] += 1
+
+        # ---- bulk ZIP temp dirs ----
+        zip_dirs = {os.path.dirname(path): (path, *entry) for path, entry in zips.items()}
+        temp_root = tempfile.gettempdir()
+        for name in os.listdir(temp_root):
+            if not name.startswith(ZIP_TEMP_PREFIX):
+                continue
+            path = os.path.abspath(os.path.join(temp_root, name))
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            size = _dir_size(path)
+            account("zips", size)
+            if path in active_dirs:
+                continue
+            entry = zip_dirs.get(path)
+            if entry is None:
+                # ZIP dir no session points at: crashed or cancelled job
+                if now - st.st_mtime > config["orphan_grace"]:
+                    reclaim("orphaned", "zips", path, size)
+                continue
+            zip_path, session_id, expires_at = entry
+            if expires_at < datetime.now():
+                reclaim("expired", "zips", path, size, session_id)
+            else:
+                last_used = st.st_mtime
+                try:
+                    zst = os.stat(zip_path)
+                    last_used = max(zst.st_atime, zst.st_mtime)
+                except FileNotFoundError:
+                    pass
+                candidates.append([last_used, size, "zips", path, session_id])
+
+        for zip_path, (session_id, _) in zips.items():
+            if not os.path.exists(zip_path) and session_id not in report["zips_removed"]:
+                report["zips_removed"].append(session_id)
+                report["rows_removed"] += 1
+
+        # ---- episode cache ----
+        cache_dir = episode_cache.directory
+        for name in os.listdir(cache_dir):
+            path = os.path.join(cache_dir, name)
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                continue
+            account("episode_cache", st.st_size)
+            key = name.split(".")[0]
+            if episode_cache.pinned(key):
+                continue
+            if name.endswith(".mp4"):
+                candidates.append([st.st_mtime, st.st_size, "episode_cache", path, None])
+            elif now - st.st_mtime > config["part_ttl"]:
+                # Abandoned partial download (.part / .segments)
+                reclaim("expired", "episode_cache", path, st.st_size)
+
+        # ---- quota: least recently used first ----
+        total = sum(usage["bytes"] for usage in report["usage"].values())
+        for last_used, size, kind, path, ref in sorted(candidates):
+            if total <= config["quota"]:
+                break
+            if kind == "episode_cache" and episode_cache.pinned(os.path.basename(path).split(".")[0]):
+                continue
+            if reclaim("evicted", kind, path, size, ref):
+                total -= size
+
+        report["total_bytes"] = total
+        report["quota_bytes"] = config["quota"]
+        return report
+
+    # ---------------- METRICS ----------------
+    def metrics(self):
+        return {
+            "quota_bytes": env_int("STORAGE_QUOTA_BYTES", 50 * 1024 ** 3),
+            "interval": env_float("JANITOR_INTERVAL", 300.0),
+            "last_run": self._last_run,
+            "totals": dict(self._totals),
+        }
+
+
+# Global storage janitor
+storage_janitor = StorageJanitor()
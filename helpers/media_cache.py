@@ -0,0 +1,127 @@
+import os
+import re
+import json
+import time
+import asyncio
+import hashlib
+from functools import lru_cache
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+from utils.helper import env_float
+
+# Share/tracking parameters that never change which video a link points to
+TRACKING_PARAMS = {
+    "si", "feature", "pp", "igsh", "igshid", "fbclid", "gclid", "mibextid",
+    "is_from_webapp", "sender_device", "sender_web_id", "is_copy_url",
+    "share_app_id", "share_link_id", "share_item_id", "social_sharing",
+    "rdid", "ref", "source", "_r", "_t", "t",
+}
+HOST_PREFIXES = ("www.", "m.", "mobile.", "web.")
+
+
+def canonical_url(url):
+    """
+    Normalise a share link so variants of the same video compare equal:
+    https, lower-case host without www./m., no fragment, no tracking params,
+    no trailing slash, youtu.be/<id> -> youtube.com/watch?v=<id>.
+    """
+    url = url.strip()
+    if "://" not in url:
+        url = "https://" + url
+    parts = urlsplit(url)
+    host = parts.netloc.lower()
+    for prefix in HOST_PREFIXES:
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = parts.path.rstrip("/") or "/"
+    query = [
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if key.lower() not in TRACKING_PARAMS and not key.lower().startswith("utm_")
+    ]
+
+    if host == "youtu.be" and path.strip("/"):
+        query = [("v", path.strip("/"))] + [(k, v) for k, v in query if k != "v"]
+        host, path = "youtube.com", "/watch"
+    shorts = re.match(r"^/shorts/([\w-]+)$", path)
+    if host == "youtube.com" and shorts:
+        query = [("v", shorts.group(1))] + [(k, v) for k, v in query if k != "v"]
+        path = "/watch"
+
+    return urlunsplit(("https", host, path, urlencode(sorted(query)), ""))
+
+
+@lru_cache(maxsize=1)
+def _extractor_classes():
+    from yt_dlp.extractor import gen_extractor_classes
+    return [ie for ie in gen_extractor_classes() if ie.ie_key() != "Generic"]
+
+
+@lru_cache(maxsize=4096)
+def media_key_sync(url):
+    """
+    yt-dlp style `extractor:id` for a URL without touching the network
+    (the extractor's own URL pattern + get_temp_id). Falls back to a hash
+    of the canonical URL when no extractor can tell the ID offline.
+    """
+    canonical = canonical_url(url)
+    for candidate in (canonical, url):
+        for ie in _extractor_classes():
+            if ie.suitable(candidate):
+                video_id = ie.get_temp_id(candidate)
+                if video_id:
+                    return f"{ie.ie_key().lower()}:{video_id}"
+                break
+    return "url:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:32]
+
+
+async def media_key(url):
+    return await asyncio.to_thread(media_key_sync, url)
+
+
+def info_key(info):
+    """Cache key from a finished extraction (what yt-dlp itself calls the video)"""
+    extractor = info.get("extractor_key") or info.get("extractor")
+    if extractor and info.get("id"):
+        return f"{extractor.lower()}:{info['id']}"
+    return None
+
+
+async def lookup_media(db, key):
+    """
+    Cached result for a media key, or None.
+    The entry only counts while its videos row and file still exist.
+    """
+    cursor = await db.execute(
+        """SELECT m.info, v.short_code, v.filepath
+           FROM media_cache m JOIN videos v ON v.short_code = m.short_code
+           WHERE m.cache_key = ? AND m.expires_at > ?""",
+        (key, time.time())
+    )
+    row = await cursor.fetchone()
+    if not row:
+        return None
+    if not os.path.exists(row["filepath"]):
+        await db.execute("DELETE FROM media_cache WHERE short_code = ?", (row["short_code"],))
+        await db.commit()
+        return None
+    return {
+        "status": 200,
+        **json.loads(row["info"]),
+        "short": row["short_code"],
+        "path": row["filepath"],
+    }
+
+
+async def store_media(db, keys, info):
+    """Remember a finished download under every key it is known by"""
+    ttl = env_float("MEDIA_CACHE_TTL", 6 * 3600.0)
+    payload = json.dumps({
+        "channel_info": info.get("channel_info"),
+        "video_info": info.get("video_info"),
+        "download_url": info.get("download_url"),
+    })
+    await db.executemany(
+        """INSERT OR REPLACE INTO media_cache (cache_key, short_code, info, expires_at)
+           VALUES (?, ?, ?, ?)""",
+        [(key, info["short"], payload, time.time() + ttl) for key in set(keys) if key]
+    )
+    await db.commit()
@@ -0,0 +1,82 @@
+import uuid
+import time
+import asyncio
+import aiosqlite
+from db import DB_PATH
+from helpers.download import cached_video_download, public_info
+from helpers.progress import ProgressChannel
+from utils.helper import env_float
+
+
+class MediaJob(ProgressChannel):
+    """
+    A /dl/* download running in the background (mode=async).
+    Clients poll its state or follow the progress channel over SSE; the
+    final download_url is published with the 'complete' message.
+    """
+
+    def __init__(self, url, platform):
+        super().__init__()
+        self.job_id = uuid.uuid4().hex
+        self.url = url
+        self.platform = platform
+        self.created_at = time.time()
+        self.result = None
+        self.task = None
+
+    def status(self):
+        latest = self._status or {"status": "queued", "message": "Waiting for a download slot"}
+        return {
+            "status": 200,
+            "job_id": self.job_id,
+            "platform": self.platform,
+            "state": latest.get("status"),
+            "progress": latest,
+            "result": self.result,
+        }
+
+
+# Running and recently finished media jobs, keyed by job_id
+media_jobs: dict[str, MediaJob] = {}
+
+
+def get_media_job(job_id):
+    return media_jobs.get(job_id)
+
+
+def start_media_job(url, platform):
+    job = MediaJob(url, platform)
+    media_jobs[job.job_id] = job
+    job.task = asyncio.create_task(_run_media_job(job))
+
+    def forget(_):
+        # Keep the finished job around so pollers can still fetch the result
+        retention = env_float("MEDIA_JOB_RETENTION", 600.0)
+        asyncio.get_running_loop().call_later(retention, media_jobs.pop, job.job_id, None)
+
+    job.task.add_done_callback(forget)
+    return job
+
+
+async def _run_media_job(job):
+    try:
+        async with aiosqlite.connect(DB_PATH) as db:
+            db.row_factory = aiosqlite.Row
+            info = await cached_video_download(job.url, db, job.platform, listener=job)
+    except Exception as e:
+        print(f"❌ Media job {job.job_id} failed: {e}")
+        info = {"status": 500, "message": "Internal Server error"}
+
+    if info and info.get("status") == 200:
+        job.result = public_info(info)
+        job.publish({
+            **job.result,
+            "status": "complete",
+            "message": "Download ready!"
+        })
+    else:
+        job.publish({
+            "status": "error",
+            "code": info.get("status", 500) if info else 500,
+            "message": info.get("message", "No info available") if info else "No info available"
+        })
@@ -0,0 +1,183 @@
+import uuid
+import asyncio
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from utils.helper import env_int
+
+
+class MediaQueueFull(Exception):
+    """Raised when MEDIA_QUEUE_LIMIT downloads are already waiting"""
+
+
+def _warm_worker():
+    """Runs once per worker process: pay yt-dlp's import + extractor load up front"""
+    try:
+        import yt_dlp
+        from yt_dlp.extractor import gen_extractor_classes
+        from helpers import download
+        gen_extractor_classes()
+        # Builds (and discards) a YoutubeDL with the shared options so option parsing is warm too
+        yt_dlp.YoutubeDL(dict(download.BASE_OPTIONS, quiet=True)).close()
+    except Exception as e:
+        # A failing initializer would break the whole pool; the download reports the real error
+        print(f"⚠️ Media worker warm-up failed: {e}")
+
+
+def _ping():
+    return True
+
+
+class MediaTicket:
+    """A caller's place in the media queue"""
+
+    def __init__(self, pool):
+        self._pool = pool
+        self.started = False
+
+    @property
+    def position(self):
+        """1-based position among waiting downloads, 0 once a worker has it"""
+        try:
+            return self._pool._waiting.index(self) + 1
+        except ValueError:
+            return 0
+
+
+class MediaPool:
+    """
+    Dedicated worker processes for yt-dlp downloads (extraction + ffmpeg merge).
+
+    Keeps heavy, GIL-bound media work off the default thread pool that small
+    helpers use. At most MEDIA_WORKERS downloads run at once; up to
+    MEDIA_QUEUE_LIMIT more wait in FIFO order and anything beyond that is
+    rejected with MediaQueueFull so a burst degrades predictably.
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._slots = None
+        self._waiting = []
+        self._running = 0
+        self._manager = None
+        self._progress_queue = None
+        self._progress_callbacks = {}
+        self._loop = None
+
+    @property
+    def workers(self):
+        return max(1, env_int("MEDIA_WORKERS", 2))
+
+    def _get_executor(self):
+        if self._executor is None:
+            # spawn: forking a process that already runs an event loop and threads isn't safe
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_worker,
+            )
+        return self._executor
+
+    async def start(self):
+        """Spawn and warm every worker now rather than on the first request"""
+        self._slots = asyncio.Semaphore(self.workers)
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        try:
+            # Spawning the manager process blocks; keep it off the loop
+            await asyncio.to_thread(self._start_progress, loop)
+            await asyncio.gather(*[loop.run_in_executor(executor, _ping) for _ in range(self.workers)])
+            print(f"🎬 Media workers ready ({self.workers})")
+        except Exception as e:
+            print(f"⚠️ Media workers failed to warm up: {e}")
+
+    async def stop(self):
+        if self._executor:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        if self._manager:
+            self._progress_queue.put((None, None))
+            self._manager.shutdown()
+            self._manager = None
+            self._progress_queue = None
+
+    # ---------------- PROGRESS ----------------
+    def progress_sink(self, callback):
+        """
+        A picklable (queue, token) pair a worker can report progress through.
+        callback(message) runs on the event loop for each report.
+        Release it with release_sink(token) when the download is done.
+        """
+        if self._manager is None:
+            self._start_progress(asyncio.get_running_loop())
+        token = uuid.uuid4().hex
+        self._progress_callbacks[token] = callback
+        return self._progress_queue, token
+
+    def _start_progress(self, loop):
+        # Worker processes can't share an asyncio.Queue; a manager queue crosses the boundary
+        self._manager = multiprocessing.get_context("spawn").Manager()
+        self._progress_queue = self._manager.Queue()
+        self._loop = loop
+        threading.Thread(target=self._listen, args=(self._progress_queue,), name="media-progress", daemon=True).start()
+
+    def release_sink(self, token):
+        self._progress_callbacks.pop(token, None)
+
+    def _listen(self, queue):
+        while True:
+            try:
+                token, message = queue.get()
+            except (EOFError, OSError):
+                return
+            if token is None:
+                return
+            self._loop.call_soon_threadsafe(self._dispatch, token, message)
+
+    def _dispatch(self, token, message):
+        callback = self._progress_callbacks.get(token)
+        if callback:
+            callback(message)
+
+    def ticket(self):
+        return MediaTicket(self)
+
+    async def run(self, fn, *args, ticket=None):
+        """Run fn(*args) in a worker process, waiting for a free slot first"""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        if len(self._waiting) >= env_int("MEDIA_QUEUE_LIMIT", 20):
+            raise MediaQueueFull()
+
+        ticket = ticket or self.ticket()
+        self._waiting.append(ticket)
+        try:
+            async with self._slots:
+                self._waiting.remove(ticket)
+                ticket.started = True
+                self._running += 1
+                try:
+                    loop = asyncio.get_running_loop()
+                    return await loop.run_in_executor(self._get_executor(), fn, *args)
+                except BrokenProcessPool:
+                    # A worker died (e.g. killed mid-merge); start a fresh pool next time
+                    self._executor = None
+                    raise
+                finally:
+                    self._running -= 1
+        finally:
+            if ticket in self._waiting:
+                self._waiting.remove(ticket)
+
+    def stats(self):
+        return {
+            "workers": self.workers,
+            "running": self._running,
+            "queued": len(self._waiting),
+            "queue_limit": env_int("MEDIA_QUEUE_LIMIT", 20),
+        }
+
+
+# Global media worker pool
+media_pool = MediaPool()
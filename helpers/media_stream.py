@@ -0,0 +1,176 @@
+import os
+import secrets
+import asyncio
+from datetime import datetime
+import aiosqlite
+from db import DB_PATH
+from helpers.download import clean_title
+from helpers.file_writer import ChunkWriter
+from helpers.media_cache import store_media
+from utils.helper import env_int
+
+STREAM_CHUNK = 64 * 1024
+
+# Live remuxes running right now (each one is an ffmpeg process)
+_stream_slots = None
+
+
+class StreamBusy(Exception):
+    """Raised when MEDIA_STREAMS remuxes are already running"""
+
+
+class StreamFailed(Exception):
+    """ffmpeg exited before producing any output"""
+
+
+def _ffmpeg_args(sources):
+    """
+    Remux the source(s) without re-encoding into fragmented MP4 on stdout,
+    so the first bytes can be sent as soon as the first fragment is ready.
+    """
+    args = ["ffmpeg", "-hide_banner", "-loglevel", "error", "-nostdin"]
+    for source in sources:
+        headers = "".join(f"{name}: {value}\r\n" for name, value in source["http_headers"].items())
+        if headers:
+            args += ["-headers", headers]
+        args += ["-i", source["url"]]
+    if len(sources) > 1:
+        args += ["-map", "0:v:0", "-map", "1:a:0"]
+    args += [
+        "-c", "copy",
+        "-movflags", "frag_keyframe+empty_moov+default_base_moof",
+        "-f", "mp4", "pipe:1",
+    ]
+    return args
+
+
+class MediaStream:
+    """
+    One live ffmpeg remux piped to a client.
+
+        stream = await MediaStream.open(sources_info, key, tee=True)
+        return StreamingResponse(stream.body(), background=BackgroundTask(stream.close), ...)
+
+close() runs after the response either way, so ffmpeg and the stream slot
+are released even when the body is never iterated.
+
+    With tee the same bytes are written to downloads/; when the stream ends
+    cleanly the file is registered (videos + media_cache) under
+    stream.short_code, so /file/{short_code} and later /dl/* calls reuse it.
+    """
+
+    def __init__(self, info, key, tee):
+        self.info = info
+        self.key = key
+        self.tee = tee
+        self.title = info["video_info"].get("title") or "video"
+        self.filename = f"{clean_title(self.title)}_{datetime.now().strftime('%Y%m%d_%H%M%S')}.mp4"
+        self.short_code = secrets.token_urlsafe(6) if tee else None
+        self._proc = None
+        self._first = b""
+        self._stderr = b""
+        self._stderr_task = None
+        self._closed = False
+
+    @classmethod
+    async def open(cls, info, key, tee=False):
+        """Start ffmpeg and wait for its first bytes, so failures surface before the response starts"""
+        global _stream_slots
+        if _stream_slots is None:
+            _stream_slots = asyncio.Semaphore(max(1, env_int("MEDIA_STREAMS", 4)))
+        if _stream_slots.locked():
+            raise StreamBusy()
+        stream = cls(info, key, tee)
+        await _stream_slots.acquire()
+
+        try:
+            stream._proc = await asyncio.create_subprocess_exec(
+                *_ffmpeg_args(info["sources"]),
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+            stream._stderr_task = asyncio.create_task(stream._drain_stderr())
+            stream._first = await stream._proc.stdout.read(STREAM_CHUNK)
+            if not stream._first:
+                await stream._proc.wait()
+                await stream._stderr_task
+                error = stream._stderr.decode(errors="replace").strip()
+                raise StreamFailed(error or f"ffmpeg exited with {stream._proc.returncode}")
+        except BaseException:
+            await stream.close()
+            raise
+        return stream
+
+    async def _drain_stderr(self):
+        # An unread pipe fills up and stalls ffmpeg; keep only the tail for error messages
+        while True:
+            chunk = await self._proc.stderr.read(4096)
+            if not chunk:
+                return
+            self._stderr = (self._stderr + chunk)[-4096:]
+
+    async def close(self):
+        """Stop ffmpeg and free the stream slot. Safe to call more than once."""
+        if self._closed:
+            return
+        self._closed = True
+        try:
+            if self._proc and self._proc.returncode is None:
+                try:
+                    self._proc.kill()
+                except ProcessLookupError:
+                    pass
+                await self._proc.wait()
+        finally:
+            if self._stderr_task:
+                self._stderr_task.cancel()
+            _stream_slots.release()
+
+    async def body(self):
+        part_path = None
+        writer = None
+        completed = False
+        try:
+            if self.tee:
+                os.makedirs("downloads", exist_ok=True)
+                part_path = os.path.join("downloads", self.filename + ".part")
+                writer = await ChunkWriter(part_path, "wb").__aenter__()
+
+            chunk = self._first
+            while chunk:
+                if writer:
+                    await writer.write(chunk)
+                yield chunk
+                chunk = await self._proc.stdout.read(STREAM_CHUNK)
+
+            completed = await self._proc.wait() == 0
+        finally:
+            if writer:
+                await writer.__aexit__(None, None, None)
+            await self.close()
+            if part_path:
+                if completed:
+                    await self._register(part_path)
+                else:
+                    # Client left or ffmpeg failed: the partial copy is useless
+                    try:
+                        os.remove(part_path)
+                    except FileNotFoundError:
+                        pass
+
+    async def _register(self, part_path):
+        final_path = part_path[:-len(".part")]
+        os.replace(part_path, final_path)
+        info = {
+            "channel_info": self.info["channel_info"],
+            "video_info": self.info["video_info"],
+            "download_url": (os.getenv("PROJECT_URL") or "http://localhost:8000") + f"/file/{self.short_code}",
+            "short": self.short_code,
+        }
+        async with aiosqlite.connect(DB_PATH) as db:
+            await db.execute(
+                "INSERT INTO videos (title, filepath, short_code) VALUES (?, ?, ?)",
+                (self.title, final_path, self.short_code)
+            )
+            await store_media(db, [self.key, self.info.get("media_key")], info)
+        print(f"💾 Stream tee saved: {final_path}")
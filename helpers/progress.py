@@ -0,0 +1,143 @@
+import time
+import asyncio
+import itertools
+from collections import OrderedDict
+from utils.helper import env_float
+
+# Statuses that end a job; subscribers stop listening after one of these
+TERMINAL_STATUSES = ("complete", "error")
+# Statuses that describe a single episode rather than the whole job
+EPISODE_STATUSES = ("downloading", "retrying", "episode_complete", "episode_failed")
+# Statuses where only the latest value matters; older ones can be dropped
+COALESCED_STATUSES = ("downloading", "zipping")
+
+
+def _coalesce_key(message):
+    status = message.get("status")
+    if status == "downloading":
+        return ("downloading", message.get("episode"))
+    if status == "zipping":
+        return ("zipping",)
+    return None
+
+
+def compact_frame(message):
+    """
+    Short-key progress frame for subscribers that ask for it (?format=compact).
+    Only the high-frequency progress messages are compacted; everything else
+    is sent as-is.
+    """
+    status = message.get("status")
+    if status == "downloading":
+        return {
+            "t": "p",
+            "ep": message.get("episode"),
+            "i": message.get("current"),
+            "n": message.get("total"),
+            "p": message.get("progress"),
+            "mb": message.get("downloaded_mb"),
+            "tmb": message.get("total_mb"),
+            "sp": message.get("speed_mbps"),
+        }
+    if status == "zipping" and "zip_progress" in message:
+        return {"t": "z", "p": message["zip_progress"]}
+    return message
+
+
+class Subscriber:
+    """
+    One observer's mailbox.
+    Progress messages are coalesced per key (episode / zipping), so a slow
+    client only ever has the latest value waiting instead of a growing
+    backlog. Events like episode_complete are never dropped.
+    """
+
+    def __init__(self, min_interval=None):
+        self._pending = OrderedDict()
+        self._event = asyncio.Event()
+        self._ids = itertools.count()
+        self._min_interval = env_float("PROGRESS_MIN_INTERVAL", 0.25) if min_interval is None else min_interval
+        self._last_progress = 0.0
+
+    def offer(self, message):
+        status = message.get("status")
+        if status in ("episode_complete", "episode_failed"):
+            # Progress still waiting for this episode is older than its outcome
+            self._pending.pop(("downloading", message.get("episode")), None)
+        elif status in TERMINAL_STATUSES:
+            for stale in [key for key in self._pending if key[0] in COALESCED_STATUSES]:
+                del self._pending[stale]
+
+        key = _coalesce_key(message)
+        if key is None:
+            key = ("event", next(self._ids))
+        else:
+            # Replace the stale value and move it behind anything queued since
+            self._pending.pop(key, None)
+        self._pending[key] = message
+        self._event.set()
+
+    async def get(self):
+        """Next message to send. Progress is throttled to one per min_interval."""
+        while True:
+            while not self._pending:
+                self._event.clear()
+                await self._event.wait()
+
+            wait = self._min_interval - (time.monotonic() - self._last_progress)
+            for key in self._pending:
+                if key[0] not in COALESCED_STATUSES:
+                    return self._pending.pop(key)
+                if wait <= 0:
+                    self._last_progress = time.monotonic()
+                    return self._pending.pop(key)
+            # Only throttled progress is waiting; newer values keep replacing it meanwhile
+            await asyncio.sleep(wait)
+
+
+class ProgressChannel:
+    """
+    Per-session progress broadcast.
+    Keeps the current state (start message, latest message per episode,
+    overall status) for late subscribers and fans live messages out to every
+    subscriber without ever awaiting one.
+    """
+
+    def __init__(self):
+        self._started = None
+        self._episodes = {}
+        self._status = None
+        self._subscribers = set()
+
+    @property
+    def finished(self):
+        return self._status is not None and self._status.get("status") in TERMINAL_STATUSES
+
+    def publish(self, message):
+        status = message.get("status")
+        if status == "started":
+            self._started = message
+        elif status in EPISODE_STATUSES and message.get("episode") is not None:
+            self._episodes[message["episode"]] = message
+        else:
+            self._status = message
+        for subscriber in self._subscribers:
+            subscriber.offer(message)
+
+    def snapshot(self):
+        """Messages that rebuild the current state for a newly attached client"""
+        messages = [self._started] if self._started else []
+        messages += [self._episodes[ep] for ep in sorted(self._episodes, key=lambda ep: int(ep))]
+        if self._status:
+            messages.append(self._status)
+        return messages
+
+    def subscribe(self):
+        subscriber = Subscriber()
+        for message in self.snapshot():
+            subscriber.offer(message)
+        self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self._subscribers.discard(subscriber)
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+import httpx
+from helpers.http_clients import get_client, with_cookies
+from utils.helper import env_int, env_float
+
+# Default (concurrency, requests/second) per upstream. Override with
+# SCHED_<NAME>_CONCURRENCY / SCHED_<NAME>_RATE, e.g. SCHED_KWIK_RATE=2
+DEFAULT_LIMITS = {
+    "animepahe": (8, 5.0),
+    "animepahe_img": (16, 20.0),
+    "pahe": (8, 5.0),
+    "kwik": (6, 4.0),
+    "kwik_api": (6, 4.0),
+}
+
+
+class HostScheduler:
+    """
+    Concurrency limit + token bucket for one upstream host, with an AIMD rate:
+    every successful response nudges the rate up, a 429/5xx/timeout halves it.
+    Bulk jobs therefore run as fast as the upstream tolerates and back off
+    as soon as it starts throttling.
+    """
+
+    def __init__(self, name, concurrency, rate, min_rate, max_rate, increase, decrease):
+        self.name = name
+        self.concurrency = concurrency
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._tokens = 1.0
+        self._updated = time.monotonic()
+        self._last_decrease = 0.0
+        self.stats = {"ok": 0, "throttled": 0, "errors": 0}
+
+    def _refill(self):
+        now = time.monotonic()
+        # Bucket holds at most one second worth of requests
+        self._tokens = min(max(self.rate, 1.0), self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def _take_token(self):
+        while True:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    @asynccontextmanager
+    async def slot(self):
+        async with self._semaphore:
+            await self._take_token()
+            yield
+
+    def record_success(self):
+        self.stats["ok"] += 1
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def record_throttle(self):
+        self.stats["throttled"] += 1
+        now = time.monotonic()
+        # One decrease per window, so a burst of failures from requests that
+        # were already in flight doesn't collapse the rate to the floor
+        if now - self._last_decrease < 1.0:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * self.decrease)
+        print(f"🐢 {self.name}: throttled, rate now {self.rate:.2f} req/s")
+
+    def record_response(self, status_code):
+        """Feed one response's status into the rate (for callers that stream)"""
+        if _is_throttle(status_code):
+            self.record_throttle()
+        else:
+            self.record_success()
+
+    def snapshot(self):
+        return {
+            "concurrency": self.concurrency,
+            "rate": round(self.rate, 2),
+            **self.stats,
+        }
+
+
+# Global scheduler registry (one per upstream, created on first use)
+schedulers: dict[str, HostScheduler] = {}
+
+
+def get_scheduler(name: str) -> HostScheduler:
+    scheduler = schedulers.get(name)
+    if scheduler is None:
+        concurrency, rate = DEFAULT_LIMITS.get(name, (8, 5.0))
+        prefix = f"SCHED_{name.upper()}_"
+        rate = env_float(prefix + "RATE", rate)
+        scheduler = HostScheduler(
+            name,
+            concurrency=env_int(prefix + "CONCURRENCY", concurrency),
+            rate=rate,
+            min_rate=env_float(prefix + "MIN_RATE", 0.5),
+            max_rate=env_float(prefix + "MAX_RATE", rate * 4),
+            increase=env_float("SCHED_RATE_INCREASE", 0.1),
+            decrease=env_float("SCHED_RATE_DECREASE", 0.5),
+        )
+        schedulers[name] = scheduler
+    return scheduler
+
+
+def _is_throttle(status_code):
+    return status_code == 429 or status_code >= 500
+
+
+async def fetch(upstream, method, url, client=None, **kwargs):
+    """
+    Send one request to an upstream through its scheduler and pooled client.
+    Response status and timeouts feed back into the upstream's rate.
+    cookies= is sent as a Cookie header (see with_cookies).
+    """
+    scheduler = get_scheduler(upstream)
+    client = client or get_client(upstream)
+    cookies = kwargs.pop("cookies", None)
+    if cookies:
+        kwargs["headers"] = with_cookies(cookies, kwargs.get("headers"))
+    async with scheduler.slot():
+        try:
+            res = await client.request(method, url, **kwargs)
+        except httpx.TimeoutException:
+            scheduler.record_throttle()
+            raise
+        except httpx.TransportError:
+            scheduler.stats["errors"] += 1
+            raise
+    scheduler.record_response(res.status_code)
+    return res
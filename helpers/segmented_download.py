@@ -0,0 +1,136 @@
+import os
+import json
+import asyncio
+import httpx
+from helpers.archive import CDN_HEADERS
+from helpers.file_writer import ChunkWriter
+
+
+async def probe_ranges(client, url):
+    """
+    Ask for the first byte only.
+    Returns (total size, ranges supported). Size is None when unknown.
+    """
+    headers = {**CDN_HEADERS, 'Range': 'bytes=0-0'}
+    async with client.stream('GET', url, headers=headers, timeout=httpx.Timeout(30.0)) as response:
+        response.raise_for_status()
+        content_range = response.headers.get('content-range', '')
+        if response.status_code == 206 and '/' in content_range:
+            size = content_range.rsplit('/', 1)[1]
+            if size.isdigit():
+                return int(size), True
+        content_length = response.headers.get('content-length')
+        accepts = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        return (int(content_length) if content_length else None), accepts and response.status_code == 206
+
+
+def _plan_segments(size, count):
+    """Split [0, size) into `count` inclusive byte ranges: [start, end, done]"""
+    step = -(-size // count)
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+
+def _load_state(state_file, size, count):
+    """Resume a previous segmented attempt if its plan matches this file"""
+    try:
+        with open(state_file) as f:
+            state = json.load(f)
+        if state.get("size") == size:
+            return state["segments"]
+    except (FileNotFoundError, ValueError, KeyError):
+        pass
+    return _plan_segments(size, count)
+
+
+def _save_state(state_file, size, segments):
+    tmp = state_file + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump({"size": size, "segments": segments}, f)
+    os.replace(tmp, state_file)
+
+
+async def segmented_download(client, url, path, size, segments=4, on_progress=None, max_retries=3):
+    """
+    Fetch `size` bytes as N parallel Range requests into a preallocated file.
+    Per-segment progress is kept in `<path>.segments` so an interrupted
+    download resumes each segment where it stopped.
+    on_progress(downloaded, size) is awaited roughly every 0.5 seconds.
+    Returns True when every segment completed.
+    """
+    state_file = path + ".segments"
+    plan = _load_state(state_file, size, segments)
+
+    # Preallocate so every segment can write at its own offset
+    if not os.path.exists(path) or os.path.getsize(path) != size:
+        plan = _plan_segments(size, segments)
+        with open(path, "wb") as f:
+            f.truncate(size)
+
+    async def fetch_segment(segment, writer):
+        start, end, _ = segment
+
+        def written(position):
+            # Progress only counts bytes that reached the disk, so the saved
+            # state never claims more than a resume can rely on. It comes from
+            # the chunk's offset rather than a running sum: chunks still queued
+            # by a superseded attempt overlap the retry's and must not count twice.
+            def on_written(length):
+                segment[2] = max(segment[2], position + length - start)
+            return on_written
+
+        for attempt in range(max_retries):
+            offset = start + segment[2]
+            if offset > end:
+                return True
+            headers = {**CDN_HEADERS, 'Range': f'bytes={offset}-{end}'}
+            try:
+                async with client.stream('GET', url, headers=headers, timeout=httpx.Timeout(120.0, connect=30.0)) as response:
+                    if response.status_code != 206:
+                        raise httpx.HTTPStatusError(
+                            f"Expected 206, got {response.status_code}",
+                            request=response.request, response=response
+                        )
+                    position = offset
+                    async for chunk in response.aiter_bytes(chunk_size=1024*1024):
+                        # Never write past this segment even if the server over-delivers
+                        chunk = chunk[:end + 1 - position]
+                        if not chunk:
+                            break
+                        await writer.write(chunk, offset=position, on_written=written(position))
+                        position += len(chunk)
+                    if position > end:
+                        return True
+            except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                print(f"⚠️ Segment {start}-{end} attempt {attempt + 1} failed: {e!r}")
+                if attempt < max_retries - 1:
+                    await asyncio.sleep((attempt + 1) * 2)
+        return False
+
+    # One writer thread for the whole file; segments queue chunks at their offsets
+    async with ChunkWriter(path, "r+b") as writer:
+        tasks = [asyncio.create_task(fetch_segment(segment, writer)) for segment in plan]
+        try:
+            while True:
+                done, _ = await asyncio.wait(tasks, timeout=0.5)
+                _save_state(state_file, size, plan)
+                if on_progress:
+                    await on_progress(sum(segment[2] for segment in plan), size)
+                if len(done) == len(tasks):
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+    # Writer flushed: every queued chunk is on disk and counted
+    _save_state(state_file, size, plan)
+
+    ok = True
+    for task in tasks:
+        if task.exception():
+            # Fail this episode, not the whole bulk job
+            print(f"⚠️ Segment failed: {task.exception()!r}")
+            ok = False
+        elif not task.result():
+            ok = False
+    if ok:
+        os.remove(state_file)
+    return ok
@@ -1,15 +1,27 @@
-import uuid
+import os
 import json
+import shutil
 import traceback
-import io
-import zipfile
 import asyncio
+from datetime import datetime
 from fastapi import APIRouter, Query, Depends,Request,WebSocket,WebSocketDisconnect
-from fastapi.responses import JSONResponse,StreamingResponse,Response,FileResponse
+from fastapi.responses import JSONResponse,StreamingResponse,Response
 import httpx
-from db import get_db
-from helpers.anime_helper import get_pahewin_link,get_episode_session,get_kiwi_url,get_redirect_link
+import aiosqlite
+from db import get_db, DB_PATH
+from helpers.anime_helper import get_pahewin_link,get_episode_index,get_kiwi_url,get_redirect_link
 from helpers.anime_helper import get_animepahe_cookies,get_actual_episode,get_cached_anime_info
+from helpers.anime_helper import fetch_episode_link,create_download_session,episode_range
+from helpers.bulk_jobs import bulk_job_engine
+from helpers.archive import stream_zip, stream_episode
+from helpers.file_serving import serve_file, content_disposition
+from helpers.image_cache import image_cache, allowed_image_url
+from helpers.download_jobs import get_download_job, start_download_job, complete_message
+from helpers.download_jobs import session_zip_names
+from helpers.progress import TERMINAL_STATUSES, compact_frame
+from utils.helper import env_int
+from helpers.http_clients import get_client
+from helpers.scheduler import fetch
 from utils.helper import generate_internal_id,encodeURIComponent
 router = APIRouter(prefix="/anime", tags=["Anime"])
 @router.get("/search", description="Searches for a specific anime", summary="Search anime")
@@ -22,9 +34,8 @@ async def anime_search(query: str = Query(..., description="Anime name for the s
     search_result = []
     try:
         cookies = await get_animepahe_cookies(db)
-        async with httpx.AsyncClient(cookies=cookies,timeout=30) as client:
-            encode_query = await encodeURIComponent(query)
-            res = await client.get(f"https://animepahe.si/api?m=search&q={encode_query}")
+        encode_query = await encodeURIComponent(query)
+        res = await fetch("animepahe", "GET", f"https://animepahe.si/api?m=search&q={encode_query}",cookies=cookies,timeout=30)
         try:
             results = res.json()
         except ValueError:
@@ -106,11 +117,6 @@ async def anime_download(id:str = Query(...,description="id for the anime from s
             }
         )
     ep_count = info["episodes"]
-    if int(episode) > int(ep_count):
-        return JSONResponse(status_code=422,content={
-            "status": 422,
-            "message": "Episode number exceed available count"
-        })
     if not info["external_id"]:
         return JSONResponse(status_code=404,content={
             "status": 404,
@@ -143,9 +149,21 @@ async def anime_download(id:str = Query(...,description="id for the anime from s
             "status":404,
             "message":"No image poster available"
         }
-    search_result = await get_episode_session(info["external_id"],db)
-    episode_info = search_result[int(episode)-1]
-    episode_session = episode_info.get("session")
+    episode_index = await get_episode_index(info["external_id"],db,ep_count)
+    if episode_index and int(episode) not in episode_index:
+        first, last = episode_range(episode_index)
+        return JSONResponse(status_code=422,content={
+            "status": 422,
+            "first_episode": first,
+            "last_episode": last,
+            "message": "Episode number not in this anime's episode list"
+        })
+    episode_session = episode_index.get(int(episode)) if episode_index else None
+    if not episode_session:
+        return JSONResponse(status_code=404,content={
+            "status": 404,
+            "message": "Episode session not found"
+        })
     episode_snapshot = row["poster"]
     pahe_link = await get_pahewin_link(info["external_id"], episode_session,db,quality)
     if pahe_link is None:
@@ -164,14 +182,13 @@ async def anime_download(id:str = Query(...,description="id for the anime from s
 
     return JSONResponse(status_code=500 if results.get("status") == 500 else 200,content=results)
 
-@router.get("/bulk-download", description="Bulk download multiple anime episodes", summary="Bulk download anime episodes")
-async def anime_bulk_download(
-    id: str = Query(..., description="ID for the anime from search", example="OP3526"),
-    ep_from: int = Query(..., alias="from", description="Starting episode number", example=1, ge=1),
-    ep_to: int = Query(..., alias="to", description="Ending episode number", example=24, ge=1),
-    quality: str = Query("720p", regex="^(360p|720p|1080p)$"),
-    db = Depends(get_db)
-):
+async def _prepare_bulk_download(id, ep_from, ep_to, db, max_episodes=100, check_catalog=True):
+    """
+    Shared validation for the bulk routes.
+    Returns (info, episodes) or a JSONResponse describing the error.
+    With check_catalog=False the episode catalog isn't built here (it can take
+    a while for long shows); the caller checks the range against it later.
+    """
     # Validation
     if ep_from > ep_to:
         return JSONResponse(status_code=400, content={
@@ -179,11 +196,11 @@ async def anime_bulk_download(
             "message": "Starting episode cannot be greater than ending episode"
         })
     total_ep_count = ep_to - ep_from
-    if total_ep_count >= 100:
+    if total_ep_count >= max_episodes:
         return JSONResponse(status_code=400,
         content= {
             "status":400,
-            "message":"Limit reached. Must be less than 100 episodes."
+            "message":f"Limit reached. Must be less than {max_episodes} episodes."
         }
         )
 
@@ -197,25 +214,55 @@ async def anime_bulk_download(
     
     ep_count = info["episodes"]
     
-    # Check if episodes are within range
-    if ep_to > int(ep_count) or ep_from > int(ep_count):
-        return JSONResponse(status_code=422, content={
-            "status": 422,
-            "episodes": ep_count,
-            "message": "Episode number exceeds available count"
-        })
-    
     if not info["external_id"]:
         return JSONResponse(status_code=404, content={
             "status": 404,
             "message": "No external id found"
         })
     
-    # Create list of episode numbers to fetch
-    episodes = list(range(ep_from, ep_to + 1))
+    if not check_catalog:
+        return info, list(range(ep_from, ep_to + 1))
+    
+    # Build the episode index once up front; every episode below reuses it
+    episode_index = await get_episode_index(info["external_id"], db, ep_count)
+    if not episode_index:
+        return JSONResponse(status_code=404, content={
+            "status": 404,
+            "message": "Episode list not available for this anime"
+        })
+    
+    # Check if episodes are within range (numbering doesn't always start at 1)
+    first, last = episode_range(episode_index)
+    if first is None or ep_from < first or ep_to > last:
+        return JSONResponse(status_code=422, content={
+            "status": 422,
+            "episodes": ep_count,
+            "first_episode": first,
+            "last_episode": last,
+            "message": "Episode number exceeds available count"
+        })
+    
+    # Create list of episode numbers to fetch, skipping gaps in the numbering
+    episodes = [episode for episode in range(ep_from, ep_to + 1) if episode in episode_index]
+    return info, episodes
+
+
+@router.get("/bulk-download", description="Bulk download multiple anime episodes", summary="Bulk download anime episodes")
+async def anime_bulk_download(
+    id: str = Query(..., description="ID for the anime from search", example="OP3526"),
+    ep_from: int = Query(..., alias="from", description="Starting episode number", example=1, ge=1),
+    ep_to: int = Query(..., alias="to", description="Ending episode number", example=24, ge=1),
+    quality: str = Query("720p", regex="^(360p|720p|1080p)$"),
+    db = Depends(get_db)
+):
+    prepared = await _prepare_bulk_download(id, ep_from, ep_to, db)
+    if isinstance(prepared, JSONResponse):
+        return prepared
+    info, episodes = prepared
+
     # Fetch all episodes concurrently with asyncio.gather
     download_links = await asyncio.gather(*[
-        _fetch_single_episode(id, episode, info["external_id"], db,quality)
+        fetch_episode_link(id, episode, info["external_id"], db,quality)
         for episode in episodes
     ])
     
@@ -229,13 +276,7 @@ async def anime_bulk_download(
         })
     
     # CREATE SESSION - Store links in DB
-    session_id = str(uuid.uuid4())
-    
-    await db.execute(
-        "INSERT INTO download_sessions (session_id, anime_id, anime_title, links, created_at) VALUES (?, ?, ?, ?, datetime('now'))",
-        (session_id, id, info.get("title", "Unknown"), json.dumps(successful_links))
-    )
-    await db.commit()
+    session_id = await create_download_session(db, id, info.get("title", "Unknown"), successful_links)
     
     
     return JSONResponse(status_code=200, content={
@@ -248,82 +289,127 @@ async def anime_bulk_download(
     })
 
 
-async def _fetch_single_episode(id: str, episode: int, external_id: str, db,quality):
-    """Helper function to fetch a single episode link"""
-      # Only N requests at once
-    try:
-        # Check cache first
-        cursor = await db.execute(
-            "SELECT * FROM cached_video_url WHERE internal_id = ? and episode = ? and quality = ?", 
-            (id, episode,quality)
-        )
-        row = await cursor.fetchone()
-        
-        if row and row["video_url"]:
-            link = row["video_url"]
-            
+@router.get("/bulk-download/stream", description="Bulk download that streams each episode link as soon as it resolves (NDJSON or SSE)", summary="Stream bulk download links")
+async def anime_bulk_download_stream(
+    id: str = Query(..., description="ID for the anime from search", example="OP3526"),
+    ep_from: int = Query(..., alias="from", description="Starting episode number", example=1, ge=1),
+    ep_to: int = Query(..., alias="to", description="Ending episode number", example=24, ge=1),
+    quality: str = Query("720p", regex="^(360p|720p|1080p)$"),
+    format: str = Query("ndjson", regex="^(ndjson|sse)$", description="ndjson or sse"),
+    db = Depends(get_db)
+):
+    """
+    Same as /bulk-download but emits one record per episode in completion
+    order, followed by a summary record carrying the session_id.
+    """
+    prepared = await _prepare_bulk_download(id, ep_from, ep_to, db)
+    if isinstance(prepared, JSONResponse):
+        return prepared
+    info, episodes = prepared
+    anime_title = info.get("title", "Unknown")
+
+    def encode(event, data):
+        if format == "sse":
+            return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        return json.dumps({"type": event, **data}) + "\n"
+
+    async def event_stream():
+        # The request's db dependency is closed once the response starts, so the stream gets its own
+        async with aiosqlite.connect(DB_PATH) as stream_db:
+            stream_db.row_factory = aiosqlite.Row
+
+            async def resolve(episode):
+                return episode, await fetch_episode_link(id, episode, info["external_id"], stream_db, quality)
+
+            tasks = [asyncio.create_task(resolve(episode)) for episode in episodes]
+            successful_links = []
             try:
-                return {
-                        "episode": row["episode"],
-                        "direct_link": row["video_url"],
-                        "size": row["size"],
-                        "snapshot": row["snapshot"],
-                        "quality":quality,
-                        "status": 200
-                    }
-            except Exception as e:
-                print(f"⚠️ Episode {episode}: Cached link check failed ({e}), fetching fresh...")
-        
-        # Fetch fresh link
-        
-        # Add delay between requests
-        await asyncio.sleep(0.5)
-        
-        search_result = await get_episode_session(external_id, db)
-        episode_info = search_result[episode - 1]
-        episode_session = episode_info.get("session")
-        cursor2 = await db.execute("SELECT poster FROM anime_info WHERE internal_id = ?",(id,))
-        row2 = await cursor2.fetchone()
-        if not row2:
-            return None
-        episode_snapshot = row2["poster"]
-        
-        pahe_link = await get_pahewin_link(external_id, episode_session,db,quality)
-        if not pahe_link:
-            print(f"❌ Episode {episode}: No pahe link found")
-            return None
-        
-        kiwi_url = await get_kiwi_url(pahe_link)
-        if not kiwi_url:
-            print(f"❌ Episode {episode}: No kiwi URL found")
-            return None
-        
-        results = await get_redirect_link(kiwi_url, id, episode, db, episode_snapshot,quality)
-        
-        if results and results.get("status") == 200:
-            return results
-        else:
-            print(f"❌ Episode {episode}: Failed to get redirect link")
-            return None
-            
-    except Exception as e:
-        print(f"❌ Episode {episode}: Error - {e}")
-        import traceback
-        traceback.print_exc()
-        return None
+                for next_done in asyncio.as_completed(tasks):
+                    episode, link = await next_done
+                    if link is None:
+                        yield encode("episode_failed", {"episode": episode})
+                        continue
+                    successful_links.append(link)
+                    yield encode("episode", link)
+            finally:
+                # Client went away: stop resolving the rest
+                for task in tasks:
+                    task.cancel()
 
-import os
-import json
-import asyncio
-import tempfile
-import shutil
-import time
-from datetime import datetime, timedelta
-from pathlib import Path
-from zipfile import ZipFile, ZIP_DEFLATED
-import httpx
-from fastapi import WebSocket, WebSocketDisconnect, Query, Depends
-from fastapi.responses import FileResponse, JSONResponse
+            session_id = None
+            if successful_links:
+                successful_links.sort(key=lambda link: int(link["episode"]))
+                session_id = await create_download_session(stream_db, id, anime_title, successful_links)
+
+            yield encode("summary", {
+                "status": 200 if successful_links else 500,
+                "session_id": session_id,
+                "anime_title": anime_title,
+                "total_requested": len(episodes),
+                "total_fetched": len(successful_links)
+            })
+
+    media_type = "text/event-stream" if format == "sse" else "application/x-ndjson"
+    return StreamingResponse(event_stream(), media_type=media_type, headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
+
+
+# ============================================
+# Background bulk resolution jobs
+# ============================================
+@router.post("/jobs", status_code=202, description="Queue a background job that resolves an episode range", summary="Submit bulk resolution job")
+async def submit_bulk_job(
+    id: str = Query(..., description="ID for the anime from search", example="OP3526"),
+    ep_from: int = Query(..., alias="from", description="Starting episode number", example=1, ge=1),
+    ep_to: int = Query(..., alias="to", description="Ending episode number", example=1100, ge=1),
+    quality: str = Query("720p", regex="^(360p|720p|1080p)$"),
+    db = Depends(get_db)
+):
+    # The job syncs the episode catalog itself, so submitting a long show returns immediately
+    prepared = await _prepare_bulk_download(
+        id, ep_from, ep_to, db, max_episodes=env_int("BULK_JOB_MAX_EPISODES", 2000), check_catalog=False
+    )
+    if isinstance(prepared, JSONResponse):
+        return prepared
+    info, episodes = prepared
+
+    job_id = await bulk_job_engine.submit(
+        db, id, info.get("title", "Unknown"), info["external_id"], quality, episodes
+    )
+    return JSONResponse(status_code=202, content={
+        "status": 202,
+        "job_id": job_id,
+        "total_requested": len(episodes),
+        "status_url": f"/anime/jobs/{job_id}",
+        "result_url": f"/anime/jobs/{job_id}/result"
+    })
+
+
+@router.get("/jobs/{job_id}", description="Progress of a bulk resolution job", summary="Bulk job status")
+async def bulk_job_status(job_id: str, db = Depends(get_db)):
+    status = await bulk_job_engine.status(db, job_id)
+    if not status:
+        return JSONResponse(status_code=404, content={"status": 404, "message": "Job not found"})
+    return {"status": 200, "job": status}
+
+
+@router.get("/jobs/{job_id}/result", description="Links resolved so far by a bulk job", summary="Bulk job result")
+async def bulk_job_result(job_id: str, db = Depends(get_db)):
+    status = await bulk_job_engine.status(db, job_id)
+    if not status:
+        return JSONResponse(status_code=404, content={"status": 404, "message": "Job not found"})
+    links = await bulk_job_engine.links(db, job_id)
+    return {
+        "status": 200,
+        "job_status": status["status"],
+        "session_id": status["session_id"],
+        "anime_title": status["anime_title"],
+        "total_requested": status["total"],
+        "total_fetched": len(links),
+        "links": links
+    }
 
 # ============================================
 # WebSocket endpoint for progress
@@ -332,186 +418,65 @@ from fastapi.responses import FileResponse, JSONResponse
 async def websocket_bulk_download(
     websocket: WebSocket,
     session_id: str,
+    format: str = Query("full", regex="^(full|compact)$"),
     db = Depends(get_db)
 ):
     """
-    WebSocket endpoint that streams download progress to the client
+    WebSocket endpoint that streams download progress to the client.
+    The download itself runs server-side keyed by session_id: reconnecting
+    reattaches to the running job (current state first, then live updates)
+    instead of starting over, and a dropped socket doesn't stop the job.
+    Progress is coalesced per episode, so a slow client gets the latest
+    value rather than a backlog. format=compact sends short-key progress frames.
     """
     await websocket.accept()
     
+    job = get_download_job(session_id)
+    subscriber = None
+    
     try:
-        # Get session
-        cursor = await db.execute(
-            "SELECT * FROM download_sessions WHERE session_id = ?",
-            (session_id,)
-        )
-        row = await cursor.fetchone()
-        
-        if not row:
-            await websocket.send_json({
-                "status": "error",
-                "message": "Session not found"
-            })
-            await websocket.close()
-            return
-        
-        links = json.loads(row["links"])
-        anime_title = row["anime_title"].replace(" ", "_").lower()
-        
-        # Get episode range
-        episodes = [int(link_info.get("episode")) for link_info in links if link_info.get("episode")]
-        from_ep = min(episodes) if episodes else 1
-        to_ep = max(episodes) if episodes else 1
-        
-        zip_filename = f"{anime_title}_{from_ep}-{to_ep}_episodes.zip"
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-            'Referer': 'https://kwik.cx/',
-        }
-        
-        # Send initial status
-        await websocket.send_json({
-            "status": "started",
-            "message": f"Preparing to download {len(links)} episodes...",
-            "total_episodes": len(links)
-        })
-        
-        temp_dir = None
-        zip_path = None
-        
-        try:
-            # Create temp directory
-            temp_dir = tempfile.mkdtemp()
-            zip_path = os.path.join(temp_dir, zip_filename)
-            
-            print(f"📁 Created temp dir: {temp_dir}")
-            print(f"📦 ZIP will be saved at: {zip_path}")
-            
-            successful_episodes = []
+        if job is None:
+            # Finished in an earlier run? Hand back the ready ZIP
+            cursor = await db.execute(
+                "SELECT zip_path, expires_at FROM zip_cache WHERE session_id = ?",
+                (session_id,)
+            )
+            zip_row = await cursor.fetchone()
+            if zip_row and datetime.now() < datetime.fromisoformat(zip_row["expires_at"]) and os.path.exists(zip_row["zip_path"]):
+                await websocket.send_json(complete_message(session_id, zip_row["zip_path"]))
+                await websocket.close()
+                return
             
-            # Download episodes with progress updates
-            async with httpx.AsyncClient(
-                timeout=httpx.Timeout(120.0, connect=30.0),
-                limits=httpx.Limits(max_keepalive_connections=5, max_connections=10)
-            ) as client:
-                
-                for idx, link_info in enumerate(links, 1):
-                    episode = link_info.get("episode")
-                    url = link_info.get("direct_link")
-                    
-                    if not url:
-                        continue
-                    
-                    temp_file = os.path.join(temp_dir, f"ep_{episode}.mp4")
-                    
-                    # Send episode start status
-                    await websocket.send_json({
-                        "status": "downloading",
-                        "episode": episode,
-                        "current": idx,
-                        "total": len(links),
-                        "message": f"Downloading Episode {episode}...",
-                        "progress": 0
-                    })
-                    
-                    # Download with retry
-                    success = await download_with_retry_ws(
-                        client, url, temp_file, episode, websocket, idx, len(links)
-                    )
-                    
-                    if success:
-                        successful_episodes.append({
-                            'episode': episode,
-                            'temp_file': temp_file,
-                            'filename': f"{anime_title}_Episode_{str(episode).zfill(3)}.mp4"
-                        })
-                        
-                        # Send episode complete status
-                        await websocket.send_json({
-                            "status": "episode_complete",
-                            "episode": episode,
-                            "current": idx,
-                            "total": len(links),
-                            "message": f"✅ Episode {episode} downloaded!",
-                            "successful_count": len(successful_episodes)
-                        })
-                    else:
-                        # Send episode failed status
-                        await websocket.send_json({
-                            "status": "episode_failed",
-                            "episode": episode,
-                            "message": f"❌ Episode {episode} failed after retries"
-                        })
-                        
-                        if os.path.exists(temp_file):
-                            os.remove(temp_file)
+            # Get session
+            cursor = await db.execute(
+                "SELECT * FROM download_sessions WHERE session_id = ?",
+                (session_id,)
+            )
+            row = await cursor.fetchone()
             
-            if not successful_episodes:
+            if not row:
                 await websocket.send_json({
                     "status": "error",
-                    "message": "No episodes downloaded successfully!"
+                    "message": "Session not found"
                 })
                 await websocket.close()
                 return
             
-            # Send zipping status
-            await websocket.send_json({
-                "status": "zipping",
-                "message": f"Creating ZIP file with {len(successful_episodes)} episodes...",
-                "successful_count": len(successful_episodes),
-                "total": len(links)
-            })
-            
-            # Create ZIP
-            with ZipFile(zip_path, 'w', ZIP_DEFLATED) as zipf:
-                for ep_idx, ep_info in enumerate(successful_episodes, 1):
-                    zipf.write(ep_info['temp_file'], ep_info['filename'])
-                    
-                    # Send zipping progress
-                    await websocket.send_json({
-                        "status": "zipping",
-                        "message": f"Adding Episode {ep_info['episode']} to ZIP...",
-                        "zip_progress": int((ep_idx / len(successful_episodes)) * 100)
-                    })
-                    
-                    os.remove(ep_info['temp_file'])
-            
-            zip_size = os.path.getsize(zip_path)
-            print(f"✅ ZIP created successfully: {zip_size / 1024 / 1024:.2f} MB")
-            
-            # Store ZIP path in database (expires in 1 hour)
-            expires_at = datetime.now() + timedelta(hours=1)
-            await db.execute(
-                """INSERT OR REPLACE INTO zip_cache (session_id, zip_path, expires_at) 
-                   VALUES (?, ?, ?)""",
-                (session_id, zip_path, expires_at)
-            )
-            await db.commit()
-            print(f"💾 Saved ZIP path to database for session: {session_id}")
-            
-            # Send completion status with download link
-            await websocket.send_json({
-                "status": "complete",
-                "message": "ZIP file ready for download!",
-                "download_url": f"/anime/download-zip/{session_id}",
-                "filename": zip_filename,
-                "size": zip_size,
-                "size_mb": round(zip_size / 1024 / 1024, 2),
-                "successful_count": len(successful_episodes),
-                "total": len(links)
-            })
-            
-        except Exception as e:
-            print(f"❌ Error during download: {e}")
-            await websocket.send_json({
-                "status": "error",
-                "message": f"Error: {str(e)}"
-            })
-            raise
+            # Another socket may have started it while we were querying
+            job = get_download_job(session_id) or start_download_job(session_id, row)
+        else:
+            print(f"🔁 Reattaching to download job {session_id}")
+        
+        subscriber = job.subscribe()
+        while True:
+            message = await subscriber.get()
+            await websocket.send_json(compact_frame(message) if format == "compact" else message)
+            if message.get("status") in TERMINAL_STATUSES:
+                break
+        await websocket.close()
             
     except WebSocketDisconnect:
-        print("WebSocket disconnected")
+        print("WebSocket disconnected, download continues in the background")
     except Exception as e:
         print(f"WebSocket error: {e}")
         try:
@@ -521,88 +486,9 @@ async def websocket_bulk_download(
             })
         except:
             pass
-
-
-async def download_with_retry_ws(client, url, temp_file, episode, websocket, current, total, max_retries=3):
-    """Download with retry and WebSocket progress updates"""
-    
-    for attempt in range(max_retries):
-        try:
-            start_byte = 0
-            if os.path.exists(temp_file):
-                start_byte = os.path.getsize(temp_file)
-            
-            download_headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
-                'Referer': 'https://kwik.cx/',
-            }
-            
-            if start_byte > 0:
-                download_headers['Range'] = f'bytes={start_byte}-'
-            
-            start_time = time.time()
-            
-            async with client.stream('GET', url, headers=download_headers, timeout=120.0) as response:
-                if start_byte > 0 and response.status_code not in [206, 200]:
-                    start_byte = 0
-                    if os.path.exists(temp_file):
-                        os.remove(temp_file)
-                
-                response.raise_for_status()
-                
-                content_length = response.headers.get('content-length')
-                total_size = int(content_length) if content_length else None
-                
-                mode = 'ab' if start_byte > 0 else 'wb'
-                with open(temp_file, mode) as f:
-                    downloaded = start_byte
-                    last_update = time.time()
-                    
-                    async for chunk in response.aiter_bytes(chunk_size=1024*1024):
-                        f.write(chunk)
-                        downloaded += len(chunk)
-                        
-                        # Send progress update every 0.5 seconds
-                        if time.time() - last_update >= 0.5:
-                            progress = 0
-                            if total_size:
-                                progress = int((downloaded / total_size) * 100)
-                            
-                            elapsed = time.time() - start_time
-                            speed = downloaded / elapsed if elapsed > 0 else 0
-                            
-                            await websocket.send_json({
-                                "status": "downloading",
-                                "episode": episode,
-                                "current": current,
-                                "total": total,
-                                "progress": progress,
-                                "downloaded_mb": round(downloaded / 1024 / 1024, 2),
-                                "total_mb": round(total_size / 1024 / 1024, 2) if total_size else None,
-                                "speed_mbps": round(speed / 1024 / 1024, 2),
-                                "message": f"Downloading Episode {episode}... {progress}%"
-                            })
-                            last_update = time.time()
-                
-                return True
-                
-        except (httpx.RemoteProtocolError, httpx.ReadTimeout, httpx.ConnectError) as e:
-            if attempt < max_retries - 1:
-                wait_time = (attempt + 1) * 2
-                await websocket.send_json({
-                    "status": "retrying",
-                    "episode": episode,
-                    "attempt": attempt + 1,
-                    "max_retries": max_retries,
-                    "message": f"Retry {attempt + 1}/{max_retries} in {wait_time}s..."
-                })
-                await asyncio.sleep(wait_time)
-            else:
-                return False
-        except Exception as e:
-            return False
-    
-    return False
+    finally:
+        if job and subscriber:
+            job.unsubscribe(subscriber)
 
 
 # ============================================
@@ -610,6 +496,7 @@ async def download_with_retry_ws(client, url, temp_file, episode, websocket, cur
 # ============================================
 @router.get("/download-zip/{session_id}")
 async def download_completed_zip(
+    request: Request,
     session_id: str,
     db = Depends(get_db)
 ):
@@ -662,12 +549,53 @@ async def download_completed_zip(
     # Don't delete immediately - let user download
     # Schedule cleanup for later (you can add a cleanup cron job)
     
-    return FileResponse(
-        zip_path,
+    # Resumable (Range) when served directly; offloaded to nginx with FILE_SERVE_MODE=x-accel
+    return serve_file(request, zip_path, filename, media_type="application/zip")
+
+
+# ============================================
+# Streaming ZIP - no temp files
+# ============================================
+@router.get("/stream-zip/{session_id}", description="Stream a session's episodes as a store-mode ZIP64 without writing to disk", summary="Stream ZIP")
+async def stream_session_zip(
+    session_id: str,
+    db = Depends(get_db)
+):
+    """
+    Pipes each episode from the CDN straight into the ZIP sent to the client.
+    No temp dir, no second pass over the data and no deflate of already
+    compressed video. The size isn't known up front, so no Content-Length.
+    """
+    cursor = await db.execute(
+        "SELECT * FROM download_sessions WHERE session_id = ?",
+        (session_id,)
+    )
+    row = await cursor.fetchone()
+    
+    if not row:
+        return JSONResponse(
+            status_code=404,
+            content={"status": 404, "message": "Session not found"}
+        )
+    
+    links = sorted(json.loads(row["links"]), key=lambda link: int(link.get("episode") or 0))
+    anime_title, zip_filename = session_zip_names(row, links)
+    client = get_client("cdn")
+    
+    entries = (
+        (
+            f"{anime_title}_Episode_{str(link['episode']).zfill(3)}.mp4",
+            stream_episode(client, link["direct_link"], link["episode"])
+        )
+        for link in links if link.get("direct_link")
+    )
+    
+    return StreamingResponse(
+        stream_zip(entries),
         media_type="application/zip",
-        filename=filename,
         headers={
-            "Content-Disposition": f'attachment; filename="{filename}"'
+            "Content-Disposition": content_disposition(zip_filename),
+            "X-Accel-Buffering": "no"
         }
     )
 
@@ -711,37 +639,36 @@ async def cleanup_expired_zips(db = Depends(get_db)):
 
 @router.get("/proxy-image", description="Proxy images from animepahe")
 async def proxy_image(
-    url: str = Query(..., description="Image URL to proxy"), db= Depends(get_db)
+    request: Request,
+    url: str = Query(..., description="Image URL to proxy")
 ):
     """
-    Proxy images from animepahe with cookies to bypass 403
+    Proxy images from animepahe with cookies to bypass 403.
+    Served from the memory/disk image cache (304 on a matching ETag);
+    misses are streamed while being cached, one upstream fetch per URL.
     """
     
-    # Validate it's from animepahe (security)
-    if "animepahe.si" not in url:
+    # Validate it's from animepahe (security): the host, not a substring anywhere in the URL
+    if not allowed_image_url(url):
         return Response(status_code=400, content="Invalid image URL")
     
-    try:
-        # Get animepahe cookies
-        cookies = await get_animepahe_cookies(db)
-        
-        # Fetch image with cookies
-        async with httpx.AsyncClient(timeout=10) as client:
-            response = await client.get(url, cookies=cookies)
-        
-        if response.status_code == 200:
-            # Return image with proper content type
-            return Response(
-                content=response.content,
-                media_type=response.headers.get("content-type", "image/jpeg"),
-                headers={
-                    "Cache-Control": "public, max-age=86400",  # Cache for 1 day
-                }
-            )
-        else:
-            # Return placeholder or 404
-            return Response(status_code=response.status_code)
-            
-    except Exception as e:
-        print(f"Error proxying image: {e}")
-        return Response(status_code=500)
\ No newline at end of file
+    cache_headers = {"Cache-Control": "public, max-age=86400"}  # Cache for 1 day
+    
+    cached = await image_cache.get(url)
+    if cached:
+        headers = {**cache_headers, "ETag": cached["etag"]}
+        if_none_match = request.headers.get("if-none-match", "")
+        if cached["etag"] in [tag.strip() for tag in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=cached["body"], media_type=cached["content_type"], headers=headers)
+    
+    fetch = image_cache.fetch(url)
+    await fetch.ready.wait()
+    if fetch.status is None:
+        return Response(status_code=500)
+    if fetch.status != 200:
+        # Return placeholder or 404
+        return Response(status_code=fetch.status)
+    
+    headers = {**cache_headers, "ETag": fetch.etag}
+    return StreamingResponse(fetch.stream(), media_type=fetch.content_type, headers=headers)
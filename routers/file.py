@@ -1,13 +1,13 @@
 import os
-from fastapi import APIRouter, Query, HTTPException, Depends,Path
-from fastapi import Query
-from fastapi.responses import Response
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Depends,Path
+from fastapi import Request
 from db import get_db
+from helpers.file_serving import serve_file
 
 file_router = APIRouter(prefix="/file",tags=["file"])
 @file_router.get("/{code}")
 async def get_file(
+    request: Request,
     code: str = Path(..., description="Code for given file"),
     db=Depends(get_db)
 ):
@@ -27,7 +27,7 @@ async def get_file(
 
     filename = os.path.basename(file_path)
 
-    # Return the file
-    return FileResponse(path=file_path, filename=filename, media_type="application/octet-stream")
+    # Return the file (or hand it to the fronting proxy)
+    return serve_file(request, file_path, filename, media_type="application/octet-stream")
 
 
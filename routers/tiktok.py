@@ -1,119 +1,204 @@
 import os
-from fastapi import APIRouter, Query, HTTPException, Depends,Path
+import json
+import mimetypes
+from fastapi import APIRouter, Query, HTTPException, Depends,Path,Request
 from fastapi.responses import FileResponse
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from utils.helper import check_platform
-from helpers.download import videoDL,videoDL_for_insta
+from helpers.download import videoDL, direct_link, stream_sources, public_info
+from helpers.media_cache import media_key, lookup_media
+from helpers.media_stream import MediaStream, StreamBusy, StreamFailed
+from helpers.file_serving import serve_file, content_disposition
+from helpers.media_pool import media_pool
+from helpers.media_jobs import start_media_job, get_media_job
+from helpers.progress import TERMINAL_STATUSES
 from db import get_db
 
 router = APIRouter(prefix="/dl", tags=["downloaders"])
 
+MODE_QUERY = Query(
+    "sync", regex="^(sync|async|direct)$",
+    description="sync waits for the file; async returns 202 with a job id; direct returns the platform's own media URL when possible"
+)
 
-@router.get("/tiktok",
-            description="A tiktok downloader route that returns video info and download url for each video.",
-            summary="Download Tiktok"
-            )
-async def tiktok_DL(url: str = Query(..., description="tiktok url", example="https://vm.tiktok.com/XXXXX"), db=Depends(get_db)):
+
+async def handle_download(url, platform, mode, db):
+    """Shared body of the /dl/* routes"""
     if not url:
         return JSONResponse(status_code=400, content={
             "status": 400,
             "message": "Url is required"
         })
-    platform = await check_platform(url)
-    if platform != "tiktok":
+    detected = await check_platform(url)
+    if detected != platform:
         return JSONResponse(status_code=400, content={
             "status": 400,
-            "message": "Not a valid tiktok link"
+            "message": f"Not a valid {platform} link"
+        })
+
+    if mode == "async":
+        job = start_media_job(url, platform)
+        return JSONResponse(status_code=202, content={
+            "status": 202,
+            "message": "Download queued",
+            "job_id": job.job_id,
+            "status_url": f"/dl/jobs/{job.job_id}",
+            "events_url": f"/dl/jobs/{job.job_id}/events"
         })
 
-    info = await videoDL(url, db)
+    if mode == "direct":
+        info = await direct_link(url, platform)
+        if info and info.get("status") == 200:
+            return info
+        if info:
+            headers = {"Retry-After": "30"} if info["status"] == 503 else None
+            return JSONResponse(status_code=info["status"], content=info, headers=headers)
+        # Needs a merge: fall back to a local download
+
+    info = await videoDL(url, db, platform)
+    if not info:
+        return JSONResponse(status_code=500, content={"message": "No info available"})
     if info.get("status") == 422:
-        return JSONResponse(status_code=422, content={
-                            **info} if info else {"message": "No info available"})
+        return JSONResponse(status_code=422, content={**info})
     if info.get("status") == 500:
-        return JSONResponse(status_code=500, content={
-                            **info} if info else {"message": "No info available"})
-    info.pop("path",None)
-    info.pop("short",None)
-    return info
+        return JSONResponse(status_code=500, content={**info})
+    if info.get("status") == 503:
+        return JSONResponse(status_code=503, content=info, headers={"Retry-After": "30"})
+    result = public_info(info)
+    if mode == "direct":
+        result["mode"] = "download"
+    return result
+
+
+@router.get("/tiktok",
+            description="A tiktok downloader route that returns video info and download url for each video.",
+            summary="Download Tiktok"
+            )
+async def tiktok_DL(url: str = Query(..., description="tiktok url", example="https://vm.tiktok.com/XXXXX"), mode: str = MODE_QUERY, db=Depends(get_db)):
+    return await handle_download(url, "tiktok", mode, db)
 @router.get("/insta",
             description="A instagram downloader route that returns video info and download url for each video.",
             summary="Download instagram"
             )
-async def instagram_DL(url: str = Query(..., description="instagram url", example="https://www.instagram.com/XXXXX"), db=Depends(get_db)):
-    if not url:
-        return JSONResponse(status_code=400, content={
-            "status": 400,
-            "message": "Url is required"
-        })
-    platform = await check_platform(url)
-    if platform != "instagram":
-        return JSONResponse(status_code=400, content={
-            "status": 400,
-            "message": "Not a valid instagram link"
-        })
-
-    info = await videoDL_for_insta(url, db)
-    if info.get("status") == 422:
-        return JSONResponse(status_code=422, content={
-                            **info} if info else {"message": "No info available"})
-    if info.get("status") == 500:
-        return JSONResponse(status_code=500, content={
-                            **info} if info else {"message": "No info available"})
-    info.pop("path",None)
-    info.pop("short",None)
-    return info
+async def instagram_DL(url: str = Query(..., description="instagram url", example="https://www.instagram.com/XXXXX"), mode: str = MODE_QUERY, db=Depends(get_db)):
+    return await handle_download(url, "instagram", mode, db)
 @router.get("/fb",
             description="A facebook downloader route that returns video info and download url for each video.",
             summary="Download facebook"
             )
-async def facebook_DL(url: str = Query(..., description="facebook url", example="https://www.facebook.com/XXXXX"), db=Depends(get_db)):
-    if not url:
-        return JSONResponse(status_code=400, content={
-            "status": 400,
-            "message": "Url is required"
-        })
-    platform = await check_platform(url)
-    if platform != "facebook":
-        return JSONResponse(status_code=400, content={
-            "status": 400,
-            "message": "Not a valid facebook link"
-        })
-
-    info = await videoDL(url, db)
-    if info.get("status") == 422:
-        return JSONResponse(status_code=422, content={
-                            **info} if info else {"message": "No info available"})
-    if info.get("status") == 500:
-        return JSONResponse(status_code=500, content={
-                            **info} if info else {"message": "No info available"})
-    info.pop("path",None)
-    info.pop("short",None)
-    return info
+async def facebook_DL(url: str = Query(..., description="facebook url", example="https://www.facebook.com/XXXXX"), mode: str = MODE_QUERY, db=Depends(get_db)):
+    return await handle_download(url, "facebook", mode, db)
 @router.get("/yt",
             description="A youtube downloader route that returns video info and download url for each video.",
             summary="Download youtube"
             )
-async def youtube_DL(url: str = Query(..., description="youtube url", example="https://www.youtube.com/XXXXX"), db=Depends(get_db)):
-    if not url:
-        return JSONResponse(status_code=400, content={
-            "status": 400,
-            "message": "Url is required"
-        })
+async def youtube_DL(url: str = Query(..., description="youtube url", example="https://www.youtube.com/XXXXX"), mode: str = MODE_QUERY, db=Depends(get_db)):
+    return await handle_download(url, "youtube", mode, db)
+
+@router.get("/stream",
+            description="Stream a video while it is being fetched and remuxed (fragmented MP4), instead of waiting for the full download.",
+            summary="Stream video"
+            )
+async def stream_DL(
+    request: Request,
+    url: str = Query(..., description="tiktok / instagram / facebook / youtube url"),
+    tee: bool = Query(False, description="Also save the stream to downloads/ so it gets a /file link"),
+    db=Depends(get_db)
+):
     platform = await check_platform(url)
-    if platform != "youtube":
+    if not platform:
         return JSONResponse(status_code=400, content={
             "status": 400,
-            "message": "Not a valid youtube link"
+            "message": "Unsupported Url"
         })
 
-    info = await videoDL(url, db)
-    if info.get("status") == 422:
-        return JSONResponse(status_code=422, content={
-                            **info} if info else {"message": "No info available"})
-    if info.get("status") == 500:
-        return JSONResponse(status_code=500, content={
-                            **info} if info else {"message": "No info available"})
-    info.pop("path",None)
-    info.pop("short",None)
-    return info
+    # Already downloaded: serve the file (Range-capable) instead of remuxing again
+    key = await media_key(url)
+    cached = await lookup_media(db, key)
+    if cached:
+        # yt-dlp keeps the source container (.webm / .mkv are possible), so don't assume mp4
+        media_type = mimetypes.guess_type(cached["path"])[0] or "application/octet-stream"
+        return serve_file(request, cached["path"], os.path.basename(cached["path"]), media_type=media_type)
+
+    info = await stream_sources(url, platform)
+    if info.get("status") != 200:
+        headers = {"Retry-After": "30"} if info.get("status") == 503 else None
+        return JSONResponse(status_code=info.get("status", 500), content=info, headers=headers)
+
+    try:
+        stream = await MediaStream.open(info, key, tee=tee)
+    except StreamBusy:
+        return JSONResponse(status_code=503, headers={"Retry-After": "30"}, content={
+            "status": 503,
+            "message": "Too many streams in progress, try again shortly"
+        })
+    except StreamFailed as e:
+        print("Stream failed to start:", e)
+        return JSONResponse(status_code=502, content={
+            "status": 502,
+            "message": "Could not stream this video"
+        })
+
+    headers = {
+        "Content-Disposition": content_disposition(stream.filename, "inline"),
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+    if stream.short_code:
+        # Valid once the stream has finished and the tee copy is saved
+        headers["X-Download-Url"] = f"/file/{stream.short_code}"
+    # The body closes the stream when it ends; the background task covers a
+    # response that is dropped before the body ever starts
+    return StreamingResponse(stream.body(), media_type="video/mp4", headers=headers, background=BackgroundTask(stream.close))
+
+
+@router.get("/queue",
+            description="How many media downloads are running and waiting for a worker.",
+            summary="Download queue"
+            )
+async def download_queue():
+    return media_pool.stats()
+
+
+@router.get("/jobs/{job_id}",
+            description="State of an async (mode=async) download; result holds the download_url once complete.",
+            summary="Download job status"
+            )
+async def media_job_status(job_id: str):
+    job = get_media_job(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={
+            "status": 404,
+            "message": "Job not found or expired"
+        })
+    return job.status()
+
+
+@router.get("/jobs/{job_id}/events",
+            description="Server-sent events with queue position, download progress and the final result.",
+            summary="Download job progress (SSE)"
+            )
+async def media_job_events(job_id: str):
+    job = get_media_job(job_id)
+    if not job:
+        return JSONResponse(status_code=404, content={
+            "status": 404,
+            "message": "Job not found or expired"
+        })
+
+    async def event_stream():
+        subscriber = job.subscribe()
+        try:
+            while True:
+                message = await subscriber.get()
+                yield f"event: {message.get('status')}\ndata: {json.dumps(message)}\n\n"
+                if message.get("status") in TERMINAL_STATUSES:
+                    break
+        finally:
+            job.unsubscribe(subscriber)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    })
@@ -0,0 +1,103 @@
+import asyncio
+import io
+import zipfile
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from helpers.archive import build_zip, compression_for, stream_episode, stream_zip
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+def _collect(entries):
+    async def main():
+        return b"".join([data async for data in stream_zip(entries)])
+    return asyncio.run(main())
+
+
+def test_compression_policy():
+    assert compression_for("Episode_1.mp4", 10) == zipfile.ZIP_STORED
+    assert compression_for("notes.txt", 100) == zipfile.ZIP_DEFLATED
+    assert compression_for("notes.txt", 50 * 1024 * 1024) == zipfile.ZIP_STORED
+    assert compression_for("notes.txt") == zipfile.ZIP_STORED
+
+
+def test_stream_zip_round_trips():
+    video = b"\x00\x01" * 50000
+    data = _collect([
+        ("Show/Episode_1.mp4", _chunks(video[:1000], video[1000:])),
+        ("Show/Episode_2.mp4", _chunks(b"second")),
+    ])
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        assert zf.namelist() == ["Show/Episode_1.mp4", "Show/Episode_2.mp4"]
+        assert zf.read("Show/Episode_1.mp4") == video
+        assert zf.read("Show/Episode_2.mp4") == b"second"
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+
+def test_stream_zip_writes_zip64_entries():
+    data = _collect([("Episode_1.mp4", _chunks(b"abc"))])
+    # Sizes are unknown up front, so the local header must already carry the
+    # ZIP64 extended information field (id 0x0001) for multi-GB episodes
+    assert data[:4] == b"PK\x03\x04"
+    name_length = int.from_bytes(data[26:28], "little")
+    extra_length = int.from_bytes(data[28:30], "little")
+    extra = data[30 + name_length:30 + name_length + extra_length]
+    assert extra[:2] == b"\x01\x00"
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.read("Episode_1.mp4") == b"abc"
+
+
+def test_stream_zip_skips_entries_without_data():
+    data = _collect([
+        ("Episode_1.mp4", _chunks()),
+        ("Episode_2.mp4", _chunks(b"ok")),
+    ])
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.namelist() == ["Episode_2.mp4"]
+
+
+def test_build_zip_reports_progress(tmp_path):
+    files = []
+    for n in (1, 2):
+        path = tmp_path / f"{n}.mp4"
+        path.write_bytes(b"x" * n * 100)
+        files.append((str(path), f"Episode_{n}.mp4"))
+    progress = []
+
+    async def report(done, total, arcname):
+        progress.append((done, total, arcname))
+
+    zip_path = tmp_path / "out.zip"
+    asyncio.run(build_zip(str(zip_path), files, on_progress=report))
+    assert progress == [(1, 2, "Episode_1.mp4"), (2, 2, "Episode_2.mp4")]
+    with zipfile.ZipFile(zip_path) as zf:
+        assert zf.read("Episode_2.mp4") == b"x" * 200
+
+
+def test_stream_episode_resumes_with_range_after_a_drop():
+    body = bytes(range(256)) * 12288  # 3 MiB, several 1 MiB read chunks
+    ranges = []
+
+    def handler(request):
+        ranges.append(request.headers.get("range"))
+        if len(ranges) == 1:
+            async def dropped():
+                yield body[:1536 * 1024]
+                raise httpx.RemoteProtocolError("peer closed connection", request=request)
+            return httpx.Response(200, content=dropped())
+        start = int(request.headers["range"][6:-1])
+        return httpx.Response(206, content=body[start:])
+
+    async def main():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return b"".join([chunk async for chunk in stream_episode(client, "https://cdn.test/1.mp4", 1)])
+
+    assert asyncio.run(main()) == body
+    # Only whole chunks that were yielded count as sent
+    assert ranges == [None, f"bytes={1024 * 1024}-"]
@@ -0,0 +1,74 @@
+import asyncio
+import pytest
+
+aiosqlite = pytest.importorskip("aiosqlite")
+pytest.importorskip("bs4")
+
+from helpers import bulk_jobs
+from helpers.bulk_jobs import BulkJobEngine
+
+SCHEMA = [
+    """CREATE TABLE bulk_jobs (
+        job_id TEXT PRIMARY KEY, anime_id TEXT NOT NULL, anime_title TEXT NOT NULL,
+        external_id TEXT NOT NULL, quality TEXT NOT NULL, ep_from INTEGER NOT NULL,
+        ep_to INTEGER NOT NULL, status TEXT NOT NULL, session_id TEXT, error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP, updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )""",
+    """CREATE TABLE bulk_job_episodes (
+        job_id TEXT NOT NULL, episode INTEGER NOT NULL, status TEXT NOT NULL,
+        link TEXT, attempts INTEGER DEFAULT 0, PRIMARY KEY (job_id, episode)
+    )""",
+]
+
+
+def _run_job(tmp_path, monkeypatch, episodes, index, resolve):
+    path = str(tmp_path / "cache.db")
+    monkeypatch.setattr(bulk_jobs, "DB_PATH", path)
+
+    async def total(external_id, db):
+        return len(index)
+
+    async def get_index(external_id, db, total=None):
+        return index
+
+    async def create_session(db, anime_id, title, links):
+        return "session-1"
+
+    monkeypatch.setattr(bulk_jobs, "get_actual_episode", total)
+    monkeypatch.setattr(bulk_jobs, "get_episode_index", get_index)
+    monkeypatch.setattr(bulk_jobs, "fetch_episode_link", resolve)
+    monkeypatch.setattr(bulk_jobs, "create_download_session", create_session)
+
+    async def main():
+        engine = BulkJobEngine()
+        async with aiosqlite.connect(path) as db:
+            db.row_factory = aiosqlite.Row
+            for statement in SCHEMA:
+                await db.execute(statement)
+            job_id = await engine.submit(db, "OP1", "Show", "ext", "720p", episodes)
+            await engine._run(job_id)
+            return await engine.status(db, job_id)
+    return asyncio.run(main())
+
+
+def test_unexpected_errors_mark_the_job_failed(tmp_path, monkeypatch):
+    async def resolve(*args):
+        raise RuntimeError("kwik changed its markup")
+
+    status = _run_job(tmp_path, monkeypatch, [1, 2], {1: "a", 2: "b"}, resolve)
+    assert status["status"] == "failed"
+    assert status["error"] == "kwik changed its markup"
+
+
+def test_episodes_missing_from_the_catalog_fail_without_resolving(tmp_path, monkeypatch):
+    resolved = []
+
+    async def resolve(anime_id, episode, external_id, db, quality):
+        resolved.append(episode)
+        return {"episode": episode, "direct_link": f"https://cdn/{episode}"}
+
+    status = _run_job(tmp_path, monkeypatch, [12, 13, 14], {13: "a", 14: "b"}, resolve)
+    assert sorted(resolved) == [13, 14]
+    assert status["status"] == "done"
+    assert status["session_id"] == "session-1"
+    assert (status["done"], status["failed"]) == (2, 1)
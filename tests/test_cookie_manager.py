@@ -0,0 +1,82 @@
+import asyncio
+import time
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("playwright")
+
+from helpers.cookie_manager import CookieManager, EXPIRY_COOKIE
+
+
+def _manager(harvest):
+    manager = CookieManager()
+    manager._loaded = True
+    calls = []
+
+    async def counted():
+        calls.append(1)
+        return await harvest()
+
+    async def persist(cookies):
+        pass
+
+    manager._harvest = counted
+    manager._persist = persist
+    return manager, calls
+
+
+def test_concurrent_callers_share_one_refresh():
+    async def harvest():
+        await asyncio.sleep(0.05)
+        return [{"name": EXPIRY_COOKIE, "value": "v", "expires": time.time() + 3600}]
+
+    manager, calls = _manager(harvest)
+
+    async def main():
+        return await asyncio.gather(*[manager.get() for _ in range(10)])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert all(result == {EXPIRY_COOKIE: "v"} for result in results)
+
+
+def test_fresh_cookies_are_served_from_memory():
+    async def harvest():
+        return [{"name": EXPIRY_COOKIE, "value": "v", "expires": time.time() + 3600}]
+
+    manager, calls = _manager(harvest)
+
+    async def main():
+        await manager.get()
+        await manager.get()
+
+    asyncio.run(main())
+    assert len(calls) == 1
+
+
+def test_session_cookies_get_a_bounded_lifetime():
+    async def harvest():
+        return [{"name": EXPIRY_COOKIE, "value": "v", "expires": -1}]
+
+    manager, calls = _manager(harvest)
+    asyncio.run(manager.get())
+    assert manager._expires > time.time()
+    assert not manager._expired()
+
+
+def test_failed_refresh_serves_stale_cookies_and_backs_off():
+    async def harvest():
+        raise RuntimeError("chromium crashed")
+
+    manager, calls = _manager(harvest)
+    manager._set({EXPIRY_COOKIE: "stale"}, time.time() - 10)
+
+    async def main():
+        first = await manager.get()
+        second = await manager.get()
+        return first, second
+
+    first, second = asyncio.run(main())
+    assert first == second == {EXPIRY_COOKIE: "stale"}
+    # The second call is inside COOKIE_RETRY_DELAY, so Chromium isn't tried again
+    assert len(calls) == 1
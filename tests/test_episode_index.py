@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+
+aiosqlite = pytest.importorskip("aiosqlite")
+pytest.importorskip("bs4")
+
+from helpers import anime_helper
+from helpers.anime_helper import _episode_number, episode_range, get_episode_index
+
+
+def test_episode_number():
+    assert _episode_number("13") == 13
+    assert isinstance(_episode_number("13"), int)
+    assert _episode_number("12.5") == 12.5
+    assert _episode_number(None) is None
+    assert _episode_number("recap") is None
+
+
+def _index(tmp_path, monkeypatch, numbers):
+    path = str(tmp_path / "cache.db")
+    monkeypatch.setattr(anime_helper, "DB_PATH", path)
+
+    async def main():
+        async with aiosqlite.connect(path) as db:
+            await db.execute("""
+                CREATE TABLE anime_episode_session (
+                    external_id TEXT NOT NULL, position INTEGER NOT NULL, episode TEXT,
+                    session TEXT NOT NULL, page INTEGER, PRIMARY KEY (external_id, position)
+                )
+            """)
+            await db.executemany(
+                "INSERT INTO anime_episode_session VALUES ('abc', ?, ?, ?, 1)",
+                [(position, number, f"s-{number}") for position, number in enumerate(numbers, 1)]
+            )
+            await db.commit()
+        anime_helper.invalidate_episode_index("abc")
+        # total matches the catalog, so nothing is fetched upstream
+        return await get_episode_index("abc", None, total=len(numbers))
+    return asyncio.run(main())
+
+
+def test_index_is_keyed_by_the_catalogued_number(tmp_path, monkeypatch):
+    index = _index(tmp_path, monkeypatch, ["13", "14", "14.5", "15"])
+    assert index[13] == "s-13"
+    assert index[15] == "s-15"
+    assert index[14.5] == "s-14.5"
+    assert 1 not in index
+    assert episode_range(index) == (13, 15)
+
+
+def test_episode_range_ignores_specials():
+    assert episode_range({1: "a", 2: "b", 2.5: "c"}) == (1, 2)
+    assert episode_range({}) == (None, None)
@@ -0,0 +1,59 @@
+import pytest
+
+pytest.importorskip("fastapi")
+
+from email.utils import formatdate
+from helpers.file_serving import _parse_range, _not_modified
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=10-", (10, 99)),
+    ("bytes=90-500", (90, 99)),
+    ("bytes=-10", (90, 99)),
+    ("bytes=-500", (0, 99)),
+    ("bytes=99-", (99, 99)),
+])
+def test_satisfiable_ranges(value, expected):
+    assert _parse_range(value, 100) == expected
+
+
+@pytest.mark.parametrize("value", ["bytes=100-", "bytes=150-200", "bytes=-0"])
+def test_ranges_past_eof_are_unsatisfiable(value):
+    assert _parse_range(value, 100) is False
+
+
+def test_any_range_on_an_empty_file_is_unsatisfiable():
+    assert _parse_range("bytes=-10", 0) is False
+    assert _parse_range("bytes=0-", 0) is False
+
+
+@pytest.mark.parametrize("value", [None, "", "items=0-5", "bytes=0-5,10-20", "bytes=a-b", "bytes=5-2"])
+def test_ignored_ranges(value):
+    assert _parse_range(value, 100) is None
+
+
+ETAG = '"abc-64"'
+MTIME = 1_700_000_000
+
+
+def test_if_none_match():
+    assert _not_modified({"if-none-match": ETAG}, ETAG, MTIME)
+    assert _not_modified({"if-none-match": f'"other", W/{ETAG}'}, ETAG, MTIME)
+    assert _not_modified({"if-none-match": "*"}, ETAG, MTIME)
+    assert not _not_modified({"if-none-match": '"other"'}, ETAG, MTIME)
+
+
+def test_if_none_match_wins_over_if_modified_since():
+    headers = {"if-none-match": '"other"', "if-modified-since": formatdate(MTIME + 60, usegmt=True)}
+    assert not _not_modified(headers, ETAG, MTIME)
+
+
+def test_if_modified_since():
+    assert _not_modified({"if-modified-since": formatdate(MTIME, usegmt=True)}, ETAG, MTIME + 0.5)
+    assert not _not_modified({"if-modified-since": formatdate(MTIME - 60, usegmt=True)}, ETAG, MTIME)
+    assert not _not_modified({"if-modified-since": "not a date"}, ETAG, MTIME)
+
+
+def test_no_conditionals():
+    assert not _not_modified({}, ETAG, MTIME)
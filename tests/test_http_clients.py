@@ -0,0 +1,35 @@
+import asyncio
+import warnings
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from helpers.http_clients import with_cookies, _no_store_cookies
+from helpers.scheduler import fetch
+
+
+def test_with_cookies_builds_a_cookie_header():
+    headers = with_cookies({"a": "1", "b": "2"}, {"Referer": "x"})
+    assert headers == {"Referer": "x", "Cookie": "a=1; b=2"}
+    assert with_cookies(None) == {}
+
+
+def test_fetch_sends_cookies_as_a_header_without_storing_responses():
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers.get("cookie"))
+        return httpx.Response(200, headers={"set-cookie": "leak=1; Path=/"})
+
+    async def main():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(handler), cookies=_no_store_cookies())
+        async with client:
+            await fetch("animepahe", "GET", "https://animepahe.si/api", client=client, cookies={"ddg": "ok"})
+            await fetch("animepahe", "GET", "https://animepahe.si/api", client=client)
+            return len(client.cookies.jar)
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", DeprecationWarning)
+        stored = asyncio.run(main())
+    assert seen == ["ddg=ok", None]
+    assert stored == 0
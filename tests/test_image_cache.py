@@ -0,0 +1,95 @@
+import asyncio
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from helpers import image_cache as image_cache_module
+from helpers.image_cache import ImageCache, allowed_image_url
+
+
+@pytest.mark.parametrize("url", [
+    "https://animepahe.si/poster.jpg",
+    "https://i.animepahe.si/posters/abc.jpg",
+])
+def test_allowed_hosts(url):
+    assert allowed_image_url(url)
+
+
+@pytest.mark.parametrize("url", [
+    "https://evil.example/animepahe.si.jpg",
+    "https://animepahe.si.evil.example/x.jpg",
+    "https://evil.example/?u=https://animepahe.si/x.jpg",
+    "file:///etc/animepahe.si",
+    "not a url",
+])
+def test_rejected_hosts(url):
+    assert not allowed_image_url(url)
+
+
+def _cache(monkeypatch, tmp_path, body, headers=None):
+    def handler(request):
+        return httpx.Response(200, content=body, headers={"content-type": "image/png", **(headers or {})})
+
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    async def no_cookies():
+        return {}
+
+    monkeypatch.setenv("IMAGE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(image_cache_module, "get_client", lambda name: client)
+    monkeypatch.setattr(image_cache_module, "get_animepahe_cookies", no_cookies)
+    return ImageCache()
+
+
+async def _read(fetch):
+    await fetch.ready.wait()
+    return fetch.status, fetch.etag, b"".join([chunk async for chunk in fetch.stream()])
+
+
+def test_miss_has_the_same_etag_as_the_later_hit(monkeypatch, tmp_path):
+    cache = _cache(monkeypatch, tmp_path, b"png" * 100)
+    url = "https://i.animepahe.si/a.png"
+
+    async def main():
+        status, etag, body = await _read(cache.fetch(url))
+        await asyncio.sleep(0.05)
+        return status, etag, body, await cache.get(url)
+
+    status, etag, body, hit = asyncio.run(main())
+    assert status == 200 and etag
+    assert body == b"png" * 100
+    assert hit["etag"] == etag and hit["body"] == body
+
+
+def test_oversized_images_are_refused(monkeypatch, tmp_path):
+    monkeypatch.setenv("IMAGE_MAX_BYTES", "10")
+    cache = _cache(monkeypatch, tmp_path, b"x" * 100)
+    url = "https://i.animepahe.si/big.png"
+
+    async def main():
+        fetch = cache.fetch(url)
+        await fetch.ready.wait()
+        await asyncio.sleep(0.05)
+        return fetch.status, await cache.get(url)
+
+    status, hit = asyncio.run(main())
+    assert status == 413
+    assert hit is None
+
+
+def test_oversized_body_without_length_is_not_cached(monkeypatch, tmp_path):
+    monkeypatch.setenv("IMAGE_MAX_BYTES", "10")
+
+    async def body():
+        yield b"x" * 100
+
+    cache = _cache(monkeypatch, tmp_path, body())
+    url = "https://i.animepahe.si/chunked.png"
+
+    async def main():
+        fetch = cache.fetch(url)
+        with pytest.raises(Exception):
+            await _read(fetch)
+        return await cache.get(url)
+
+    assert asyncio.run(main()) is None
@@ -0,0 +1,22 @@
+import importlib
+import pytest
+
+for dependency in ("fastapi", "aiosqlite", "httpx", "slowapi", "yt_dlp", "dotenv", "bs4", "playwright"):
+    pytest.importorskip(dependency)
+
+
+@pytest.mark.parametrize("module", [
+    "app",
+    "routers.anime",
+    "routers.tiktok",
+    "routers.file",
+    "helpers.bulk_jobs",
+])
+def test_module_imports(module):
+    """Catches broken cross-module imports (renamed helpers, moved constants)"""
+    importlib.import_module(module)
+
+
+def test_create_download_session_is_exported():
+    from helpers.anime_helper import create_download_session
+    assert callable(create_download_session)
@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+import pytest
+
+pytest.importorskip("aiosqlite")
+pytest.importorskip("httpx")
+
+from helpers import janitor
+from helpers.episode_cache import episode_cache
+
+HOUR = 3600
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(janitor.DOWNLOADS_DIR)
+    temp_root = tmp_path / "tmp"
+    temp_root.mkdir()
+    monkeypatch.setattr(janitor.tempfile, "gettempdir", lambda: str(temp_root))
+    monkeypatch.setenv("EPISODE_CACHE_DIR", str(tmp_path / "episode_cache"))
+    return tmp_path
+
+
+def _file(path, size, age):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "wb") as f:
+        f.write(b"x" * size)
+    stamp = time.time() - age
+    os.utime(path, (stamp, stamp))
+    return os.path.abspath(path)
+
+
+def _sweep(videos=None, zips=None, active_dirs=(), quota=10 ** 9):
+    config = {"quota": quota, "downloads_ttl": 24 * HOUR, "part_ttl": 24 * HOUR, "orphan_grace": HOUR}
+    return janitor.StorageJanitor()._sweep_sync(videos or {}, zips or {}, set(active_dirs), config)
+
+
+def test_expired_and_orphaned_downloads_are_removed(storage):
+    expired = _file("downloads/old.mp4", 10, 48 * HOUR)
+    fresh = _file("downloads/new.mp4", 10, 60)
+    orphan = _file("downloads/orphan.mp4", 10, 2 * HOUR)
+    running = _file("downloads/running.mp4.part", 10, 60)
+    missing = os.path.abspath("downloads/gone.mp4")
+
+    report = _sweep(videos={expired: "old", fresh: "new", missing: "gone"})
+
+    assert not os.path.exists(expired) and not os.path.exists(orphan)
+    assert os.path.exists(fresh) and os.path.exists(running)
+    assert (report["expired"], report["orphaned"]) == (1, 1)
+    assert sorted(report["videos_removed"]) == ["gone", "old"]
+    assert report["rows_removed"] == 1
+
+
+def test_quota_evicts_least_recently_used_first(storage):
+    oldest = _file("downloads/a.mp4", 100, 3 * HOUR)
+    middle = _file("downloads/b.mp4", 100, 2 * HOUR)
+    newest = _file("downloads/c.mp4", 100, HOUR)
+
+    report = _sweep(videos={oldest: "a", middle: "b", newest: "c"}, quota=150)
+
+    assert not os.path.exists(oldest) and not os.path.exists(middle)
+    assert os.path.exists(newest)
+    assert report["evicted"] == 2
+    assert report["total_bytes"] == 100
+
+
+def test_pinned_episodes_are_never_evicted(storage):
+    cache_dir = episode_cache.directory
+    pinned = _file(os.path.join(cache_dir, "pinned.mp4"), 100, 3 * HOUR)
+    idle = _file(os.path.join(cache_dir, "idle.mp4"), 100, HOUR)
+
+    async def main():
+        async with episode_cache.pin("pinned"):
+            return _sweep(quota=50)
+
+    report = asyncio.run(main())
+    assert os.path.exists(pinned)
+    assert not os.path.exists(idle)
+    assert report["evicted"] == 1
+
+
+def test_abandoned_partial_episodes_expire(storage):
+    cache_dir = episode_cache.directory
+    stale = _file(os.path.join(cache_dir, "k1.mp4.part"), 10, 48 * HOUR)
+    segments = _file(os.path.join(cache_dir, "k1.mp4.part.segments"), 10, 48 * HOUR)
+    recent = _file(os.path.join(cache_dir, "k2.mp4.part"), 10, HOUR)
+
+    _sweep()
+    assert not os.path.exists(stale) and not os.path.exists(segments)
+    assert os.path.exists(recent)
+
+
+def test_active_zip_dirs_are_left_alone(storage):
+    temp_root = janitor.tempfile.gettempdir()
+    active = os.path.join(temp_root, janitor.ZIP_TEMP_PREFIX + "active")
+    orphan = os.path.join(temp_root, janitor.ZIP_TEMP_PREFIX + "orphan")
+    _file(os.path.join(active, "Episode_1.mp4"), 10, 60)
+    _file(os.path.join(orphan, "Episode_1.mp4"), 10, 60)
+    for path in (active, orphan):
+        stamp = time.time() - 2 * HOUR
+        os.utime(path, (stamp, stamp))
+
+    report = _sweep(active_dirs=[os.path.abspath(active)])
+    assert os.path.exists(active)
+    assert not os.path.exists(orphan)
+    assert report["orphaned"] == 1
+
+
+def test_expired_zip_is_not_counted_as_a_dangling_row(storage):
+    temp_root = janitor.tempfile.gettempdir()
+    zip_dir = os.path.join(temp_root, janitor.ZIP_TEMP_PREFIX + "done")
+    zip_path = _file(os.path.join(zip_dir, "Show.zip"), 10, 60)
+    expired_at = janitor.datetime.fromtimestamp(time.time() - HOUR)
+
+    report = _sweep(zips={zip_path: ("session-1", expired_at)})
+    assert not os.path.exists(zip_dir)
+    assert report["zips_removed"] == ["session-1"]
+    assert report["rows_removed"] == 0
@@ -0,0 +1,80 @@
+import asyncio
+import pytest
+
+aiosqlite = pytest.importorskip("aiosqlite")
+
+from helpers.media_cache import canonical_url, info_key, lookup_media, media_key_sync, store_media
+
+
+@pytest.mark.parametrize("variant", [
+    "https://www.youtube.com/watch?v=dQw4w9WgXcQ",
+    "http://m.youtube.com/watch?v=dQw4w9WgXcQ&feature=share",
+    "youtube.com/watch?v=dQw4w9WgXcQ&utm_source=x#t=10",
+    "https://youtu.be/dQw4w9WgXcQ?si=abcdef",
+    "https://youtube.com/shorts/dQw4w9WgXcQ/",
+])
+def test_youtube_variants_share_a_canonical_url(variant):
+    assert canonical_url(variant) == "https://youtube.com/watch?v=dQw4w9WgXcQ"
+
+
+def test_meaningful_query_params_are_kept_and_sorted():
+    url = "https://example.com/video/?b=2&a=1&fbclid=zzz"
+    assert canonical_url(url) == "https://example.com/video?a=1&b=2"
+
+
+def test_tiktok_share_params_are_dropped():
+    url = "https://www.tiktok.com/@user/video/7234567890123456789?is_from_webapp=1&sender_device=pc"
+    assert canonical_url(url) == "https://tiktok.com/@user/video/7234567890123456789"
+
+
+def test_media_key_uses_the_extractor_id():
+    pytest.importorskip("yt_dlp")
+    keys = {
+        media_key_sync("https://youtu.be/dQw4w9WgXcQ?si=x"),
+        media_key_sync("https://www.youtube.com/watch?v=dQw4w9WgXcQ"),
+    }
+    assert keys == {"youtube:dQw4w9WgXcQ"}
+
+
+def test_media_key_falls_back_to_a_url_hash():
+    pytest.importorskip("yt_dlp")
+    first = media_key_sync("https://unknown.example/clip/1?utm_campaign=a")
+    assert first.startswith("url:")
+    assert first == media_key_sync("https://unknown.example/clip/1")
+    assert first != media_key_sync("https://unknown.example/clip/2")
+
+
+def test_info_key():
+    assert info_key({"extractor_key": "Youtube", "id": "abc"}) == "youtube:abc"
+    assert info_key({"extractor": "TikTok", "id": "1"}) == "tiktok:1"
+    assert info_key({"id": "abc"}) is None
+
+
+def test_store_and_lookup(tmp_path):
+    video = tmp_path / "clip.mp4"
+    video.write_bytes(b"data")
+
+    async def main():
+        async with aiosqlite.connect(str(tmp_path / "cache.db")) as db:
+            db.row_factory = aiosqlite.Row
+            await db.execute(
+                "CREATE TABLE videos (id INTEGER PRIMARY KEY, title TEXT, filepath TEXT, short_code TEXT UNIQUE)"
+            )
+            await db.execute(
+                "CREATE TABLE media_cache (cache_key TEXT PRIMARY KEY, short_code TEXT, info TEXT, expires_at REAL)"
+            )
+            await db.execute(
+                "INSERT INTO videos (title, filepath, short_code) VALUES ('clip', ?, 'abc123')", (str(video),)
+            )
+            info = {"short": "abc123", "video_info": {"title": "clip"}, "download_url": "/file/abc123"}
+            await store_media(db, ["youtube:x", "url:y", None], info)
+            hit = await lookup_media(db, "url:y")
+            video.unlink()
+            gone = await lookup_media(db, "youtube:x")
+            return hit, gone
+
+    hit, gone = asyncio.run(main())
+    assert hit["short"] == "abc123" and hit["path"] == str(video)
+    assert hit["video_info"] == {"title": "clip"}
+    # A missing file invalidates the entry instead of serving a dead link
+    assert gone is None
@@ -0,0 +1,103 @@
+import asyncio
+
+from helpers.progress import ProgressChannel, Subscriber, compact_frame
+
+
+def _drain(subscriber):
+    async def main():
+        messages = []
+        while subscriber._pending:
+            messages.append(await subscriber.get())
+        return messages
+    return asyncio.run(main())
+
+
+def _progress(episode, percent):
+    return {"status": "downloading", "episode": episode, "progress": percent}
+
+
+def test_progress_is_coalesced_per_episode():
+    subscriber = Subscriber(min_interval=0)
+    for percent in (10, 20, 30):
+        subscriber.offer(_progress(1, percent))
+    subscriber.offer(_progress(2, 5))
+    assert _drain(subscriber) == [_progress(1, 30), _progress(2, 5)]
+
+
+def test_events_are_never_dropped():
+    subscriber = Subscriber(min_interval=0)
+    subscriber.offer({"status": "retrying", "episode": 1, "attempt": 1})
+    subscriber.offer({"status": "retrying", "episode": 1, "attempt": 2})
+    assert [m["attempt"] for m in _drain(subscriber)] == [1, 2]
+
+
+def test_episode_outcome_drops_its_stale_progress():
+    subscriber = Subscriber(min_interval=0)
+    subscriber.offer(_progress(1, 90))
+    subscriber.offer(_progress(2, 40))
+    subscriber.offer({"status": "episode_complete", "episode": 1})
+    assert _drain(subscriber) == [_progress(2, 40), {"status": "episode_complete", "episode": 1}]
+
+
+def test_terminal_message_drops_all_pending_progress():
+    subscriber = Subscriber(min_interval=0)
+    subscriber.offer(_progress(1, 90))
+    subscriber.offer({"status": "zipping", "zip_progress": 50})
+    subscriber.offer({"status": "complete"})
+    assert _drain(subscriber) == [{"status": "complete"}]
+
+
+def test_throttled_progress_lets_events_through_first():
+    subscriber = Subscriber(min_interval=10)
+
+    async def main():
+        subscriber.offer(_progress(1, 10))
+        first = await subscriber.get()
+        # Progress is now throttled for 10s; the event must not wait behind it
+        subscriber.offer(_progress(1, 20))
+        subscriber.offer({"status": "episode_failed", "episode": 2})
+        return first, await asyncio.wait_for(subscriber.get(), 1)
+
+    first, second = asyncio.run(main())
+    assert first == _progress(1, 10)
+    assert second == {"status": "episode_failed", "episode": 2}
+
+
+def test_late_subscriber_gets_a_snapshot():
+    channel = ProgressChannel()
+    channel.publish({"status": "started", "total": 2})
+    channel.publish(_progress(2, 50))
+    channel.publish(_progress(1, 30))
+    channel.publish(_progress(1, 100))
+    channel.publish({"status": "zipping", "zip_progress": 10})
+    assert not channel.finished
+
+    subscriber = channel.subscribe()
+    assert _drain(subscriber) == [
+        {"status": "started", "total": 2},
+        _progress(1, 100),
+        _progress(2, 50),
+        {"status": "zipping", "zip_progress": 10},
+    ]
+
+    channel.publish({"status": "complete"})
+    assert channel.finished
+    assert _drain(subscriber) == [{"status": "complete"}]
+
+
+def test_unsubscribed_observers_stop_receiving():
+    channel = ProgressChannel()
+    subscriber = channel.subscribe()
+    channel.unsubscribe(subscriber)
+    channel.publish(_progress(1, 10))
+    assert not subscriber._pending
+
+
+def test_compact_frame():
+    frame = compact_frame({
+        "status": "downloading", "episode": 3, "current": 1, "total": 4, "progress": 42,
+        "downloaded_mb": 1.5, "total_mb": 3.0, "speed_mbps": 0.7, "message": "..."
+    })
+    assert frame == {"t": "p", "ep": 3, "i": 1, "n": 4, "p": 42, "mb": 1.5, "tmb": 3.0, "sp": 0.7}
+    assert compact_frame({"status": "zipping", "zip_progress": 9}) == {"t": "z", "p": 9}
+    assert compact_frame({"status": "complete"}) == {"status": "complete"}
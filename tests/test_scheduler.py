@@ -0,0 +1,79 @@
+import asyncio
+import time
+import pytest
+
+pytest.importorskip("httpx")
+
+from helpers.scheduler import HostScheduler
+
+
+def _scheduler(**overrides):
+    options = dict(concurrency=2, rate=4.0, min_rate=0.5, max_rate=6.0, increase=1.0, decrease=0.5)
+    options.update(overrides)
+    return HostScheduler("test", **options)
+
+
+def test_success_increases_rate_up_to_the_cap():
+    scheduler = _scheduler()
+    scheduler.record_response(200)
+    assert scheduler.rate == 5.0
+    for _ in range(5):
+        scheduler.record_response(200)
+    assert scheduler.rate == 6.0
+
+
+def test_throttle_halves_the_rate_once_per_window():
+    scheduler = _scheduler()
+    scheduler.record_response(429)
+    assert scheduler.rate == 2.0
+    # Failures from requests already in flight don't compound
+    scheduler.record_response(503)
+    scheduler.record_response(500)
+    assert scheduler.rate == 2.0
+    assert scheduler.stats["throttled"] == 3
+
+
+def test_rate_never_drops_below_the_floor():
+    scheduler = _scheduler(rate=0.6)
+    scheduler.record_throttle()
+    assert scheduler.rate == 0.5
+
+
+def test_client_errors_are_not_throttles():
+    scheduler = _scheduler()
+    scheduler.record_response(404)
+    assert scheduler.rate == 5.0
+
+
+def test_token_bucket_paces_requests():
+    scheduler = _scheduler(concurrency=10, rate=10.0)
+
+    async def main():
+        start = time.monotonic()
+        for _ in range(4):
+            async with scheduler.slot():
+                pass
+        return time.monotonic() - start
+
+    # One token is available up front, the other three arrive at 10/s
+    elapsed = asyncio.run(main())
+    assert 0.25 <= elapsed < 0.6
+
+
+def test_slot_limits_concurrency():
+    scheduler = _scheduler(concurrency=2, rate=1000.0)
+    running = []
+    peak = []
+
+    async def request():
+        async with scheduler.slot():
+            running.append(1)
+            peak.append(len(running))
+            await asyncio.sleep(0.01)
+            running.pop()
+
+    async def main():
+        await asyncio.gather(*[request() for _ in range(6)])
+
+    asyncio.run(main())
+    assert max(peak) == 2
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import pytest
+
+httpx = pytest.importorskip("httpx")
+
+from helpers.segmented_download import _load_state, _plan_segments, segmented_download
+
+
+def test_plan_segments_covers_every_byte_once():
+    plan = _plan_segments(10, 3)
+    assert plan == [[0, 3, 0], [4, 7, 0], [8, 9, 0]]
+
+
+def test_plan_segments_small_file():
+    assert _plan_segments(2, 4) == [[0, 0, 0], [1, 1, 0]]
+
+
+def _cdn(body, fail_first=()):
+    """Range-capable mock CDN; fail_first maps a range start to the exception raised once"""
+    failures = dict(fail_first)
+
+    def handler(request):
+        start, end = request.headers["range"][6:].split("-")
+        start, end = int(start), int(end)
+        if start in failures:
+            raise failures.pop(start)(request=request, message="boom")
+        return httpx.Response(206, content=body[start:end + 1], headers={
+            "content-range": f"bytes {start}-{end}/{len(body)}"
+        })
+    return httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+
+def _run(client, path, size, **kwargs):
+    async def main():
+        async with client:
+            return await segmented_download(client, "https://cdn.test/video.mp4", str(path), size, **kwargs)
+    return asyncio.run(main())
+
+
+def test_segments_are_written_at_their_offsets(tmp_path):
+    body = bytes(range(256)) * 40
+    path = tmp_path / "episode.mp4.part"
+    assert _run(_cdn(body), path, len(body), segments=4)
+    assert path.read_bytes() == body
+    assert not (tmp_path / "episode.mp4.part.segments").exists()
+
+
+def test_transport_errors_are_retried(tmp_path):
+    body = b"x" * 1000
+    path = tmp_path / "episode.mp4.part"
+    client = _cdn(body, fail_first={500: httpx.ConnectTimeout})
+    assert _run(client, path, len(body), segments=2)
+    assert path.read_bytes() == body
+
+
+def test_exhausted_retries_return_false(tmp_path):
+    body = b"x" * 1000
+    path = tmp_path / "episode.mp4.part"
+    client = _cdn(body, fail_first={500: httpx.PoolTimeout})
+    assert _run(client, path, len(body), segments=2, max_retries=1) is False
+    # The finished segment is kept for the next attempt
+    assert (tmp_path / "episode.mp4.part.segments").exists()
+
+
+def test_resume_only_fetches_what_is_missing(tmp_path):
+    body = bytes(range(256)) * 4
+    size = len(body)
+    path = tmp_path / "episode.mp4.part"
+    # First segment finished, second got 100 bytes in before the interruption
+    partial = bytearray(size)
+    partial[:612] = body[:612]
+    path.write_bytes(bytes(partial))
+    state = tmp_path / "episode.mp4.part.segments"
+    state.write_text(json.dumps({"size": size, "segments": [[0, 511, 512], [512, 1023, 100]]}))
+
+    requested = []
+
+    def handler(request):
+        requested.append(request.headers["range"])
+        start, end = (int(n) for n in request.headers["range"][6:].split("-"))
+        return httpx.Response(206, content=body[start:end + 1], headers={
+            "content-range": f"bytes {start}-{end}/{size}"
+        })
+
+    assert _run(httpx.AsyncClient(transport=httpx.MockTransport(handler)), path, size, segments=2)
+    assert requested == ["bytes=612-1023"]
+    assert path.read_bytes() == body
+
+
+def test_state_for_a_different_size_is_ignored(tmp_path):
+    state = tmp_path / "x.segments"
+    state.write_text(json.dumps({"size": 10, "segments": [[0, 9, 10]]}))
+    assert _load_state(str(state), 20, 2) == [[0, 9, 0], [10, 19, 0]]
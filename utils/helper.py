@@ -1,4 +1,5 @@
 import asyncio
+import os
 import re
 import urllib.parse
 from urllib.parse import quote
@@ -17,6 +18,30 @@ def check_platform_sync(url: str):
     return None
 
 
+def env_int(name: str, default: int) -> int:
+    """Read an integer setting from the environment, falling back to default."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name: str, default: float) -> float:
+    """Read a float setting from the environment, falling back to default."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_bool(name: str, default: bool) -> bool:
+    """Read a boolean setting (1/true/yes/on) from the environment."""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
 async def check_platform(url: str):
     return await asyncio.to_thread(check_platform_sync, url)
 